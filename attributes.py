@@ -26,11 +26,12 @@
 import mpf.floats
 import validation_mpfr
 import validation_host
+import validation_numpy
 
 
 class FP_Attributes:
     def __init__(self, arity, function,
-                 mpfr_fn=None, host_fn=None,
+                 mpfr_fn=None, host_fn=None, numpy_fn=None,
                  rounding=True, returns="float"):
         assert isinstance(arity, int)
         assert arity >= 1
@@ -38,12 +39,15 @@ class FP_Attributes:
         assert isinstance(rounding, bool)
         assert returns in ("bool", "float")
 
-        self.arity         = arity
-        self.function      = function
-        self.mpfr_function = mpfr_fn
-        self.host_function = host_fn
-        self.rounding      = rounding
-        self.returns       = returns
+        self.arity          = arity
+        self.function       = function
+        self.mpfr_function  = mpfr_fn
+        self.host_function  = host_fn
+        self.numpy_function = numpy_fn
+        # Unlike the others, this works on a list of argument lists
+        # and returns a list of results
+        self.rounding       = rounding
+        self.returns        = returns
 
 
 op_attr = {
@@ -101,36 +105,49 @@ op_attr = {
                               validation_host.host_max,
                               rounding=False),
     "fp.leq"  : FP_Attributes(2, lambda x, y: x <= y,
+                              numpy_fn=validation_numpy.numpy_leq,
                               rounding=False,
                               returns="bool"),
     "fp.lt"  : FP_Attributes(2, lambda x, y: x < y,
+                             numpy_fn=validation_numpy.numpy_lt,
                              rounding=False,
                              returns="bool"),
     "fp.geq"  : FP_Attributes(2, lambda x, y: x >= y,
+                              numpy_fn=validation_numpy.numpy_geq,
                               rounding=False,
                               returns="bool"),
     "fp.gt"  : FP_Attributes(2, lambda x, y: x > y,
+                             numpy_fn=validation_numpy.numpy_gt,
                              rounding=False,
                              returns="bool"),
     "fp.eq"  : FP_Attributes(2, lambda x, y: x == y,
+                             numpy_fn=validation_numpy.numpy_eq,
                              rounding=False,
                              returns="bool"),
     "smtlib.eq"  : FP_Attributes(2, mpf.floats.smtlib_eq,
+                                 numpy_fn=validation_numpy.numpy_smtlib_eq,
                                  rounding=False,
                                  returns="bool"),
     "fp.isNormal"  : FP_Attributes(1, lambda x: x.isNormal(),
+                                   numpy_fn=validation_numpy.numpy_isNormal,
                                    rounding=False,
                                    returns="bool"),
-    "fp.isSubnormal"  : FP_Attributes(1, lambda x: x.isSubnormal(),
-                                      rounding=False,
-                                      returns="bool"),
+    "fp.isSubnormal"  : FP_Attributes(
+        1, lambda x: x.isSubnormal(),
+        numpy_fn=validation_numpy.numpy_isSubnormal,
+        rounding=False,
+        returns="bool"),
     "fp.isZero"  : FP_Attributes(1, lambda x: x.isZero(),
+                                 numpy_fn=validation_numpy.numpy_isZero,
                                  rounding=False,
                                  returns="bool"),
-    "fp.isInfinite"  : FP_Attributes(1, lambda x: x.isInfinite(),
-                                     rounding=False,
-                                     returns="bool"),
+    "fp.isInfinite"  : FP_Attributes(
+        1, lambda x: x.isInfinite(),
+        numpy_fn=validation_numpy.numpy_isInfinite,
+        rounding=False,
+        returns="bool"),
     "fp.isNaN"  : FP_Attributes(1, lambda x: x.isNaN(),
+                                numpy_fn=validation_numpy.numpy_isNaN,
                                 rounding=False,
                                 returns="bool"),
 }
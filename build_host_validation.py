@@ -23,10 +23,27 @@
 ##                                                                          ##
 ##############################################################################
 
+import concurrent.futures
+import hashlib
+import json
 import os
+import subprocess
+import sys
 
 import attributes
 
+CC = "gcc"
+CFLAGS = ["-std=c99", "-frounding-math", "-fsignaling-nans",
+          "-ffp-contract=off", "-mfma", "-mno-fma4",
+          "-Wall", "-W", "-Werror", "-O2"]
+SSE_FLAGS = ["-msse2", "-mfpmath=sse"]
+LIBS = ["-lm", "-lquadmath"]
+
+MANIFEST = "manifest.json"
+# Written after a successful build, and read by validation_host to
+# find the validators and library without looking at the filesystem
+# for each test.
+
 simple_op = {
     "fp.add" : "%s + %s",
     "fp.sub" : "%s - %s",
@@ -63,87 +80,283 @@ special_op = {
 }
 
 
-def build_validator(precision, fp_op):
+c_types = {32: "float",
+           64: "double",
+           80: "long double",
+           128: "__float128"}
+
+rti_op = {32: ("roundf(%s)", "nearbyintf(%s)"),
+          64: ("round(%s)", "nearbyint(%s)"),
+          80: ("roundl(%s)", "nearbyintl(%s)"),
+          128: ("roundq(%s)", "nearbyintq(%s)")}
+# roundToIntegral needs a different function for RNA (first) and the
+# other rounding modes (second).
+
+OP_PRECISIONS = (32, 64, 80)
+# Precisions for which we build the operations above
+
+CONVERSION_PRECISIONS = (32, 64, 80, 128)
+# Precisions we build conversions between. These are plain C casts,
+# so __float128 (software emulated by libgcc, which respects the
+# rounding mode) is fine here.
+
+
+def conversion_op(target):
+    return "to_fp.float%u" % target
+
+
+def get_c_op(precision, fp_op):
+    assert precision in c_types
+    assert fp_op in simple_op or fp_op in special_op
+
+    if fp_op in simple_op:
+        return simple_op[fp_op]
+    else:
+        return special_op[fp_op][c_types[precision]]
+
+
+def kernel_name(precision, fp_op):
+    return "fptg_%s_float%u" % (fp_op.replace(".", "_"), precision)
+
+
+def build_kernel(fd, precision, fp_op):
+    # Writes a function for the shared library that applies fp_op to
+    # n packed inputs (each arity * width bytes) and writes n packed
+    # results. It returns 0 if the rounding mode is not supported,
+    # and leaves the rounding mode of the caller alone.
     assert precision in (32, 64, 80, 128)
     assert fp_op in attributes.op_attr
 
     attr = attributes.op_attr[fp_op]
     prec = "float%u" % precision
-    c_prec = {32: "float",
-              64: "double",
-              80: "long double",
-              128: "__float128"}[precision]
-    name = "%s.%s.val" % (fp_op, prec)
+    c_prec = c_types[precision]
 
-    if fp_op in simple_op:
-        c_op = simple_op[fp_op]
-    elif fp_op in special_op:
-        c_op = special_op[fp_op][c_prec]
-    elif fp_op == "fp.roundToIntegral":
-        if precision == 32:
-            c_rti_rna = "roundf"
-            c_rti     = "nearbyintf"
-        elif precision == 64:
-            c_rti_rna = "round"
-            c_rti     = "nearbyint"
-        elif precision == 80:
-            c_rti_rna = "roundl"
-            c_rti     = "nearbyintl"
-        else:
-            c_rti_rna = "roundq"
-            c_rti     = "nearbyintq"
+    if fp_op == "fp.roundToIntegral":
+        c_rti_rna, c_rti = rti_op[precision]
     else:
-        assert False
-
-    fd = open(os.path.join("host_validation", "%s.c" % name), "w")
+        c_op = get_c_op(precision, fp_op)
+    args = tuple("load_%s(in + (i * %u + %u) * WIDTH_%s)" %
+                 (prec, attr.arity, j, prec.upper())
+                 for j in range(attr.arity))
 
-    if precision < 128:
-        fd.write("#include <math.h>\n")
+    fd.write("\n")
+    fd.write("int %s(int rm, const uint8_t *in, uint8_t *out, size_t n)\n" %
+             kernel_name(precision, fp_op))
+    fd.write("{\n")
+    if attr.rounding:
+        fd.write("  int old_rm = fegetround();\n")
     else:
-        fd.write("#include <quadmath.h>\n")
-    fd.write("#include \"vlib.h\"\n")
-
-    fd.write("int main() {\n")
+        fd.write("  (void) rm;\n")
+    fd.write("  %s result;\n" % c_prec)
 
     if fp_op == "fp.roundToIntegral":
-        fd.write("  enum rounding_mode rm = parse_rm();\n")
-        for i in range(attr.arity):
-            fd.write("  %s input_%u = parse_%s();\n" % (c_prec, i, prec))
-        fd.write("  %s result;\n" % c_prec)
         fd.write("  if (rm == RNA) {\n")
-        fd.write("    result = %s(input_0);\n" % c_rti_rna)
-        fd.write("  } else {\n")
-        fd.write("    set_rm(rm);\n")
-        fd.write("    result = %s(input_0);\n" % c_rti)
+        fd.write("    for (size_t i = 0; i < n; ++i) {\n")
+        fd.write("      result = %s;\n" % (c_rti_rna % args))
+        fd.write("      store_%s(out + i * WIDTH_%s, result);\n" %
+                 (prec, prec.upper()))
+        fd.write("    }\n")
+        fd.write("    return 1;\n")
         fd.write("  }\n")
-    else:
-        if attr.rounding:
-            fd.write("  enum rounding_mode rm = parse_rm();\n")
-            fd.write("  set_rm(rm);\n")
-        for i in range(attr.arity):
-            fd.write("  %s input_%u = parse_%s();\n" % (c_prec, i, prec))
-        fd.write("  %s result = %s;\n" % (
-            c_prec,
-            c_op % tuple("input_%u" % i for i in range(attr.arity))))
-
-    fd.write("  print_%s(result);\n" % prec)
-    fd.write("  return 0;\n")
+        c_op = c_rti
+
+    if attr.rounding:
+        fd.write("  if (!set_rm(rm)) {\n")
+        fd.write("    return 0;\n")
+        fd.write("  }\n")
+    fd.write("  for (size_t i = 0; i < n; ++i) {\n")
+    fd.write("    result = %s;\n" % (c_op % args))
+    fd.write("    store_%s(out + i * WIDTH_%s, result);\n" %
+             (prec, prec.upper()))
+    fd.write("  }\n")
+    if attr.rounding:
+        fd.write("  fesetround(old_rm);\n")
+    fd.write("  return 1;\n")
     fd.write("}\n")
-    fd.close()
 
-    return name
+
+def build_conversion_kernel(fd, source, target):
+    # Same as above, for the conversion (a cast) from precision source
+    # to precision target. Inputs are packed in the source format, and
+    # results in the target format.
+    assert source in CONVERSION_PRECISIONS
+    assert target in CONVERSION_PRECISIONS
+
+    src = "float%u" % source
+    dst = "float%u" % target
+
+    fd.write("\n")
+    fd.write("int %s(int rm, const uint8_t *in, uint8_t *out, size_t n)\n" %
+             kernel_name(source, conversion_op(target)))
+    fd.write("{\n")
+    fd.write("  int old_rm = fegetround();\n")
+    fd.write("  %s result;\n" % c_types[target])
+    fd.write("  if (!set_rm(rm)) {\n")
+    fd.write("    return 0;\n")
+    fd.write("  }\n")
+    fd.write("  for (size_t i = 0; i < n; ++i) {\n")
+    fd.write("    result = (%s) load_%s(in + i * WIDTH_%s);\n" %
+             (c_types[target], src, src.upper()))
+    fd.write("    store_%s(out + i * WIDTH_%s, result);\n" %
+             (dst, dst.upper()))
+    fd.write("  }\n")
+    fd.write("  fesetround(old_rm);\n")
+    fd.write("  return 1;\n")
+    fd.write("}\n")
+
+
+def ops_for(precision, ops):
+    # The subset of ops we have a kernel for in the given precision
+    rv = []
+    for op in ops:
+        if op in attributes.op_attr:
+            if precision in OP_PRECISIONS:
+                rv.append(op)
+        elif precision in CONVERSION_PRECISIONS:
+            rv.append(op)
+    return rv
+
+
+def write_kernels(precision, ops):
+    filename = "kernels.float%u.c" % precision
+    with open(os.path.join("host_validation", filename), "w") as fd:
+        fd.write("#include <stddef.h>\n")
+        fd.write("#include <stdint.h>\n")
+        fd.write("#include <fenv.h>\n")
+        if precision < 128:
+            fd.write("#include <math.h>\n")
+        else:
+            fd.write("#include <quadmath.h>\n")
+        fd.write("#include \"vlib.h\"\n")
+        for op in ops_for(precision, ops):
+            if op in attributes.op_attr:
+                build_kernel(fd, precision, op)
+            else:
+                target = int(op[len("to_fp.float"):])
+                build_conversion_kernel(fd, precision, target)
+
+    return filename
+
+
+def write_validator(precision, ops):
+    # The validator answers requests (see serve in vlib.c) until stdin
+    # is closed, so that a single process can be re-used for many
+    # tests. Each request starts with the op code (the index into
+    # ops) and the rounding mode, followed by space for three packed
+    # operands. This just forwards each request to the kernel of the
+    # shared library. Answers are always large enough for the widest
+    # format, as conversions produce a result in a different precision.
+    prec = "float%u" % precision
+    filename = "validator.%s.c" % prec
+
+    with open(os.path.join("host_validation", filename), "w") as fd:
+        fd.write("#include <stddef.h>\n")
+        fd.write("#include <stdint.h>\n")
+        fd.write("#include \"vlib.h\"\n")
+        fd.write("\n")
+        available = ops_for(precision, ops)
+        for op in available:
+            fd.write("int %s(int rm, const uint8_t *in, uint8_t *out, "
+                     "size_t n);\n" % kernel_name(precision, op))
+        fd.write("\n")
+        fd.write("static int (*kernels[])(int, const uint8_t *, "
+                 "uint8_t *, size_t) = {\n")
+        for op in ops:
+            if op in available:
+                fd.write("  %s,\n" % kernel_name(precision, op))
+            else:
+                fd.write("  NULL,\n")
+        fd.write("};\n")
+        fd.write("\n")
+        fd.write("static void handle(const uint8_t *request, "
+                 "uint8_t *answer)\n")
+        fd.write("{\n")
+        fd.write("  if (request[0] < %u && kernels[request[0]]) {\n" %
+                 len(ops))
+        fd.write("    answer[0] = kernels[request[0]](request[1], "
+                 "request + 2, answer + 1, 1);\n")
+        fd.write("  }\n")
+        fd.write("}\n")
+        fd.write("\n")
+        fd.write("int main() {\n")
+        fd.write("  return serve(2 + 3 * WIDTH_%s, 1 + WIDTH_FLOAT128, "
+                 "handle);\n" % prec.upper())
+        fd.write("}\n")
+
+    return filename
+
+
+def get_compiler_version():
+    return subprocess.run([CC, "--version"],
+                          stdout=subprocess.PIPE,
+                          check=True,
+                          encoding="utf-8").stdout
+
+
+def target_hash(sources, flags, compiler_version):
+    m = hashlib.sha256()
+    m.update(compiler_version.encode("utf-8"))
+    m.update(" ".join(flags).encode("utf-8"))
+    for src in sources:
+        with open(os.path.join("host_validation", src), "rb") as fd:
+            m.update(src.encode("utf-8"))
+            m.update(fd.read())
+    return m.hexdigest()
+
+
+def compile_target(output, sources, flags):
+    cmd = [CC] + flags + sources + ["-o", output] + LIBS
+    print(" ".join(cmd))
+    rv = subprocess.run(cmd, cwd="host_validation")
+    return rv.returncode == 0
 
 
 def main():
-    names = set()
-    for prec in (32, 64, 80):
-        for op in simple_op:
-            names.add(build_validator(prec, op))
-        for op in special_op:
-            names.add(build_validator(prec, op))
-        names.add(build_validator(prec, "fp.roundToIntegral"))
-
-    os.system("make -j8 -C host_validation %s" % " ".join(names))
+    precisions = sorted(set(OP_PRECISIONS) | set(CONVERSION_PRECISIONS))
+    ops = (sorted(list(simple_op) + list(special_op) +
+                  ["fp.roundToIntegral"]) +
+           [conversion_op(target) for target in CONVERSION_PRECISIONS])
+
+    # Build a list of targets: (name, output template, sources, flags)
+    targets = []
+    kernel_sources = []
+    for prec in precisions:
+        kernels = write_kernels(prec, ops)
+        kernel_sources.append(kernels)
+        targets.append(("validator.float%u" % prec,
+                        "fptg_host.float%u.%%s.val" % prec,
+                        ["vlib.c", kernels, write_validator(prec, ops)],
+                        CFLAGS + SSE_FLAGS))
+    targets.append(("library",
+                    "libfptg_host.%s.so",
+                    ["vlib.c"] + kernel_sources,
+                    CFLAGS + SSE_FLAGS + ["-fPIC", "-shared"]))
+
+    # Work out what needs building. Outputs are named after the hash
+    # of everything that goes into them, so we never build the same
+    # thing twice.
+    compiler_version = get_compiler_version()
+    todo = []
+    manifest = {"op_codes" : {op: code for code, op in enumerate(ops)},
+                "targets"  : {}}
+    for name, output, sources, flags in targets:
+        digest = target_hash(sources + ["vlib.h"], flags, compiler_version)
+        output = output % digest[:16]
+        manifest["targets"][name] = output
+        if not os.path.isfile(os.path.join("host_validation", output)):
+            todo.append((output, sources, flags))
+
+    jobs = len(os.sched_getaffinity(0))
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        ok = all(executor.map(lambda t: compile_target(*t), todo))
+
+    if ok:
+        with open(os.path.join("host_validation", MANIFEST), "w") as fd:
+            json.dump(manifest, fd, indent=2, sort_keys=True)
+            fd.write("\n")
+    else:
+        print("Building host validation failed")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
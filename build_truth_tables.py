@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                          FP_TEST_GENERATOR                               ##
+##                                                                          ##
+##              Copyright (C) 2020, Florian Schanda                         ##
+##                                                                          ##
+##  This file is part of FP_Test_Generator.                                 ##
+##                                                                          ##
+##  FP_Test_Generator is free software: you can redistribute it and/or      ##
+##  modify it under the terms of the GNU General Public License as          ##
+##  published by the Free Software Foundation, either version 3 of the      ##
+##  License, or (at your option) any later version.                         ##
+##                                                                          ##
+##  FP_Test_Generator is distributed in the hope that it will be useful,    ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with FP_Test_Generator. If not, see                               ##
+##  <http://www.gnu.org/licenses/>.                                         ##
+##                                                                          ##
+##############################################################################
+
+
+import argparse
+import json
+import os
+import sys
+
+import attributes
+import executor
+import oracle_cache
+import truth_tables
+
+
+class Table_WP:
+    def __init__(self, fp_op, eb, sb, rm):
+        self.fp_op = fp_op
+        self.eb    = eb
+        self.sb    = sb
+        self.rm    = rm
+
+    def __str__(self):
+        return truth_tables.table_name(self.fp_op, self.eb, self.sb,
+                                       self.rm)
+
+
+def build_table(wp):
+    name = truth_tables.table_name(wp.fp_op, wp.eb, wp.sb, wp.rm)
+    table = truth_tables.compute_table(wp.fp_op, wp.eb, wp.sb, wp.rm)
+
+    # Write to a temporary file first, so that we never leave a
+    # partial table behind
+    tmp = os.path.join(truth_tables.TABLE_DIR, name + ".tmp")
+    with open(tmp, "wb") as fd:
+        truth_tables.numpy.save(fd, table)
+    os.replace(tmp, os.path.join(truth_tables.TABLE_DIR, name))
+    return name
+
+
+def build_wp(max_bits):
+    for fp_op in sorted(attributes.op_attr):
+        for eb in range(3, max_bits):
+            for sb in range(3, max_bits - eb + 1):
+                if truth_tables.table_size(fp_op, eb, sb) > \
+                   truth_tables.MAX_ENTRIES:
+                    continue
+                for rm in truth_tables.rounding_modes(fp_op):
+                    yield Table_WP(fp_op, eb, sb, rm)
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Precompute PyMPF results for tiny formats")
+    ap.add_argument("--max-bits",
+                    type=int,
+                    default=8,
+                    help=("build tables for formats with at most this"
+                          " many bits (default: 8)"))
+    ap.add_argument("--jobs",
+                    type=int,
+                    default=None,
+                    help="number of worker processes (default: one per core)")
+    options = ap.parse_args()
+
+    if truth_tables.numpy is None:
+        print("This tool requires the python package numpy to be installed.")
+        sys.exit(1)
+
+    os.makedirs(truth_tables.TABLE_DIR, exist_ok=True)
+    pool = executor.Executor(jobs=options.jobs)
+    names = sorted(pool.run(build_table, build_wp(options.max_bits)))
+    pool.close()
+
+    if pool.failures:
+        print("%u table(s) failed:" % len(pool.failures))
+        for failure in pool.failures:
+            print("  %s" % failure.wp)
+        sys.exit(1)
+
+    with open(truth_tables.MANIFEST, "w") as fd:
+        json.dump({"pympf"  : oracle_cache.get_pympf_version(),
+                   "format" : truth_tables.FORMAT_VERSION,
+                   "tables" : names},
+                  fd, indent=2, sort_keys=True)
+        fd.write("\n")
+    print("Built %u tables" % len(names))
+
+
+if __name__ == "__main__":
+    main()
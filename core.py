@@ -25,30 +25,126 @@
 
 import hashlib
 
-from rng import RNG
+import rng
+
+from rng import RNG, Counter_RNG
+
+
+rng_stream = rng.DEFAULT_STREAM
+# Set by set_rng_stream, before any workers are started
+
+SEED_ENCODINGS = ("legacy", "v2")
+seed_encoding = "legacy"
+# Set by set_seed_encoding, before any workers are started.
+#
+# The legacy encoding hashes the values (in the order of their keys)
+# with nothing in between, so e.g. {a: "xy", b: "z"} and {a: "x", b:
+# "yz"} are the same seed. It is the default so that published suites
+# can be reproduced. Version 2 hashes each key and value with its
+# length, in the order they are set.
+
+
+def set_rng_stream(stream):
+    global rng_stream
+    assert stream in rng.STREAMS
+    rng_stream = stream
+
+
+def set_seed_encoding(encoding):
+    global seed_encoding
+    assert encoding in SEED_ENCODINGS
+    seed_encoding = encoding
 
 
 class Seed:
     def __init__(self):
         self.keys = {}
+        self.stream = rng_stream
+        self.encoding = seed_encoding
+
+        self.hash = None
+        self.digest = None
+        # The hash of all keys so far, and its digest. We keep these
+        # up to date when we can (i.e. new keys that come last), and
+        # otherwise work them out again when needed.
+
+    def encode(self, key, value):
+        if self.encoding == "legacy":
+            return bytes(value, encoding="utf-8")
+        else:
+            key = bytes(key, encoding="utf-8")
+            value = bytes(value, encoding="utf-8")
+            return b"".join((len(key).to_bytes(4, "little"), key,
+                             len(value).to_bytes(4, "little"), value))
+
+    def new_hash(self):
+        m = hashlib.md5()
+        if self.encoding != "legacy":
+            m.update(b"fptg seed %s\0" % bytes(self.encoding,
+                                               encoding="utf-8"))
+        return m
+
+    def ordered_keys(self):
+        if self.encoding == "legacy":
+            return sorted(self.keys)
+        else:
+            return list(self.keys)
+
+    def extends(self, key):
+        # Test if setting key just appends to the hash
+        if key in self.keys:
+            return False
+        elif self.encoding == "legacy":
+            return all(key > other for other in self.keys)
+        else:
+            return True
 
     def set_key(self, key, value):
+        extends = self.extends(key)
+
         self.keys[key] = value
+        self.digest = None
+        if extends and self.hash is not None:
+            self.hash.update(self.encode(key, value))
+        else:
+            self.hash = None
+
+    def child(self, key, value):
+        """A copy of this seed, with one more key
+
+        This re-uses the hash of this seed if the new key comes last
+        (which it always does with the v2 encoding), so that many
+        children of one seed are cheap.
+        """
+        rv = Seed()
+        rv.keys = dict(self.keys)
+        rv.stream = self.stream
+        rv.encoding = self.encoding
+        if self.extends(key):
+            rv.hash = self.get_hash().copy()
+        rv.set_key(key, value)
+        return rv
+
+    def get_hash(self):
+        if self.hash is None:
+            self.hash = self.new_hash()
+            for key in self.ordered_keys():
+                self.hash.update(self.encode(key, self.keys[key]))
+        return self.hash
+
+    def get_digest(self):
+        if self.digest is None:
+            self.digest = self.get_hash().digest()
+        return self.digest
 
     def get_rng(self):
-        seed_vector = []
-        m = hashlib.md5()
-        for key in sorted(self.keys):
-            m.update(bytes(self.keys[key], encoding="utf-8"))
-        seed_vector.append(int(m.hexdigest(), 16))
-        rng = RNG(*seed_vector)
-        return rng
+        if self.stream == Counter_RNG.STREAM:
+            return Counter_RNG(self.get_digest())
+        else:
+            return RNG(int.from_bytes(self.get_digest(), "big"))
 
     def get_base_filename(self):
-        m = hashlib.md5()
-        for key in sorted(self.keys):
-            m.update(bytes(self.keys[key], encoding="utf-8"))
-        return m.hexdigest()
+        return self.get_digest().hex()
 
 
 class Vector:
@@ -78,5 +174,19 @@ def precision_name(eb, sb):
     return "fp_%u_%u" % (eb, sb)
 
 
+def parse_precision(name):
+    """Inverse of precision_name; raises ValueError for bad names"""
+    for eb in precision_names:
+        for sb in precision_names[eb]:
+            if precision_names[eb][sb] == name:
+                return (eb, sb)
+
+    if name.startswith("fp_"):
+        eb, sb = name[3:].split("_")
+        return (int(eb), int(sb))
+
+    raise ValueError("unknown precision %s" % name)
+
+
 class Work_Package:
     pass
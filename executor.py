@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                          FP_TEST_GENERATOR                               ##
+##                                                                          ##
+##              Copyright (C) 2020, Florian Schanda                         ##
+##                                                                          ##
+##  This file is part of FP_Test_Generator.                                 ##
+##                                                                          ##
+##  FP_Test_Generator is free software: you can redistribute it and/or      ##
+##  modify it under the terms of the GNU General Public License as          ##
+##  published by the Free Software Foundation, either version 3 of the      ##
+##  License, or (at your option) any later version.                         ##
+##                                                                          ##
+##  FP_Test_Generator is distributed in the hope that it will be useful,    ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with FP_Test_Generator. If not, see                               ##
+##  <http://www.gnu.org/licenses/>.                                         ##
+##                                                                          ##
+##############################################################################
+
+"""Fault-tolerant process pool
+
+Q: Why not multiprocessing.Pool?
+
+A: If a worker segfaults (e.g. in a C library) or hangs (e.g. waiting
+   on a wedged validator) then Pool.imap_unordered either hangs
+   forever or silently loses the task. For unattended runs that take
+   hours we'd rather kill the worker, try again a few times, and
+   otherwise write the task off and carry on.
+
+Q: Why not just give the pool all the work packages?
+
+A: Pool.imap_unordered drains the iterable of work packages into its
+   task queue as fast as it can, so for a large plan (e.g. fp.fma in
+   all precisions) millions of pickled work packages pile up in the
+   parent. We only take a work package from the iterable when a
+   worker has room for it, and each worker holds at most prefetch of
+   them (the one it's working on and the next few). So memory use
+   does not depend on how many tests we create.
+"""
+
+import os
+import time
+import collections
+import traceback
+import multiprocessing
+import multiprocessing.connection
+
+
+class Failure:
+    def __init__(self, wp, reason):
+        self.wp     = wp
+        self.reason = reason
+
+    def __str__(self):
+        return "%s: %s" % (self.wp, self.reason)
+
+
+def worker_main(conn):
+    while True:
+        task = conn.recv()
+        if task is None:
+            return
+        function, wp = task
+        try:
+            conn.send(("ok", function(wp)))
+        except Exception:  # pylint: disable=broad-except
+            conn.send(("error", traceback.format_exc()))
+
+
+context = multiprocessing.get_context("fork")
+# The configuration (command-line options, the special case rules
+# worked out so far, the cache settings, ...) is in module variables,
+# which workers only see if they are forked. With spawn or forkserver
+# they would silently run with the defaults.
+
+
+class Worker:
+    def __init__(self):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=worker_main,
+                                       args=(child_conn,),
+                                       daemon=True)
+        self.process.start()
+        child_conn.close()
+
+        self.tasks    = collections.deque()
+        # The (function, wp, attempt) we have sent; the worker is
+        # working on the first one, the others are queued up
+        self.timeout  = None
+        self.deadline = None
+        # When we give up on the first task
+        self.count    = 0
+        # Number of tasks completed so far
+
+    def start_clock(self):
+        self.deadline = (time.monotonic() + self.timeout
+                         if self.timeout is not None and self.tasks
+                         else None)
+
+    def submit(self, function, wp, attempt, timeout):
+        self.tasks.append((function, wp, attempt))
+        self.timeout = timeout
+        if len(self.tasks) == 1:
+            self.start_clock()
+        try:
+            self.conn.send((function, wp))
+        except OSError:
+            # The worker has died; we deal with that when we look at
+            # its tasks
+            pass
+
+    def finish(self):
+        # The first task is done, the worker is now on the next one
+        task = self.tasks.popleft()
+        self.count += 1
+        self.start_clock()
+        return task
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.kill()
+        self.conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+
+
+class Executor:
+    """Pool of worker processes
+
+    Each task is a function applied to a work package. Tasks that take
+    longer than task_timeout seconds, or whose worker crashes, are
+    retried up to max_retries times in a fresh worker; after that (or
+    if the task raises an exception) they are recorded in failures.
+    Workers are replaced after max_tasks_per_worker tasks, to cap
+    memory growth. Each worker is sent up to prefetch tasks at a
+    time, so that it can start on the next one without waiting for
+    us.
+    """
+
+    def __init__(self,
+                 jobs=None,
+                 task_timeout=None,
+                 max_retries=2,
+                 max_tasks_per_worker=None,
+                 prefetch=2):
+        assert jobs is None or jobs >= 1
+        assert task_timeout is None or task_timeout > 0
+        assert max_retries >= 0
+        assert max_tasks_per_worker is None or max_tasks_per_worker >= 1
+        assert prefetch >= 1
+
+        self.jobs                 = jobs or len(os.sched_getaffinity(0))
+        self.task_timeout         = task_timeout
+        self.max_retries          = max_retries
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.prefetch             = prefetch
+
+        self.workers  = []
+        self.failures = []
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+        self.workers = []
+
+    def retry_or_fail(self, task, reason):
+        function, wp, attempt = task
+        if attempt < self.max_retries:
+            print("Retrying %s (%s)" % (wp, reason))
+            return (function, wp, attempt + 1)
+        else:
+            print("Giving up on %s (%s)" % (wp, reason))
+            self.failures.append(Failure(wp, reason))
+            return None
+
+    def run(self, function, work_packages):
+        """Apply function to each work package
+
+        Yields the results as they become available (so not
+        necessarily in order). Failed tasks do not produce a result.
+        """
+        return self.run_tasks((function, wp) for wp in work_packages)
+
+    def has_room(self, worker):
+        if len(worker.tasks) >= self.prefetch:
+            return False
+        # Don't send more to a worker that is about to be replaced
+        return (self.max_tasks_per_worker is None or
+                worker.count + len(worker.tasks) < self.max_tasks_per_worker)
+
+    def run_tasks(self, tasks):
+        """Like run, but for an iterable of (function, work package)
+
+        The iterable is consumed lazily, only when a worker has room
+        for another task.
+        """
+        todo = iter(tasks)
+        retries = []
+
+        while len(self.workers) < self.jobs:
+            self.workers.append(Worker())
+
+        while True:
+            # Hand out work to workers with room for it
+            for worker in self.workers:
+                while self.has_room(worker):
+                    if retries:
+                        task = retries.pop()
+                    else:
+                        task = next(todo, None)
+                        if task is None:
+                            break
+                        task = task + (0,)
+                    worker.submit(*task, self.task_timeout)
+
+            busy = [worker for worker in self.workers if worker.tasks]
+            if not busy:
+                return
+
+            # Wait for something to happen
+            deadlines = [worker.deadline for worker in busy
+                         if worker.deadline is not None]
+            if deadlines:
+                timeout = max(0, min(deadlines) - time.monotonic())
+            else:
+                timeout = None
+            ready = multiprocessing.connection.wait(
+                [worker.conn for worker in busy] +
+                [worker.process.sentinel for worker in busy],
+                timeout)
+
+            for idx, worker in enumerate(self.workers):
+                if not worker.tasks:
+                    continue
+
+                task = worker.tasks[0]
+                if worker.conn in ready:
+                    try:
+                        status, result = worker.conn.recv()
+                    except (EOFError, OSError):
+                        status, result = "crash", None
+                elif worker.process.sentinel in ready:
+                    status, result = "crash", None
+                elif (worker.deadline is not None and
+                      time.monotonic() >= worker.deadline):
+                    status, result = "timeout", None
+                else:
+                    continue
+
+                if status == "ok":
+                    worker.finish()
+                    yield result
+                elif status == "error":
+                    worker.finish()
+                    print("Task %s raised an exception:" % task[1])
+                    print(result)
+                    self.failures.append(Failure(task[1], result))
+                else:
+                    # After this the exit code is known
+                    worker.kill()
+                    if status == "crash":
+                        reason = "worker died with exit code %s" % \
+                            worker.process.exitcode
+                    else:
+                        reason = "timeout after %gs" % self.task_timeout
+                    worker.tasks.popleft()
+                    task = self.retry_or_fail(task, reason)
+                    if task is not None:
+                        retries.append(task)
+                    # The queued tasks never started, so they don't
+                    # count as an attempt
+                    retries.extend(worker.tasks)
+                    worker.tasks.clear()
+
+                if worker.tasks:
+                    # If it died we notice when we look at its next
+                    # task (there may still be results in the pipe)
+                    continue
+
+                # Replace dead or worn-out workers
+                if not worker.process.is_alive():
+                    worker.conn.close()
+                    self.workers[idx] = Worker()
+                elif (self.max_tasks_per_worker is not None and
+                      worker.count >= self.max_tasks_per_worker):
+                    worker.stop()
+                    self.workers[idx] = Worker()
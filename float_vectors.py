@@ -151,6 +151,33 @@ fp_test_points = {
     "NaN" : build_nan,
 }
 
+CONSTANT_KINDS = frozenset(["+0", "-0",
+                            "+min_subnormal", "+max_subnormal",
+                            "-min_subnormal", "-max_subnormal",
+                            "+min_normal", "+max_normal",
+                            "+1", "nextup(+1)", "nextdown(+1)",
+                            "-min_normal", "-max_normal",
+                            "-1", "nextup(-1)", "nextdown(-1)",
+                            "+inf", "-inf"])
+# Kinds that do not depend on the rng, so we only build them once for
+# each precision
+
+constants = {}
+# Indexed by (kind, eb, sb)
+
+
+def build_constant(kind, builder, eb, sb, _):
+    key = (kind, eb, sb)
+    if key not in constants:
+        constants[key] = builder(eb, sb, None)
+    return constants[key].new_mpf()
+
+
+for constant_kind in CONSTANT_KINDS:
+    fp_test_points[constant_kind] = partial(build_constant,
+                                            constant_kind,
+                                            fp_test_points[constant_kind])
+
 reduced_set = frozenset(["+0", "-0",
                          "+rnd_subnormal", "-rnd_subnormal",
                          "+rnd_normal_small", "-rnd_normal_small",
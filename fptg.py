@@ -48,9 +48,14 @@ except ImportError:
 
 import attributes
 import core
+import executor
+import oracle_cache
+import planner
+import rng
+import smtlib
 
 import tests_basic
-import tests_float_to_float
+import tests_exhaustive
 
 
 def main():
@@ -58,17 +63,173 @@ def main():
     ap.add_argument("--reduced-fp-points",
                     action="store_true",
                     help="create way fewer testcases in each category")
+    ap.add_argument("--jobs",
+                    type=int,
+                    default=None,
+                    help="number of worker processes (default: one per core)")
+    ap.add_argument("--task-timeout",
+                    type=float,
+                    default=900,
+                    help=("seconds after which a work package is"
+                          " abandoned and retried (default: 900)"))
+    ap.add_argument("--max-retries",
+                    type=int,
+                    default=2,
+                    help=("how often to retry a work package after a"
+                          " timeout or crash (default: 2)"))
+    ap.add_argument("--max-tasks-per-worker",
+                    type=int,
+                    default=1000,
+                    help=("replace worker processes after this many"
+                          " work packages (default: 1000)"))
+    ap.add_argument("--prefetch",
+                    type=int,
+                    default=2,
+                    help=("number of work packages sent to each worker"
+                          " at a time (default: 2)"))
+    ap.add_argument("--cache",
+                    default=None,
+                    metavar="FILE",
+                    help=("remember oracle results in this file, so that"
+                          " re-generating the tests is faster"))
+    ap.add_argument("--cache-size",
+                    type=int,
+                    default=50000000,
+                    help=("maximum number of results kept in the cache"
+                          " (default: 50000000)"))
+    ap.add_argument("--primary-oracle",
+                    choices=tests_basic.PRIMARY_ORACLES,
+                    default="pympf",
+                    help=("oracle that computes the expected results"
+                          " (default: pympf)"))
+    ap.add_argument("--oracles",
+                    default=",".join(tests_basic.ORACLES),
+                    help=("comma separated list of oracles to consult"
+                          " (default: %s); PyMPF is always consulted"
+                          " for tests the primary oracle can't do" %
+                          ",".join(tests_basic.ORACLES)))
+    ap.add_argument("--validation-rate",
+                    action="append",
+                    default=[],
+                    metavar="ORACLE[:PRECISION]=RATE",
+                    help=("only check this fraction of tests with ORACLE"
+                          " (e.g. host:float64=0.1); tests are chosen by"
+                          " their seed. Can be given more than once"))
+    ap.add_argument("--always-validate-hard",
+                    action="store_true",
+                    help=("ignore the validation rates for tests with"
+                          " subnormal or boundary inputs"))
+    ap.add_argument("--both-statuses",
+                    action="store_true",
+                    help=("write a sat and an unsat variant of each test,"
+                          " instead of picking one at random"))
+    ap.add_argument("--fan-out",
+                    action="store_true",
+                    help=("convert each float -> float input to all"
+                          " target precisions in one go (this uses"
+                          " different inputs)"))
+    ap.add_argument("--rng-stream",
+                    choices=rng.STREAMS,
+                    default=rng.DEFAULT_STREAM,
+                    help=("random number generator for the test inputs;"
+                          " %s (the default) reproduces earlier suites,"
+                          " the others are cheaper to seed" %
+                          rng.DEFAULT_STREAM))
+    ap.add_argument("--seed-encoding",
+                    choices=core.SEED_ENCODINGS,
+                    default="legacy",
+                    help=("how test seeds are hashed; legacy (the"
+                          " default) reproduces earlier suites, but"
+                          " different seeds can collide"))
+    ap.add_argument("--exhaustive",
+                    action="append",
+                    default=[],
+                    metavar="OP:PRECISION",
+                    help=("instead of the normal tests, check all inputs"
+                          " of OP in a small PRECISION (e.g."
+                          " fp.add:float8); can be given more than once"))
 
     options = ap.parse_args()
 
+    if options.prefetch < 1:
+        ap.error("--prefetch must be at least 1")
+
+    exhaustive = []
+    for spec in options.exhaustive:
+        fp_op, _, name = spec.partition(":")
+        if fp_op not in attributes.op_attr:
+            ap.error("unknown operation %s" % fp_op)
+        try:
+            eb, sb = core.parse_precision(name)
+        except ValueError:
+            ap.error("unknown precision %s" % name)
+        if not tests_exhaustive.is_feasible(fp_op, eb, sb):
+            ap.error("%s has too many inputs for exhaustive tests" % spec)
+        exhaustive.append((fp_op, eb, sb))
+
+    oracles = options.oracles.split(",")
+    for oracle in oracles:
+        if oracle not in tests_basic.ORACLES:
+            ap.error("unknown oracle %s" % oracle)
+    if options.primary_oracle not in oracles:
+        ap.error("primary oracle %s is not in --oracles" %
+                 options.primary_oracle)
+
+    rates = {}
+    for spec in options.validation_rate:
+        key, _, rate = spec.partition("=")
+        oracle, _, name = key.partition(":")
+        if oracle not in tests_basic.ORACLES:
+            ap.error("unknown oracle %s" % oracle)
+        if name:
+            try:
+                core.parse_precision(name)
+            except ValueError:
+                ap.error("unknown precision %s" % name)
+        try:
+            rate = float(rate)
+        except ValueError:
+            ap.error("rate in %s is not a number" % spec)
+        if not 0.0 <= rate <= 1.0:
+            ap.error("rate in %s must be between 0 and 1" % spec)
+        rates[(oracle, name if name else None)] = rate
+
+    core.set_rng_stream(options.rng_stream)
+    core.set_seed_encoding(options.seed_encoding)
+    smtlib.configure(options.both_statuses)
+    tests_basic.configure(options.primary_oracle,
+                          oracles,
+                          rates,
+                          options.always_validate_hard)
+
+    if options.cache is not None:
+        oracle_cache.configure(options.cache, options.cache_size)
+
+    pool = executor.Executor(
+        jobs                 = options.jobs,
+        task_timeout         = options.task_timeout,
+        max_retries          = options.max_retries,
+        max_tasks_per_worker = options.max_tasks_per_worker,
+        prefetch             = options.prefetch)
+
     # Build tests
 
-    # for fp_op in attributes.op_attr:
-    #     for eb in core.precision_names:
-    #         for sb in core.precision_names[eb]:
-    #             tests_basic.create(eb, sb, fp_op, options.reduced_fp_points)
+    plan = planner.Plan()
+    if exhaustive:
+        for fp_op, eb, sb in exhaustive:
+            plan.add_exhaustive(fp_op, eb, sb)
+    else:
+        plan.add_all_basic(options.reduced_fp_points)
+        plan.add_float_to_float(options.reduced_fp_points, options.fan_out)
+    plan.run(pool)
+
+    pool.close()
 
-    tests_float_to_float.create(options.reduced_fp_points)
+    if pool.failures:
+        print("%u work package(s) failed:" % len(pool.failures))
+        for failure in pool.failures:
+            print("  %s" % failure.wp)
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -22,44 +22,90 @@
 **                                                                          **
 *****************************************************************************/
 
-#include <stdio.h>
+#define _POSIX_C_SOURCE 200809L
+
 #include <string.h>
 #include <stdlib.h>
 #include <fenv.h>
 #include <stdint.h>
+#include <errno.h>
+#include <unistd.h>
 
 #include "vlib.h"
 
-enum rounding_mode parse_rm()
+int serve(size_t request_size,
+          size_t answer_size,
+          void (*handler)(const uint8_t *request, uint8_t *answer))
 {
-  char *rm;
+  // We read whatever is available on stdin, answer all complete
+  // requests in it, and write all answers in one go. A request is an
+  // op code byte, a rounding mode byte and three packed operands
+  // (unused ones are zero), an answer is a status byte (1 if ok, 0 if
+  // unsupported) followed by the packed result.
+  size_t capacity = SERVE_BUFFER_REQUESTS * request_size;
+  uint8_t *requests = malloc(capacity);
+  uint8_t *answers = malloc(SERVE_BUFFER_REQUESTS * answer_size);
+  size_t have = 0;
+  int rv = 0;
+
+  if (requests == NULL || answers == NULL) {
+    return 1;
+  }
+
+  for (;;) {
+    ssize_t got = read(STDIN_FILENO, requests + have, capacity - have);
+    if (got < 0 && errno == EINTR) {
+      continue;
+    } else if (got < 0) {
+      rv = 1;
+      break;
+    } else if (got == 0) {
+      // End of input; anything left over is a truncated request
+      rv = have != 0;
+      break;
+    }
+    have += got;
 
-  scanf("%ms\n", &rm);
-  if (strcmp(rm, "RNE") == 0) {
-    return RNE;
-  } else if (strcmp(rm, "RTZ") == 0) {
-    return RTZ;
-  } else if (strcmp(rm, "RTP") == 0) {
-    return RTP;
-  } else if (strcmp(rm, "RTN") == 0) {
-    return RTN;
-  } else if (strcmp(rm, "RNA") == 0) {
-    return RNA;
-  } else {
-    printf("Unsupported rounding mode %s", rm);
-    exit(1);
+    size_t n = have / request_size;
+    for (size_t i = 0; i < n; ++i) {
+      memset(answers + i * answer_size, 0, answer_size);
+      handler(requests + i * request_size, answers + i * answer_size);
+    }
+
+    size_t done = 0;
+    while (done < n * answer_size) {
+      ssize_t put = write(STDOUT_FILENO,
+                          answers + done,
+                          n * answer_size - done);
+      if (put < 0 && errno == EINTR) {
+        continue;
+      } else if (put < 0) {
+        rv = 1;
+        break;
+      }
+      done += put;
+    }
+    if (rv) {
+      break;
+    }
+
+    have -= n * request_size;
+    memmove(requests, requests + n * request_size, have);
   }
+
+  free(requests);
+  free(answers);
+  return rv;
 }
 
-void set_rm(enum rounding_mode rm)
+int set_rm(enum rounding_mode rm)
 {
   switch (rm) {
   case RNE:
     fesetround(FE_TONEAREST);
     break;
   case RNA:
-    printf("Unsupported rounding mode RNA");
-    exit(1);
+    return 0;
   case RTP:
     fesetround(FE_UPWARD);
     break;
@@ -69,201 +115,60 @@ void set_rm(enum rounding_mode rm)
   case RTZ:
     fesetround(FE_TOWARDZERO);
     break;
+  default:
+    return 0;
   }
+  return 1;
 }
 
-float parse_float32()
+/* Packed little-endian representation, used by the shared library
+ * and the validators. For long double we only use the 10 bytes that
+ * actually matter. */
+
+float load_float32(const uint8_t *p)
 {
-  char *bin;
-  uint32_t bv = 0;
   float rv;
-  scanf("%ms\n", &bin);
-
-  if (strlen(bin) != 32) {
-    printf("expected 32 binary digits, got %lu\n", strlen(bin));
-    exit(1);
-  }
-
-  for (int i=0; i<32; ++i) {
-    bv = bv << 1;
-    if (bin[i] == '1') {
-      bv |= 1;
-    } else if (bin[i] == '0') {
-      // Do nothing
-    } else {
-      printf("parse error at digit %u: not 0 or 1\n", i + 1);
-      exit(1);
-    }
-  }
-
-  /*
-  fprintf(stderr, "parsed: ");
-  for (int i=0; i<32; ++i) {
-    fprintf(stderr, "%u", read_bit(bv, 31 - i));
-  }
-  fprintf(stderr, "\n");
-  fprintf(stderr, "parsed: %f\n", *((float*)(&bv)));
-  */
-
-  memcpy(&rv, &bv, 4);
+  memcpy(&rv, p, WIDTH_FLOAT32);
   return rv;
 }
 
-double parse_float64()
+double load_float64(const uint8_t *p)
 {
-  char *bin;
-  uint64_t bv = 0;
   double rv;
-  scanf("%ms\n", &bin);
-
-  if (strlen(bin) != 64) {
-    printf("expected 64 binary digits, got %lu\n", strlen(bin));
-    exit(1);
-  }
-
-  for (int i=0; i<64; ++i) {
-    bv = bv << 1;
-    if (bin[i] == '1') {
-      bv |= 1;
-    } else if (bin[i] == '0') {
-      // Do nothing
-    } else {
-      printf("parse error at digit %u: not 0 or 1\n", i + 1);
-      exit(1);
-    }
-  }
-
-  /* fprintf(stderr, "read: %s\n", bin); */
-  /* fprintf(stderr, "parsed: "); */
-  /* for (int i=0; i<64; ++i) { */
-  /*   fprintf(stderr, "%u", read_bit64(bv, 63 - i)); */
-  /* } */
-  /* fprintf(stderr, "\n"); */
-  /* fprintf(stderr, "parsed: %f\n", *((double*)(&bv))); */
-
-  memcpy(&rv, &bv, 8);
+  memcpy(&rv, p, WIDTH_FLOAT64);
   return rv;
 }
 
-long double parse_float80()
+long double load_float80(const uint8_t *p)
 {
-  union {
-    uint64_t bv[2];
-    long double rv;
-  } data;
-  char *bin;
-  int idx;
-  scanf("%ms\n", &bin);
-
-  if (strlen(bin) != 80) {
-    printf("expected 80 binary digits, got %lu\n", strlen(bin));
-    exit(1);
-  }
-
-  data.bv[0] = 0;
-  data.bv[1] = 0;
-
-  for (int i=6*8; i<128; ++i) {
-    idx = i < 64;
-    data.bv[idx] = data.bv[idx] << 1;
-    if (bin[i-6*8] == '1') {
-      data.bv[idx] |= 1;
-    } else if (bin[i-6*8] == '0') {
-      // Do nothing
-    } else {
-      printf("parse error at digit %u: not 0 or 1\n", i + 1 - 6*8);
-      exit(1);
-    }
-  }
-
-  /*
-  fprintf(stderr, "string: %s\n", bin);
-  fprintf(stderr, "parsed hi: %016lx\n", data.bv[1]);
-  fprintf(stderr, "parsed lo: %016lx\n", data.bv[0]);
-  fprintf(stderr, "parsed flt: %Lf\n", data.rv);
-  */
-
-  return data.rv;
+  long double rv = 0;
+  memcpy(&rv, p, WIDTH_FLOAT80);
+  return rv;
 }
 
-__float128 parse_float128()
+__float128 load_float128(const uint8_t *p)
 {
-  union {
-    uint64_t bv[2];
-    __float128 rv;
-  } data;
-  char *bin;
-  int idx;
-  scanf("%ms\n", &bin);
-
-  if (strlen(bin) != 128) {
-    printf("expected 128 binary digits, got %lu\n", strlen(bin));
-    exit(1);
-  }
-
-  data.bv[0] = 0;
-  data.bv[1] = 0;
-
-  for (int i=0; i<128; ++i) {
-    idx = i < 64;
-    data.bv[idx] = data.bv[idx] << 1;
-    if (bin[i] == '1') {
-      data.bv[idx] |= 1;
-    } else if (bin[i] == '0') {
-      // Do nothing
-    } else {
-      printf("parse error at digit %u: not 0 or 1\n", i + 1);
-      exit(1);
-    }
-  }
-
-  return data.rv;
+  __float128 rv;
+  memcpy(&rv, p, WIDTH_FLOAT128);
+  return rv;
 }
 
-void print_float32(float f)
+void store_float32(uint8_t *p, float f)
 {
-  uint8_t bv[sizeof(float)];
-  memcpy(bv, &f, sizeof(float));
-
-  printf("result: ");
-  for (unsigned int i=0; i<sizeof(float); ++i) {
-    printf("%02x", bv[sizeof(float)-1-i]);
-  }
-  printf("\n");
+  memcpy(p, &f, WIDTH_FLOAT32);
 }
 
-void print_float64(double f)
+void store_float64(uint8_t *p, double f)
 {
-  uint8_t bv[sizeof(double)];
-  memcpy(bv, &f, sizeof(double));
-
-  printf("result: ");
-  for (unsigned int i=0; i<sizeof(double); ++i) {
-    printf("%02x", bv[sizeof(double)-1-i]);
-  }
-  printf("\n");
+  memcpy(p, &f, WIDTH_FLOAT64);
 }
 
-void print_float80(long double f)
+void store_float80(uint8_t *p, long double f)
 {
-  uint8_t bv[sizeof(long double)];
-  memcpy(bv, &f, sizeof(long double));
-
-  printf("result: ");
-  for (unsigned int i=6; i<sizeof(long double); ++i) {
-    printf("%02x", bv[sizeof(long double)-1-i]);
-  }
-  printf("\n");
+  memcpy(p, &f, WIDTH_FLOAT80);
 }
 
-void print_float128(__float128 f)
+void store_float128(uint8_t *p, __float128 f)
 {
-  uint8_t bv[sizeof(__float128)];
-  memcpy(bv, &f, sizeof(__float128));
-
-  printf("result: ");
-  for (unsigned int i=0; i<sizeof(__float128); ++i) {
-    printf("%02x", bv[sizeof(__float128)-1-i]);
-  }
-  printf("\n");
+  memcpy(p, &f, WIDTH_FLOAT128);
 }
@@ -25,19 +25,34 @@
 #ifndef _VLIB_H_
 #define _VLIB_H_
 
+#include <stddef.h>
+#include <stdint.h>
+
+#define WIDTH_FLOAT32 4
+#define WIDTH_FLOAT64 8
+#define WIDTH_FLOAT80 10
+#define WIDTH_FLOAT128 16
+// Number of bytes used by each format when packed into an array
+
 enum rounding_mode { RNE, RNA, RTP, RTN, RTZ };
 
-enum rounding_mode parse_rm();
-void set_rm(enum rounding_mode rm);
+#define SERVE_BUFFER_REQUESTS 4096
+// Maximum number of requests handled in one go by serve
+
+int serve(size_t request_size,
+          size_t answer_size,
+          void (*handler)(const uint8_t *request, uint8_t *answer));
+
+int set_rm(enum rounding_mode rm);
 
-float parse_float32();
-double parse_float64();
-long double parse_float80();
-__float128 parse_float128();
+float load_float32(const uint8_t *p);
+double load_float64(const uint8_t *p);
+long double load_float80(const uint8_t *p);
+__float128 load_float128(const uint8_t *p);
 
-void print_float32(float f);
-void print_float64(double f);
-void print_float80(long double f);
-void print_float128(__float128 f);
+void store_float32(uint8_t *p, float f);
+void store_float64(uint8_t *p, double f);
+void store_float80(uint8_t *p, long double f);
+void store_float128(uint8_t *p, __float128 f);
 
 #endif
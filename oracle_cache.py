@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                          FP_TEST_GENERATOR                               ##
+##                                                                          ##
+##              Copyright (C) 2020, Florian Schanda                         ##
+##                                                                          ##
+##  This file is part of FP_Test_Generator.                                 ##
+##                                                                          ##
+##  FP_Test_Generator is free software: you can redistribute it and/or      ##
+##  modify it under the terms of the GNU General Public License as          ##
+##  published by the Free Software Foundation, either version 3 of the      ##
+##  License, or (at your option) any later version.                         ##
+##                                                                          ##
+##  FP_Test_Generator is distributed in the hope that it will be useful,    ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with FP_Test_Generator. If not, see                               ##
+##  <http://www.gnu.org/licenses/>.                                         ##
+##                                                                          ##
+##############################################################################
+
+
+"""Persistent cache of oracle results
+
+Q: Why?
+
+A: The inputs of each test are fully determined by its seed, so when
+   we re-generate the suite (e.g. after changing the output format)
+   we'd otherwise ask PyMPF, MPFR and the host the same questions
+   again. The cache is an SQLite database shared by all workers; each
+   entry is keyed by the oracle (including its version, and the
+   version of our code that talks to it) and the exact query, so
+   upgrading an oracle simply means its old entries are no longer
+   used, and eventually evicted.
+"""
+
+import importlib.metadata
+import os
+import sqlite3
+import time
+
+from mpf.floats import MPF, Unspecified
+
+import validation
+
+
+def get_pympf_version():
+    try:
+        return importlib.metadata.version("PyMPF")
+    except importlib.metadata.PackageNotFoundError:
+        return "unknown"
+
+
+PYMPF_ADAPTER_VERSION = 1
+# Version of our code that calls PyMPF; increase this when it changes
+# the results, so that we don't use old results from the cache
+
+PYMPF = "PyMPF %s adapter %u" % (get_pympf_version(), PYMPF_ADAPTER_VERSION)
+# Name of PyMPF in the cache
+
+cache_filename = None
+cache_max_entries = None
+# Set by configure, before any workers are started. If no filename
+# is set the cache is disabled.
+
+cache = None
+# Per-process connection to the database (see get_cache)
+cache_pid = None
+
+
+def configure(filename, max_entries):
+    global cache_filename
+    global cache_max_entries
+
+    assert max_entries >= 1
+    cache_filename    = filename
+    cache_max_entries = max_entries
+
+
+def query_key(fp_op, rm, args):
+    """Encode a query: the operation, rounding mode and operands"""
+    template = args[0]
+    return "%s %s %u %u %s" % (fp_op,
+                               rm if rm else "-",
+                               template.w,
+                               template.p,
+                               " ".join("%x" % arg.bv for arg in args))
+
+
+def encode_result(result):
+    if isinstance(result, MPF):
+        return "f %u %u %x" % (result.w, result.p, result.bv)
+    elif isinstance(result, bool):
+        return "b %u" % result
+    elif isinstance(result, Unspecified):
+        return "s"
+    elif isinstance(result, validation.Unsupported):
+        return "u %s" % result.reason
+    else:
+        assert False
+
+
+def decode_result(text):
+    kind, _, data = text.partition(" ")
+    if kind == "f":
+        w, p, bv = data.split(" ")
+        return MPF(int(w), int(p), int(bv, 16))
+    elif kind == "b":
+        return data == "1"
+    elif kind == "s":
+        return Unspecified()
+    elif kind == "u":
+        return validation.Unsupported(data)
+    else:
+        assert False
+
+
+class Oracle_Cache:
+    CHUNK = 500
+    # Maximum number of queries we look up in one statement (SQLite
+    # has a limit on the number of parameters)
+
+    TRIM_INTERVAL = 10000
+    # We check the size of the cache after this many new entries
+
+    def __init__(self, filename, max_entries):
+        self.db          = sqlite3.connect(filename, timeout=600)
+        self.max_entries = max_entries
+        self.new_entries = 0
+
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS results ("
+                            " oracle TEXT NOT NULL,"
+                            " query TEXT NOT NULL,"
+                            " result TEXT NOT NULL,"
+                            " used INTEGER NOT NULL,"
+                            " PRIMARY KEY (oracle, query))")
+            self.db.execute("CREATE INDEX IF NOT EXISTS results_used"
+                            " ON results (used)")
+
+    def lookup(self, oracle, keys):
+        """Returns a list of results (None if we don't know it)"""
+        found = {}
+        for i in range(0, len(keys), Oracle_Cache.CHUNK):
+            chunk = keys[i:i + Oracle_Cache.CHUNK]
+            rows = self.db.execute(
+                "SELECT query, result FROM results"
+                " WHERE oracle = ? AND query IN (%s)" %
+                ", ".join("?" * len(chunk)),
+                [oracle] + chunk)
+            for query, result in rows:
+                found[query] = result
+
+        if found:
+            # Remember when we last needed these, for eviction
+            now = int(time.time())
+            with self.db:
+                self.db.executemany(
+                    "UPDATE results SET used = ?"
+                    " WHERE oracle = ? AND query = ?",
+                    [(now, oracle, query) for query in found])
+
+        return [decode_result(found[key]) if key in found else None
+                for key in keys]
+
+    def store(self, oracle, items):
+        """Record a list of (key, result)
+
+        Transient problems are not recorded, so that we ask again
+        next time.
+        """
+        items = [(key, result)
+                 for key, result in items
+                 if not (isinstance(result, validation.Unsupported) and
+                         result.transient)]
+        now = int(time.time())
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                [(oracle, key, encode_result(result), now)
+                 for key, result in items])
+
+        self.new_entries += len(items)
+        if self.new_entries >= Oracle_Cache.TRIM_INTERVAL:
+            self.new_entries = 0
+            self.trim()
+
+    def trim(self):
+        # Evict the least recently used entries
+        with self.db:
+            count = self.db.execute(
+                "SELECT count(*) FROM results").fetchone()[0]
+            if count > self.max_entries:
+                self.db.execute(
+                    "DELETE FROM results WHERE rowid IN"
+                    " (SELECT rowid FROM results ORDER BY used LIMIT ?)",
+                    (count - self.max_entries,))
+
+
+def get_cache():
+    # Returns the cache for this process, or None if it is disabled
+    global cache
+    global cache_pid
+
+    if cache_filename is None:
+        return None
+
+    if cache_pid != os.getpid():
+        cache = Oracle_Cache(cache_filename, cache_max_entries)
+        cache_pid = os.getpid()
+
+    return cache
+
+
+def lookup_or_compute(oracle, keys, compute):
+    """Results for all keys, computing only the ones not cached
+
+    compute is given a list of indices into keys, and must return a
+    list of results for those.
+    """
+    cache = get_cache()
+    if cache is None:
+        return compute(list(range(len(keys))))
+
+    results = cache.lookup(oracle, keys)
+    todo = [idx for idx, result in enumerate(results) if result is None]
+    if todo:
+        for idx, result in zip(todo, compute(todo)):
+            results[idx] = result
+        cache.store(oracle, [(keys[idx], results[idx]) for idx in todo])
+    return results
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                          FP_TEST_GENERATOR                               ##
+##                                                                          ##
+##              Copyright (C) 2020, Florian Schanda                         ##
+##                                                                          ##
+##  This file is part of FP_Test_Generator.                                 ##
+##                                                                          ##
+##  FP_Test_Generator is free software: you can redistribute it and/or      ##
+##  modify it under the terms of the GNU General Public License as          ##
+##  published by the Free Software Foundation, either version 3 of the      ##
+##  License, or (at your option) any later version.                         ##
+##                                                                          ##
+##  FP_Test_Generator is distributed in the hope that it will be useful,    ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with FP_Test_Generator. If not, see                               ##
+##  <http://www.gnu.org/licenses/>.                                         ##
+##                                                                          ##
+##############################################################################
+
+
+"""Plan for generating all tests
+
+Rather than generating one category of tests (an operation in one
+precision, the float -> float tests, ...) after the other, and waiting
+for the slowest work package of each before starting the next, we
+build a single plan over all of them and run it on one executor.
+
+The categories are ordered by how long we expect each of their work
+packages to take, longest first (i.e. LPT scheduling). Otherwise a
+few float128 fp.fma packages submitted at the very end keep one
+worker busy long after the others have run out of work.
+
+The work packages of each category are still generated lazily, when
+the executor gets to them.
+"""
+
+import itertools
+
+import attributes
+import tests_basic
+import tests_exhaustive
+import tests_float_to_float
+
+from core import precision_name, precision_names
+from precision_vectors import precision_test_points
+
+
+OVERHEAD = 0.2
+# Rough cost (in ms) of writing one test, whatever the operation
+
+OP_COST = {
+    "fp.add"            : 1.0,
+    "fp.sub"            : 1.0,
+    "fp.mul"            : 1.0,
+    "fp.div"            : 1.0,
+    "fp.fma"            : 2.0,
+    "fp.sqrt"           : 1.0,
+    "fp.rem"            : 1.0,
+    "fp.roundToIntegral": 0.2,
+}
+DEFAULT_OP_COST = 0.05
+# Rough cost (in ms) of computing one result with PyMPF in float64,
+# relative to which precision_cost scales. Everything not listed
+# (classification, comparisons, min/max, ...) is just about free.
+
+
+def precision_cost(eb, sb):
+    # PyMPF works with exact rationals, so the cost grows with the
+    # significand and (much more quickly) with the exponent range
+    return (sb + 2 ** eb / 64) / 85
+
+
+def op_cost(fp_op, eb, sb):
+    return OP_COST.get(fp_op, DEFAULT_OP_COST) * precision_cost(eb, sb)
+
+
+class Category:
+    def __init__(self, title, function, build_wp, cost):
+        self.title    = title
+        self.function = function
+        self.build_wp = build_wp
+        # Called without arguments, returns an iterable of work
+        # packages for function
+        self.cost     = cost
+        # Estimated cost (in ms) of each work package
+
+    def tasks(self):
+        print("Generating %s" % self.title)
+        for wp in self.build_wp():
+            yield (self.function, wp)
+
+
+class Plan:
+    def __init__(self):
+        self.categories = []
+
+    def add_basic(self, fp_op, eb, sb, reduced):
+        self.categories.append(
+            Category("%s (%s)" % (fp_op, precision_name(eb, sb)),
+                     tests_basic.basic_test_build,
+                     lambda: tests_basic.build_wp(fp_op, eb, sb, reduced),
+                     tests_basic.GROUP_SIZE * (OVERHEAD +
+                                               op_cost(fp_op, eb, sb))))
+
+    def add_all_basic(self, reduced):
+        for fp_op in attributes.op_attr:
+            for eb in precision_names:
+                for sb in precision_names[eb]:
+                    self.add_basic(fp_op, eb, sb, reduced)
+
+    def add_float_to_float(self, reduced, fan_out):
+        if fan_out:
+            # Each work package does one conversion to every target
+            self.categories.append(
+                Category("float -> float tests",
+                         tests_float_to_float.execute_fan_out,
+                         lambda: tests_float_to_float.build_fan_out_wp(
+                             reduced),
+                         len(precision_test_points) * (OVERHEAD + 1.0)))
+        else:
+            self.categories.append(
+                Category("float -> float tests",
+                         tests_float_to_float.execute,
+                         lambda: tests_float_to_float.build_wp(reduced),
+                         OVERHEAD + 1.0))
+
+    def add_exhaustive(self, fp_op, eb, sb):
+        assert tests_exhaustive.is_feasible(fp_op, eb, sb)
+        self.categories.append(
+            Category("exhaustive %s (%s)" % (fp_op, precision_name(eb, sb)),
+                     tests_exhaustive.execute,
+                     lambda: tests_exhaustive.build_wp(fp_op, eb, sb),
+                     tests_exhaustive.CHECKS_PER_FILE * op_cost(fp_op,
+                                                                eb,
+                                                                sb)))
+
+    def ordered(self):
+        # Most expensive work packages first. The sort is stable, so
+        # categories of equal cost stay in the order they were added.
+        return sorted(self.categories,
+                      key=lambda category: category.cost,
+                      reverse=True)
+
+    def tasks(self):
+        return itertools.chain.from_iterable(category.tasks()
+                                             for category in self.ordered())
+
+    def run(self, executor):
+        for _ in executor.run_tasks(self.tasks()):
+            pass
@@ -38,19 +38,36 @@ A: The python RNG is not thread-safe. Furthemore, wrapping it with
    https://github.com/AdaCore/spark2014/tree/master/testsuite/gnatprove/tests/random
 """
 
+import hashlib
+import struct
+
 from math import ceil, log2
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class RNG:
     N = 624
     M = 397
 
-    def __init__(self, *seed_vector):
-        for item in seed_vector:
-            assert isinstance(item, int)
+    MATRIX_A   = 0x9908b0df
+    UPPER_MASK = 0x80000000
+    LOWER_MASK = 0x7fffffff
 
-        self.index = 0
-        self.state = []
+    INIT_SEED = 19650218
+    init_state = None
+    # The state after reset(INIT_SEED), which is where seeding with
+    # more than one word always starts, so we only compute it once
+
+    def __init__(self, *seed_vector):
+        self.index  = 0
+        self.state  = []
+        self.buffer = []
+        # We generate N numbers at a time (see refill); index is the
+        # next one to hand out from buffer
 
         self.reset(*seed_vector)
 
@@ -66,82 +83,125 @@ class RNG:
                 else:
                     break
 
+        self.index  = 0
+        self.buffer = []
+
         if len(seed) == 1:
             current = seed[0]
-
-            self.index = 0
-            self.state = []
-            for i in range(RNG.N):
-                if i > 0:
-                    last = current
-                    current = (1812433253 *
-                               (last ^ (last >> 30)) + i) % (2 ** 32)
-                self.state.append(current)
+            state = [current]
+            for i in range(1, RNG.N):
+                current = (1812433253 *
+                           (current ^ (current >> 30)) + i) & 0xffffffff
+                state.append(current)
+            self.state = state
 
         else:
+            if RNG.init_state is None:
+                RNG.init_state = RNG(RNG.INIT_SEED).state
+            state = list(RNG.init_state)
+            # Local variables, as this is run for every test
+
+            # The two loops below are the ones from init_by_array;
+            # we carry the previous element in last and only check
+            # for wrapping around at the end of each run, but the
+            # arithmetic is the same.
             i = 1
-            j = 0
-            self.reset(19650218)
-            for _ in range(max(len(seed), RNG.N)):
-                self.state[i] = ((self.state[i] ^
-                                  ((self.state[i - 1] ^
-                                    (self.state[i - 1] >> 30)) * 1664525)) +
-                                 seed[j] + j) % (2 ** 32)
-                if i == RNG.N - 1:
-                    self.state[0] = self.state[-1]
+            n = 0
+            last = state[0]
+            iterations = max(len(seed), RNG.N)
+            while n < iterations:
+                for i in range(i, min(RNG.N, i + iterations - n)):
+                    j = n % len(seed)
+                    last = ((state[i] ^ ((last ^ (last >> 30)) * 1664525)) +
+                            seed[j] + j) & 0xffffffff
+                    state[i] = last
+                    n += 1
+                i += 1
+                if i == RNG.N:
+                    state[0] = last
                     i = 1
-                else:
-                    i += 1
-                j = 0 if (j == len(seed) - 1) else j + 1
-                assert i > 0 and 0 <= j < len(seed)
-
-            for _ in range(1, RNG.N):
-                self.state[i] = ((self.state[i] ^
-                                  ((self.state[i - 1] ^
-                                    (self.state[i - 1] >> 30)) * 1566083941)) -
-                                 i) % (2 ** 32)
-                if i == RNG.N - 1:
-                    self.state[0] = self.state[-1]
+
+            n = 1
+            while n < RNG.N:
+                for i in range(i, min(RNG.N, i + RNG.N - n)):
+                    last = ((state[i] ^ ((last ^ (last >> 30)) * 1566083941)) -
+                            i) & 0xffffffff
+                    state[i] = last
+                    n += 1
+                i += 1
+                if i == RNG.N:
+                    state[0] = last
                     i = 1
-                else:
-                    i += 1
-                assert i > 0
 
-            self.state[0] = 0x80000000
+            state[0] = 0x80000000
+            self.state = state
 
         assert len(self.state) == RNG.N
 
-    def random(self):
-        def next_state(state_index):
-            return (state_index + 1) % RNG.N
-
-        MAT = (0, 0x9908b0df)
-        LOWER_MASK = 0x7fffffff
-        UPPER_MASK = 0x80000000
-
-        value = (self.state[self.index] & UPPER_MASK) | \
-                (self.state[next_state(self.index)] & LOWER_MASK)
-
-        if self.index < RNG.N - RNG.M:
-            self.state[self.index] = self.state[self.index + RNG.M]
-        elif self.index < RNG.N - 1:
-            self.state[self.index] = self.state[self.index + (RNG.M - RNG.N)]
+    def refill(self):
+        # Generate the next N numbers in one go. This gives exactly
+        # the same numbers as generating them one at a time: element i
+        # of the new state depends on the old elements i and i + 1, and
+        # on element i + M, which is old for i < N - M and new
+        # otherwise. So we can compute it in blocks of at most N - M
+        # elements.
+        if numpy is None:
+            self.twist_python()
         else:
-            self.state[self.index] = self.state[RNG.M - 1]
-
-        self.state[self.index] = (self.state[self.index] ^
-                                  (value >> 1) ^
-                                  MAT[value & 1])
-
-        value = self.state[self.index]
-        self.index = next_state(self.index)
+            self.twist_numpy()
+        self.index = 0
 
-        value = value ^ (value >> 11)
-        value = value ^ (((value << 7) % (2 ** 32)) & 0x9d2c5680)
-        value = value ^ (((value << 15) % (2 ** 32)) & 0xefc60000)
-        value = value ^ (value >> 18)
+    def twist_python(self):
+        state = self.state
+        N = RNG.N
+        M = RNG.M
+        mag01 = (0, RNG.MATRIX_A)
+        for i in range(N):
+            value = (state[i] & RNG.UPPER_MASK) | \
+                    (state[(i + 1) % N] & RNG.LOWER_MASK)
+            state[i] = state[(i + M) % N] ^ (value >> 1) ^ mag01[value & 1]
+
+        buffer = []
+        for value in state:
+            value ^= value >> 11
+            value ^= (value << 7) & 0x9d2c5680
+            value ^= (value << 15) & 0xefc60000
+            value ^= value >> 18
+            buffer.append(value)
+        self.buffer = buffer
+
+    def twist_numpy(self):
+        N = RNG.N
+        M = RNG.M
+        old = numpy.asarray(self.state, dtype=numpy.uint32)
+        new = numpy.empty(N, dtype=numpy.uint32)
+
+        value = (old & RNG.UPPER_MASK) | \
+                (numpy.roll(old, -1) & RNG.LOWER_MASK)
+        mixed = (value >> 1) ^ ((value & 1) * numpy.uint32(RNG.MATRIX_A))
+
+        new[:N - M] = old[M:] ^ mixed[:N - M]
+        for start in range(N - M, N - 1, N - M):
+            end = min(start + N - M, N - 1)
+            new[start:end] = new[start + M - N:end + M - N] ^ \
+                mixed[start:end]
+        # The last one also depends on the new first element
+        value = (old[N - 1] & RNG.UPPER_MASK) | (new[0] & RNG.LOWER_MASK)
+        new[N - 1] = new[M - 1] ^ (value >> 1) ^ \
+            (RNG.MATRIX_A if value & 1 else 0)
+        self.state = new
+
+        value = new ^ (new >> 11)
+        value ^= (value << 7) & 0x9d2c5680
+        value ^= (value << 15) & 0xefc60000
+        value ^= value >> 18
+        self.buffer = value.tolist()
 
-        assert 0 <= value < 2 ** 32
+    def random(self):
+        if self.index >= len(self.buffer):
+            self.refill()
+        value = self.buffer[self.index]
+        self.index += 1
         return value
 
     def random_int32(self, low, high):
@@ -168,16 +228,20 @@ class RNG:
     def random_bits(self, bit_count):
         assert isinstance(bit_count, int) and bit_count > 0
 
-        remaining = bit_count
+        words, remaining = divmod(bit_count, 32)
         value = 0
-        while remaining:
-            if remaining >= 32:
-                value = (value << 32) | self.random()
-                remaining -= 32
-            else:
-                value = (value << remaining) | \
-                    self.random_int32(0, 2 ** remaining - 1)
-                break
+        while words:
+            # Take as many whole words as we can from the buffer
+            if self.index >= len(self.buffer):
+                self.refill()
+            count = min(words, len(self.buffer) - self.index)
+            for word in self.buffer[self.index:self.index + count]:
+                value = (value << 32) | word
+            self.index += count
+            words -= count
+        if remaining:
+            value = (value << remaining) | \
+                self.random_int32(0, 2 ** remaining - 1)
 
         return value
 
@@ -212,6 +276,56 @@ class RNG:
         return self.random_int32(0, 1) == 1
 
 
+class Counter_RNG(RNG):
+    """Counter based random number generator
+
+    Word n of the stream is word n % 16 of the keyed BLAKE2b hash of
+    n // 16, where the key is the digest of the seed. So seeding costs
+    nothing, and any word can be computed on its own (see word). This
+    is a different stream from the mersenne twister, so tests
+    generated with it are different.
+    """
+    STREAM = "blake2b-counter-1"
+    # Name of this stream; if we ever change how it works, this must
+    # change too
+
+    WORDS = 16
+    # Words in each hash (BLAKE2b produces 64 bytes)
+
+    def __init__(self, key):
+        self.key     = None
+        self.counter = 0
+        super().__init__(key)
+
+    def reset(self, *seed_vector):
+        # The seed is a single key, rather than integers
+        assert len(seed_vector) == 1
+        key = seed_vector[0]
+        assert isinstance(key, bytes) and 1 <= len(key) <= 64
+        self.key     = key
+        self.counter = 0
+        self.index   = 0
+        self.buffer  = []
+
+    def block(self, n):
+        digest = hashlib.blake2b(n.to_bytes(8, "little"),
+                                 key=self.key,
+                                 digest_size=4 * Counter_RNG.WORDS).digest()
+        return list(struct.unpack("<%uI" % Counter_RNG.WORDS, digest))
+
+    def word(self, n):
+        return self.block(n // Counter_RNG.WORDS)[n % Counter_RNG.WORDS]
+
+    def refill(self):
+        self.buffer   = self.block(self.counter)
+        self.counter += 1
+        self.index    = 0
+
+
+DEFAULT_STREAM = "mt19937"
+STREAMS = (DEFAULT_STREAM, Counter_RNG.STREAM)
+
+
 def sanity_test():
     EXPECTATION = [
         1067595299, 955945823, 477289528, 4107218783, 4228976476,
@@ -23,13 +23,56 @@
 ##                                                                          ##
 ##############################################################################
 
+import functools
+
+from mpf.floats import MPF
+
+import rng
+
+
+both_statuses = False
+# Set by configure, before any workers are started. If set, we write
+# both the sat and the unsat variant of each test.
+
+
+def configure(both):
+    global both_statuses
+    both_statuses = both
+
+
+def goal_variants(expect_unsat):
+    """Returns the list of goals we should write a test for
+
+    Each is True if the test should be unsat, and False if it
+    should be sat.
+    """
+    if both_statuses:
+        return [False, True]
+    else:
+        return [expect_unsat]
+
+
+def status_suffix(status):
+    """Suffix for filenames, so that variants don't clash"""
+    assert status in ("sat", "unsat")
+    if both_statuses:
+        return "_" + status
+    else:
+        return ""
+
 
 def write_header(fd, seed, validators):
     fd.write(";; Random floating-point test generated by fp_test_generator\n")
     fd.write(";;\n")
     fd.write(";; Seed information:\n")
-    for key in sorted(seed.keys):
+    for key in seed.ordered_keys():
         fd.write(";;    %s = %s\n" % (key, seed.keys[key]))
+    if seed.encoding != "legacy":
+        fd.write(";;\n")
+        fd.write(";; Seed encoding: %s\n" % seed.encoding)
+    if seed.stream != rng.DEFAULT_STREAM:
+        fd.write(";;\n")
+        fd.write(";; Random number stream: %s\n" % seed.stream)
     fd.write(";;\n")
     fd.write(";; Test oracle(s) for this test:\n")
     for oracle in sorted(validators):
@@ -65,24 +108,62 @@ def set_status(fd, status):
     set_info(fd, "status", status)
 
 
-def define_fp_const(fd, name, value):
-    fd.write("\n")
-    fd.write("(define-const %s %s %s)\n" % (name,
-                                            value.smtlib_sort(),
-                                            value.smtlib_literal()))
-    if value.isFinite():
+def decimal_length_bound(value):
+    # A lower bound for the length of value.to_python_string(), for
+    # finite values, without actually building it. The value is
+    # significand * 2 ** exponent; for negative exponents (and an odd
+    # significand) the decimal has exactly -exponent digits after the
+    # point, otherwise it is an integer with a known number of bits.
+    if value.isZero():
+        return 0
+    E = (value.bv >> value.t) & (2 ** value.w - 1)
+    significand = value.bv & (2 ** value.t - 1)
+    if E == 0:
+        exponent = value.emin - value.t
+    else:
+        significand |= 2 ** value.t
+        exponent = E - value.bias - value.t
+    while significand % 2 == 0:
+        significand //= 2
+        exponent += 1
+
+    if exponent < 0:
+        return 2 - exponent
+    else:
+        bits = significand.bit_length() + exponent
+        return (bits - 1) * 30102 // 100000 + 3
+
+
+@functools.lru_cache(maxsize=4096)
+def describe_fp_const(eb, sb, bv):
+    # Returns the sort, literal, and the comments for a value. Working
+    # out the decimal value is quite expensive for large exponents,
+    # and the constant test points (e.g. max_normal) appear in a lot of
+    # tests, so we remember the most recent ones.
+    value = MPF(eb, sb, bv)
+    lines = []
+    if value.isFinite() and decimal_length_bound(value) < 20:
         str_val = value.to_python_string()
         if len(str_val) < 20:
-            fd.write(";; should be %s\n" % str_val)
-    fd.write(";;   isZero      : %s\n" % value.isZero())
-    fd.write(";;   isSubnormal : %s\n" % value.isSubnormal())
-    fd.write(";;   isNormal    : %s\n" % value.isNormal())
-    fd.write(";;   isInfinite  : %s\n" % value.isInfinite())
-    fd.write(";;   isNan       : %s\n" % value.isNaN())
-    fd.write(";;   isNegative  : %s\n" % value.isNegative())
-    fd.write(";;   isPositive  : %s\n" % value.isPositive())
-    fd.write(";;   isFinite    : %s\n" % value.isFinite())
-    fd.write(";;   isIntegral  : %s\n" % value.isIntegral())
+            lines.append(";; should be %s\n" % str_val)
+    lines.append(";;   isZero      : %s\n" % value.isZero())
+    lines.append(";;   isSubnormal : %s\n" % value.isSubnormal())
+    lines.append(";;   isNormal    : %s\n" % value.isNormal())
+    lines.append(";;   isInfinite  : %s\n" % value.isInfinite())
+    lines.append(";;   isNan       : %s\n" % value.isNaN())
+    lines.append(";;   isNegative  : %s\n" % value.isNegative())
+    lines.append(";;   isPositive  : %s\n" % value.isPositive())
+    lines.append(";;   isFinite    : %s\n" % value.isFinite())
+    lines.append(";;   isIntegral  : %s\n" % value.isIntegral())
+    return value.smtlib_sort(), value.smtlib_literal(), "".join(lines)
+
+
+def define_fp_const(fd, name, value):
+    sort, literal, annotations = describe_fp_const(value.w, value.p,
+                                                   value.bv)
+    fd.write("\n")
+    fd.write("(define-const %s %s %s)\n" % (name, sort, literal))
+    fd.write(annotations)
 
 
 def define_const(fd, name, sort, value):
@@ -92,6 +173,12 @@ def define_const(fd, name, sort, value):
                                             value))
 
 
+def function_name(fp_op):
+    # Our name for SMT-LIB's equality is smtlib.eq, to tell it apart
+    # from fp.eq
+    return "=" if fp_op == "smtlib.eq" else fp_op
+
+
 def goal_eq(fd, a, b, expecting_unsat):
     fd.write("\n")
     if expecting_unsat:
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                          FP_TEST_GENERATOR                               ##
+##                                                                          ##
+##              Copyright (C) 2020, Florian Schanda                         ##
+##                                                                          ##
+##  This file is part of FP_Test_Generator.                                 ##
+##                                                                          ##
+##  FP_Test_Generator is free software: you can redistribute it and/or      ##
+##  modify it under the terms of the GNU General Public License as          ##
+##  published by the Free Software Foundation, either version 3 of the      ##
+##  License, or (at your option) any later version.                         ##
+##                                                                          ##
+##  FP_Test_Generator is distributed in the hope that it will be useful,    ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with FP_Test_Generator. If not, see                               ##
+##  <http://www.gnu.org/licenses/>.                                         ##
+##                                                                          ##
+##############################################################################
+
+
+"""Rules for operations on special operands
+
+Q: Why?
+
+A: A lot of tests have a zero, infinite or NaN operand, and for those
+   the result does not depend on the value of the other operands (e.g.
+   x + NaN is NaN, +inf - +inf is NaN, x * +0 is a zero). We
+   work out these rules once, from PyMPF, for each operation, class
+   of operands and rounding mode, and then answer such tests from the
+   table instead of asking all the oracles.
+
+Q: How do we know a rule is right?
+
+A: We only keep a rule if PyMPF gives the same answer for all
+   representatives of the operand classes, in several precisions; and
+   we check it against MPFR (where it supports the operation, and
+   MPFR is enabled). The oracles that agreed are listed as the
+   validators of each test answered by the rule (subject to the
+   validation rates, see tests_basic.selected). If MPFR disagrees we
+   drop the rule, so that the test goes through the normal route and
+   ends up in controversial.
+"""
+
+import itertools
+
+from mpf.floats import MPF, Unspecified, smtlib_eq
+
+import attributes
+import validation
+import validation_mpfr
+
+from float_vectors import fp_test_points
+from rng import RNG
+
+
+SPECIAL_CLASSES = ("+0", "-0", "+inf", "-inf", "NaN")
+CLASSES = SPECIAL_CLASSES + ("+finite", "-finite")
+# Operands are zero, infinite, NaN, or (non-zero) finite
+
+REFERENCE_PRECISIONS = ((3, 5), (8, 24), (11, 53))
+# Precisions in which we check that a rule holds
+
+FINITE_KINDS = ("min_subnormal", "1", "max_normal")
+# Kinds from fp_test_points we use as representatives of the finite
+# classes
+
+check_mpfr = True
+# Set by configure, before any workers are started
+
+
+def configure(mpfr):
+    global check_mpfr
+    check_mpfr = mpfr
+
+
+def validator_name(oracle):
+    """Name of an oracle that agreed with a rule, for the test header"""
+    if oracle == "pympf":
+        return "PyMPF (special case rule)"
+    else:
+        assert oracle == "mpfr"
+        return "%s (special case rule)" % validation_mpfr.NAME
+
+
+def classify(f):
+    if f.isNaN():
+        return "NaN"
+    elif f.isInfinite():
+        return "-inf" if f.isNegative() else "+inf"
+    elif f.isZero():
+        return "-0" if f.isNegative() else "+0"
+    else:
+        return "-finite" if f.isNegative() else "+finite"
+
+
+def build_representatives(cls, eb, sb):
+    rng = RNG(42)
+    if cls == "+finite":
+        return [fp_test_points["+" + kind](eb, sb, rng)
+                for kind in FINITE_KINDS]
+    elif cls == "-finite":
+        return [fp_test_points["-" + kind](eb, sb, rng)
+                for kind in FINITE_KINDS]
+    elif cls == "NaN":
+        return [fp_test_points["NaN"](eb, sb, rng) for _ in range(2)]
+    else:
+        return [fp_test_points[cls](eb, sb, rng)]
+
+
+representative_cache = {}
+
+
+def representatives(cls, eb, sb):
+    key = (cls, eb, sb)
+    if key not in representative_cache:
+        representative_cache[key] = build_representatives(cls, eb, sb)
+    return representative_cache[key]
+
+
+def describe(result, args):
+    # Abstracts a result so that it can be compared across different
+    # operands: either a class (for special results), a bool, one of
+    # the operands, or unspecified. Returns the set of descriptions
+    # that fit (there can be several if operands are the same).
+    if isinstance(result, Unspecified):
+        return set([("unspecified",)])
+    elif isinstance(result, bool):
+        return set([("bool", result)])
+    elif classify(result) in SPECIAL_CLASSES:
+        return set([("class", classify(result))])
+    else:
+        return set(("arg", idx)
+                   for idx, arg in enumerate(args)
+                   if result.bv == arg.bv)
+
+
+def apply_rule(rule, args):
+    # The inverse of describe
+    if rule[0] == "unspecified":
+        return Unspecified()
+    elif rule[0] == "bool":
+        return rule[1]
+    elif rule[0] == "arg":
+        return args[rule[1]].new_mpf()
+    else:
+        rv = MPF(args[0].w, args[0].p)
+        if rule[1] == "NaN":
+            rv.set_nan()
+        elif rule[1] == "+inf":
+            rv.set_infinite(0)
+        elif rule[1] == "-inf":
+            rv.set_infinite(1)
+        elif rule[1] == "+0":
+            rv.set_zero(0)
+        else:
+            rv.set_zero(1)
+        return rv
+
+
+def pympf_result(attr, rm, args):
+    try:
+        if attr.rounding:
+            return attr.function(rm, *args)
+        else:
+            return attr.function(*args)
+    except Unspecified as ex:
+        return ex
+
+
+def mpfr_agrees(fp_op, rm, rule, queries):
+    # Returns True if MPFR agrees with the rule for all queries (which
+    # must all have the same precision), False if it does not for one
+    # of them, and None if MPFR can't do this
+    if attributes.get_simple(fp_op).mpfr_function is None or \
+       rule[0] == "unspecified":
+        return None
+    try:
+        results = validation_mpfr.mpfr_batch(fp_op, rm, queries)
+    except validation.Unsupported:
+        return None
+    if any(isinstance(result, validation.Unsupported)
+           for result in results):
+        return None
+    return all(smtlib_eq(result, apply_rule(rule, args))
+               for args, result in zip(queries, results))
+
+
+def derive_rules(fp_op):
+    attr = attributes.get_simple(fp_op)
+    rules = {}
+
+    for classes in itertools.product(CLASSES, repeat=attr.arity):
+        if not any(cls in SPECIAL_CLASSES for cls in classes):
+            continue
+        for rm in (MPF.ROUNDING_MODES if attr.rounding else [None]):
+            queries = [[list(args)
+                        for args in itertools.product(
+                            *(representatives(cls, eb, sb)
+                              for cls in classes))]
+                       for eb, sb in REFERENCE_PRECISIONS]
+
+            candidates = None
+            for group in queries:
+                for args in group:
+                    fits = describe(pympf_result(attr, rm, args), args)
+                    if candidates is None:
+                        candidates = fits
+                    else:
+                        candidates &= fits
+            if not candidates:
+                continue
+            rule = min(candidates)
+
+            validators = set(["pympf"])
+            if check_mpfr:
+                mpfr_ok = [mpfr_agrees(fp_op, rm, rule, group)
+                           for group in queries]
+                if False in mpfr_ok:
+                    continue
+                elif all(mpfr_ok):
+                    validators.add("mpfr")
+
+            rules[(classes, rm)] = (rule, frozenset(validators))
+
+    return rules
+
+
+rule_table = {}
+# Rules for each operation, worked out on first use in each process
+# (only the operations a process actually tests, so this is cheap
+# except for fp.fma)
+
+
+def get_rules(fp_op):
+    if fp_op not in rule_table:
+        rule_table[fp_op] = derive_rules(fp_op)
+    return rule_table[fp_op]
+
+
+def lookup(fp_op, rm, args):
+    """Result for args by the rule table, or None if there is no rule
+
+    Returns a tuple of the result (an MPF, bool or Unspecified
+    instance) and the set of oracles ("pympf", "mpfr") that agreed
+    with the rule.
+    """
+    key = (tuple(classify(arg) for arg in args), rm)
+    rules = get_rules(fp_op)
+    if key not in rules:
+        return None
+    rule, validators = rules[key]
+    return apply_rule(rule, args), validators
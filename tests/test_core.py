@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                          FP_TEST_GENERATOR                               ##
+##                                                                          ##
+##              Copyright (C) 2020, Florian Schanda                         ##
+##                                                                          ##
+##  This file is part of FP_Test_Generator.                                 ##
+##                                                                          ##
+##  FP_Test_Generator is free software: you can redistribute it and/or      ##
+##  modify it under the terms of the GNU General Public License as          ##
+##  published by the Free Software Foundation, either version 3 of the      ##
+##  License, or (at your option) any later version.                         ##
+##                                                                          ##
+##  FP_Test_Generator is distributed in the hope that it will be useful,    ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with FP_Test_Generator. If not, see                               ##
+##  <http://www.gnu.org/licenses/>.                                         ##
+##                                                                          ##
+##############################################################################
+
+
+"""Seeds in the legacy and v2 encodings"""
+
+import hashlib
+import unittest
+
+import core
+import rng
+
+
+class Seed_Test(unittest.TestCase):
+    ENCODING = None
+
+    def setUp(self):
+        self.saved = core.seed_encoding
+        core.set_seed_encoding(self.ENCODING)
+
+    def tearDown(self):
+        core.set_seed_encoding(self.saved)
+
+    def make(self, items):
+        seed = core.Seed()
+        for key, value in items:
+            seed.set_key(key, value)
+        return seed
+
+    def check_child(self, items):
+        # Children must be the same as setting all keys at once,
+        # whatever order the keys come in
+        seed = self.make(items[:1])
+        for key, value in items[1:]:
+            seed = seed.child(key, value)
+        self.assertEqual(seed.get_digest(), self.make(items).get_digest())
+
+
+class Test_Legacy(Seed_Test):
+    ENCODING = "legacy"
+
+    def test_md5(self):
+        # The digest of the values, in the order of their keys
+        seed = self.make([("operation", "fp.add"),
+                          ("input_kind_1", "+0"),
+                          ("rounding_mode", "RNE")])
+        self.assertEqual(seed.get_base_filename(),
+                         hashlib.md5(b"+0fp.addRNE").hexdigest())
+        self.assertEqual(seed.ordered_keys(),
+                         ["input_kind_1", "operation", "rounding_mode"])
+
+    def test_update(self):
+        seed = self.make([("operation", "fp.add")])
+        seed.get_digest()
+        seed.set_key("operation", "fp.sub")
+        self.assertEqual(seed.get_base_filename(),
+                         hashlib.md5(b"fp.sub").hexdigest())
+
+    def test_collision(self):
+        # This is why there is a v2 encoding
+        self.assertEqual(self.make([("a", "xy"), ("b", "z")]).get_digest(),
+                         self.make([("a", "x"), ("b", "yz")]).get_digest())
+
+    def test_child(self):
+        self.check_child([("operation", "fp.fma"),
+                          ("input_kind_1", "+1"),
+                          ("input_kind_2", "-0"),
+                          ("rounding_mode", "RTZ"),
+                          ("z", "last")])
+
+    def test_rng(self):
+        seed = self.make([("operation", "fp.add")])
+        self.assertEqual(
+            seed.get_rng().random_bits(64),
+            rng.RNG(int(hashlib.md5(b"fp.add").hexdigest(), 16)).
+            random_bits(64))
+
+
+class Test_V2(Seed_Test):
+    ENCODING = "v2"
+
+    def test_digest(self):
+        seed = self.make([("operation", "fp.add"),
+                          ("precision", "float32")])
+        self.assertEqual(seed.get_base_filename(),
+                         "4b243817ba592afcd738fd6157d9046c")
+
+    def test_collision(self):
+        self.assertNotEqual(
+            self.make([("a", "xy"), ("b", "z")]).get_digest(),
+            self.make([("a", "x"), ("b", "yz")]).get_digest())
+
+    def test_order(self):
+        self.assertNotEqual(
+            self.make([("a", "1"), ("b", "2")]).get_digest(),
+            self.make([("b", "2"), ("a", "1")]).get_digest())
+
+    def test_not_legacy(self):
+        seed = self.make([("operation", "fp.add")])
+        self.assertNotEqual(seed.get_base_filename(),
+                            hashlib.md5(b"fp.add").hexdigest())
+
+    def test_child(self):
+        self.check_child([("operation", "fp.fma"),
+                          ("input_kind_1", "+1"),
+                          ("input_kind_2", "-0"),
+                          ("rounding_mode", "RTZ")])
+
+    def test_child_is_a_copy(self):
+        parent = self.make([("operation", "fp.add")])
+        digest = parent.get_digest()
+        parent.child("input_kind_1", "+0")
+        parent.child("input_kind_1", "-0")
+        self.assertEqual(parent.get_digest(), digest)
+        self.assertEqual(list(parent.keys), ["operation"])
+
+
+if __name__ == "__main__":
+    unittest.main()
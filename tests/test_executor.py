@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                          FP_TEST_GENERATOR                               ##
+##                                                                          ##
+##              Copyright (C) 2020, Florian Schanda                         ##
+##                                                                          ##
+##  This file is part of FP_Test_Generator.                                 ##
+##                                                                          ##
+##  FP_Test_Generator is free software: you can redistribute it and/or      ##
+##  modify it under the terms of the GNU General Public License as          ##
+##  published by the Free Software Foundation, either version 3 of the      ##
+##  License, or (at your option) any later version.                         ##
+##                                                                          ##
+##  FP_Test_Generator is distributed in the hope that it will be useful,    ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with FP_Test_Generator. If not, see                               ##
+##  <http://www.gnu.org/licenses/>.                                         ##
+##                                                                          ##
+##############################################################################
+
+
+"""Retries, timeouts and the bounded window of the executor"""
+
+import contextlib
+import io
+import os
+import tempfile
+import time
+import unittest
+
+import executor
+
+
+def identity(wp):
+    return wp
+
+
+def get_pid(_):
+    return os.getpid()
+
+
+def crash(_):
+    os._exit(3)
+
+
+def hang(_):
+    time.sleep(60)
+
+
+def fail(_):
+    raise ValueError("this task fails")
+
+
+def crash_once(marker):
+    # Crashes the first time it is called with the marker file
+    if not os.path.exists(marker):
+        with open(marker, "w"):
+            pass
+        os._exit(3)
+    return marker
+
+
+class Test_Executor(unittest.TestCase):
+    def run_pool(self, function, work_packages, **options):
+        pool = executor.Executor(**options)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = list(pool.run(function, work_packages))
+        finally:
+            pool.close()
+        return results, pool.failures
+
+    def test_results(self):
+        for prefetch in (1, 2, 4):
+            results, failures = self.run_pool(identity, range(100),
+                                              jobs=2,
+                                              prefetch=prefetch)
+            self.assertEqual(sorted(results), list(range(100)))
+            self.assertEqual(failures, [])
+
+    def test_exception(self):
+        # Not retried, it would just fail again
+        results, failures = self.run_pool(fail, ["a"], jobs=1)
+        self.assertEqual(results, [])
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(failures[0].wp, "a")
+        self.assertIn("this task fails", failures[0].reason)
+
+    def test_crash(self):
+        results, failures = self.run_pool(crash, ["a"],
+                                          jobs=1,
+                                          max_retries=2)
+        self.assertEqual(results, [])
+        self.assertEqual(len(failures), 1)
+        self.assertIn("exit code 3", failures[0].reason)
+
+    def test_timeout(self):
+        results, failures = self.run_pool(hang, ["a"],
+                                          jobs=1,
+                                          task_timeout=0.5,
+                                          max_retries=1)
+        self.assertEqual(results, [])
+        self.assertEqual(len(failures), 1)
+        self.assertIn("timeout", failures[0].reason)
+
+    def test_retry(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            markers = [os.path.join(tmp, str(n)) for n in range(4)]
+            results, failures = self.run_pool(crash_once, markers,
+                                              jobs=1,
+                                              max_retries=1)
+        # Each task crashes once, and succeeds when retried
+        self.assertEqual(sorted(results), markers)
+        self.assertEqual(failures, [])
+
+    def test_mixed(self):
+        results, failures = self.run_pool(
+            identity, [], jobs=2)
+        self.assertEqual((results, failures), ([], []))
+
+        pool = executor.Executor(jobs=2, task_timeout=0.5, max_retries=0)
+        tasks = ([(identity, n) for n in range(10)] +
+                 [(crash, "c"), (hang, "h"), (fail, "f")] +
+                 [(identity, n) for n in range(10, 20)])
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = list(pool.run_tasks(tasks))
+        finally:
+            pool.close()
+        self.assertEqual(sorted(results), list(range(20)))
+        self.assertEqual(sorted(failure.wp for failure in pool.failures),
+                         ["c", "f", "h"])
+
+    def test_worker_replacement(self):
+        results, _ = self.run_pool(get_pid, range(6),
+                                   jobs=1,
+                                   max_tasks_per_worker=2)
+        self.assertEqual(len(set(results)), 3)
+
+    def test_queued_retry(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            markers = [os.path.join(tmp, str(n)) for n in range(4)]
+            results, failures = self.run_pool(crash_once, markers,
+                                              jobs=1,
+                                              max_retries=1,
+                                              prefetch=3)
+        # The tasks queued behind a crashing one must not be lost, or
+        # count as an attempt
+        self.assertEqual(sorted(results), markers)
+        self.assertEqual(failures, [])
+
+    def test_window(self):
+        # Work packages are only taken when a worker has room
+        pulled = []
+
+        def work_packages():
+            for n in range(50):
+                pulled.append(n)
+                yield n
+
+        pool = executor.Executor(jobs=2, prefetch=3)
+        try:
+            done = 0
+            for _ in pool.run(identity, work_packages()):
+                done += 1
+                self.assertLessEqual(len(pulled) - done, 2 * 3)
+        finally:
+            pool.close()
+        self.assertEqual(done, 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                          FP_TEST_GENERATOR                               ##
+##                                                                          ##
+##              Copyright (C) 2020, Florian Schanda                         ##
+##                                                                          ##
+##  This file is part of FP_Test_Generator.                                 ##
+##                                                                          ##
+##  FP_Test_Generator is free software: you can redistribute it and/or      ##
+##  modify it under the terms of the GNU General Public License as          ##
+##  published by the Free Software Foundation, either version 3 of the      ##
+##  License, or (at your option) any later version.                         ##
+##                                                                          ##
+##  FP_Test_Generator is distributed in the hope that it will be useful,    ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with FP_Test_Generator. If not, see                               ##
+##  <http://www.gnu.org/licenses/>.                                         ##
+##                                                                          ##
+##############################################################################
+
+
+"""Hits, misses and invalidation of the oracle result cache"""
+
+import os
+import tempfile
+import unittest
+
+from mpf.floats import MPF, Unspecified
+
+import oracle_cache
+import validation
+import validation_host
+import validation_mpfr
+
+
+class Test_Encoding(unittest.TestCase):
+    def test_round_trip(self):
+        x = MPF(11, 53, 0x3ff8000000000000)
+        y = oracle_cache.decode_result(oracle_cache.encode_result(x))
+        self.assertEqual((y.w, y.p, y.bv), (x.w, x.p, x.bv))
+        for b in (True, False):
+            self.assertIs(oracle_cache.decode_result(
+                oracle_cache.encode_result(b)), b)
+        self.assertIsInstance(oracle_cache.decode_result(
+            oracle_cache.encode_result(Unspecified())), Unspecified)
+        u = oracle_cache.decode_result(oracle_cache.encode_result(
+            validation.Unsupported("no RNA here")))
+        self.assertIsInstance(u, validation.Unsupported)
+        self.assertEqual(u.reason, "no RNA here")
+
+    def test_oracle_ids(self):
+        # Changing our code for an oracle must change its id
+        self.assertIn("adapter %u" % oracle_cache.PYMPF_ADAPTER_VERSION,
+                      oracle_cache.PYMPF)
+        self.assertIn("adapter %u" % validation_mpfr.ADAPTER_VERSION,
+                      validation_mpfr.ORACLE_ID)
+        self.assertIn("adapter %u" % validation_host.ADAPTER_VERSION,
+                      validation_host.get_oracle_id())
+
+
+class Test_Cache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        oracle_cache.configure(os.path.join(self.directory.name,
+                                            "cache.db"),
+                               100)
+        self.computed = []
+
+    def tearDown(self):
+        if oracle_cache.cache is not None:
+            oracle_cache.cache.db.close()
+        oracle_cache.cache_filename = None
+        oracle_cache.cache = None
+        oracle_cache.cache_pid = None
+        self.directory.cleanup()
+
+    def results(self, oracle, keys, answers):
+        # Looks up keys, "computing" the missing ones from answers
+        def compute(todo):
+            self.computed.append([keys[idx] for idx in todo])
+            return [answers[keys[idx]] for idx in todo]
+
+        return oracle_cache.lookup_or_compute(oracle, keys, compute)
+
+    def test_hit_and_miss(self):
+        answers = {"a": True, "b": False, "c": True}
+        self.assertEqual(self.results("o", ["a", "b"], answers),
+                         [True, False])
+        self.assertEqual(self.results("o", ["b", "c", "a"], answers),
+                         [False, True, True])
+        self.assertEqual(self.results("o", ["c", "a"], answers),
+                         [True, True])
+        self.assertEqual(self.computed, [["a", "b"], ["c"]])
+
+    def test_oracle_version(self):
+        # Results of one oracle (or version of it) are not used for
+        # another
+        self.results("o adapter 1", ["a"], {"a": True})
+        self.assertEqual(self.results("o adapter 2", ["a"], {"a": False}),
+                         [False])
+        self.assertEqual(self.results("o adapter 1", ["a"], {}), [True])
+        self.assertEqual(self.computed, [["a"], ["a"]])
+
+    def test_unsupported(self):
+        # An oracle not supporting something is remembered, unless it
+        # was only a transient problem
+        answers = {"a": validation.Unsupported("no"),
+                   "b": validation.Unsupported("timed out",
+                                               transient=True)}
+        for _ in range(2):
+            results = self.results("o", ["a", "b"], answers)
+            self.assertTrue(all(isinstance(result, validation.Unsupported)
+                                for result in results))
+        self.assertEqual(self.computed, [["a", "b"], ["b"]])
+
+    def test_trim(self):
+        cache = oracle_cache.get_cache()
+        cache.max_entries = 10
+        cache.store("o", [("%u" % n, True) for n in range(25)])
+        cache.trim()
+        count = cache.db.execute("SELECT count(*) FROM results").fetchone()
+        self.assertEqual(count[0], 10)
+
+    def test_disabled(self):
+        oracle_cache.cache_filename = None
+        for _ in range(2):
+            self.assertEqual(self.results("o", ["a"], {"a": True}), [True])
+        self.assertEqual(self.computed, [["a"], ["a"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                          FP_TEST_GENERATOR                               ##
+##                                                                          ##
+##              Copyright (C) 2020, Florian Schanda                         ##
+##                                                                          ##
+##  This file is part of FP_Test_Generator.                                 ##
+##                                                                          ##
+##  FP_Test_Generator is free software: you can redistribute it and/or      ##
+##  modify it under the terms of the GNU General Public License as          ##
+##  published by the Free Software Foundation, either version 3 of the      ##
+##  License, or (at your option) any later version.                         ##
+##                                                                          ##
+##  FP_Test_Generator is distributed in the hope that it will be useful,    ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with FP_Test_Generator. If not, see                               ##
+##  <http://www.gnu.org/licenses/>.                                         ##
+##                                                                          ##
+##############################################################################
+
+
+"""Cost model and ordering of the plan"""
+
+import contextlib
+import io
+import unittest
+
+import planner
+import tests_basic
+
+
+class Test_Cost(unittest.TestCase):
+    def test_op_cost(self):
+        self.assertGreater(planner.op_cost("fp.fma", 11, 53),
+                           planner.op_cost("fp.add", 11, 53))
+        self.assertGreater(planner.op_cost("fp.add", 11, 53),
+                           planner.op_cost("fp.roundToIntegral", 11, 53))
+        self.assertGreater(planner.op_cost("fp.roundToIntegral", 11, 53),
+                           planner.op_cost("fp.isNaN", 11, 53))
+        self.assertEqual(planner.op_cost("fp.isNaN", 11, 53),
+                         planner.op_cost("fp.lt", 11, 53))
+
+    def test_precision_cost(self):
+        self.assertAlmostEqual(planner.precision_cost(11, 53), 1.0,
+                               places=1)
+        self.assertGreater(planner.precision_cost(15, 113),
+                           planner.precision_cost(15, 64))
+        self.assertGreater(planner.precision_cost(15, 64),
+                           planner.precision_cost(11, 53))
+        self.assertGreater(planner.precision_cost(11, 53),
+                           planner.precision_cost(8, 24))
+
+
+class Test_Plan(unittest.TestCase):
+    def test_longest_first(self):
+        plan = planner.Plan()
+        plan.add_all_basic(True)
+        ordered = plan.ordered()
+        self.assertEqual(len(ordered), len(plan.categories))
+        self.assertEqual(ordered[0].title, "fp.fma (float128)")
+        self.assertEqual([category.cost for category in ordered],
+                         sorted((category.cost for category in ordered),
+                                reverse=True))
+
+        # The cheap predicates come last
+        cheapest = tests_basic.GROUP_SIZE * (
+            planner.OVERHEAD +
+            planner.DEFAULT_OP_COST * planner.precision_cost(3, 5))
+        self.assertAlmostEqual(ordered[-1].cost, cheapest)
+        self.assertNotIn(ordered[-1].title.split()[0], planner.OP_COST)
+
+    def test_stable(self):
+        plan = planner.Plan()
+        for title, cost in (("a", 1.0), ("b", 2.0), ("c", 1.0),
+                            ("d", 2.0), ("e", 1.0)):
+            plan.categories.append(
+                planner.Category(title, None, list, cost))
+        self.assertEqual([category.title for category in plan.ordered()],
+                         ["b", "d", "a", "c", "e"])
+
+    def test_lazy(self):
+        built = []
+
+        def build_wp(title):
+            def build():
+                built.append(title)
+                return [title + "1", title + "2"]
+            return build
+
+        plan = planner.Plan()
+        plan.categories.append(
+            planner.Category("cheap", len, build_wp("cheap"), 1.0))
+        plan.categories.append(
+            planner.Category("expensive", len, build_wp("expensive"), 2.0))
+
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            tasks = plan.tasks()
+            self.assertEqual(built, [])
+            self.assertEqual([next(tasks), next(tasks)],
+                             [(len, "expensive1"), (len, "expensive2")])
+            self.assertEqual(built, ["expensive"])
+            self.assertEqual(list(tasks), [(len, "cheap1"), (len, "cheap2")])
+            self.assertEqual(built, ["expensive", "cheap"])
+        self.assertEqual(out.getvalue(),
+                         "Generating expensive\nGenerating cheap\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                          FP_TEST_GENERATOR                               ##
+##                                                                          ##
+##              Copyright (C) 2020, Florian Schanda                         ##
+##                                                                          ##
+##  This file is part of FP_Test_Generator.                                 ##
+##                                                                          ##
+##  FP_Test_Generator is free software: you can redistribute it and/or      ##
+##  modify it under the terms of the GNU General Public License as          ##
+##  published by the Free Software Foundation, either version 3 of the      ##
+##  License, or (at your option) any later version.                         ##
+##                                                                          ##
+##  FP_Test_Generator is distributed in the hope that it will be useful,    ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with FP_Test_Generator. If not, see                               ##
+##  <http://www.gnu.org/licenses/>.                                         ##
+##                                                                          ##
+##############################################################################
+
+
+"""The random number streams
+
+The mersenne twister must produce exactly the same numbers as the
+original (one word at a time) implementation, otherwise we can't
+reproduce published suites. The expected values below were produced
+by that implementation.
+"""
+
+import contextlib
+import io
+import unittest
+
+import rng
+
+
+class Test_Mersenne_Twister(unittest.TestCase):
+    def check_stream(self):
+        r = rng.RNG(12345)
+        self.assertEqual([r.random_bits(64) for _ in range(3)],
+                         [17148390041070939621,
+                          5836098993699293313,
+                          3392703261234277801])
+        self.assertEqual([r.random_int(0, 10 ** 30) for _ in range(3)],
+                         [518621922367008393621991697570,
+                          509885200007681246676808208080,
+                          656000676843503637636754115898])
+        self.assertEqual([r.random_bool() for _ in range(8)],
+                         [True, False, False, False, True, True, True, False])
+        self.assertEqual([r.random_int32(-5, 70000) for _ in range(3)],
+                         [35936, 35811, 62707])
+        self.assertEqual([r.random() for _ in range(2)],
+                         [3467278599, 2819264555])
+
+        # Seeds are usually the digest of a test's seed
+        r = rng.RNG(0x0123456789abcdef0123456789abcdef)
+        self.assertEqual([r.random_bits(113) for _ in range(2)],
+                         [7640602761088422715649520839464410,
+                          8203255467400442591002606421163563])
+        self.assertEqual(r.random_int(3, 17), 7)
+
+    def test_stream(self):
+        self.check_stream()
+
+    def test_stream_without_numpy(self):
+        saved = rng.numpy
+        rng.numpy = None
+        try:
+            self.check_stream()
+        finally:
+            rng.numpy = saved
+
+    def test_reference(self):
+        # The reference output of mt19937ar
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(rng.sanity_test(), 0)
+
+    def test_reset(self):
+        a = rng.RNG(1)
+        b = rng.RNG(2)
+        b.random_bits(1000)
+        b.reset(1)
+        self.assertEqual([a.random() for _ in range(1000)],
+                         [b.random() for _ in range(1000)])
+
+
+class Test_Counter_RNG(unittest.TestCase):
+    def test_stream(self):
+        r = rng.Counter_RNG(bytes(range(16)))
+        self.assertEqual([r.random_bits(64) for _ in range(2)],
+                         [7802538219882934621, 4006987252420878047])
+
+    def test_word(self):
+        # Any word can be computed on its own
+        r = rng.Counter_RNG(b"key")
+        words = [r.random() for _ in range(40)]
+        self.assertEqual(words, [r.word(n) for n in range(40)])
+
+    def test_reset(self):
+        r = rng.Counter_RNG(b"a")
+        words = [r.random() for _ in range(40)]
+        r.reset(b"a")
+        self.assertEqual([r.random() for _ in range(40)], words)
+
+    def test_keys(self):
+        a = rng.Counter_RNG(b"a")
+        b = rng.Counter_RNG(b"b")
+        self.assertNotEqual([a.random() for _ in range(4)],
+                            [b.random() for _ in range(4)])
+
+
+if __name__ == "__main__":
+    unittest.main()
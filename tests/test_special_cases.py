@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                          FP_TEST_GENERATOR                               ##
+##                                                                          ##
+##              Copyright (C) 2020, Florian Schanda                         ##
+##                                                                          ##
+##  This file is part of FP_Test_Generator.                                 ##
+##                                                                          ##
+##  FP_Test_Generator is free software: you can redistribute it and/or      ##
+##  modify it under the terms of the GNU General Public License as          ##
+##  published by the Free Software Foundation, either version 3 of the      ##
+##  License, or (at your option) any later version.                         ##
+##                                                                          ##
+##  FP_Test_Generator is distributed in the hope that it will be useful,    ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with FP_Test_Generator. If not, see                               ##
+##  <http://www.gnu.org/licenses/>.                                         ##
+##                                                                          ##
+##############################################################################
+
+
+"""Rules for special operands"""
+
+import itertools
+import unittest
+
+from mpf.floats import MPF, Unspecified, smtlib_eq
+
+import attributes
+import special_cases
+import validation
+import validation_mpfr
+
+from float_vectors import fp_test_points
+from rng import RNG
+
+
+def value(kind, eb=11, sb=53):
+    return fp_test_points[kind](eb, sb, RNG(1))
+
+
+class Rules_Test(unittest.TestCase):
+    def setUp(self):
+        self.saved_rules = dict(special_cases.rule_table)
+        self.saved_check_mpfr = special_cases.check_mpfr
+        special_cases.rule_table.clear()
+
+    def tearDown(self):
+        special_cases.rule_table.clear()
+        special_cases.rule_table.update(self.saved_rules)
+        special_cases.configure(self.saved_check_mpfr)
+
+
+class Test_Rules(Rules_Test):
+    def test_nan(self):
+        result, oracles = special_cases.lookup(
+            "fp.add", "RNE", [value("NaN"), value("+1")])
+        self.assertTrue(result.isNaN())
+        self.assertEqual(oracles, frozenset(["pympf", "mpfr"]))
+
+    def test_inf(self):
+        result, _ = special_cases.lookup(
+            "fp.add", "RTZ", [value("+inf"), value("-inf")])
+        self.assertTrue(result.isNaN())
+        result, _ = special_cases.lookup(
+            "fp.mul", "RNE", [value("-inf"), value("+max_normal")])
+        self.assertTrue(result.isInfinite() and result.isNegative())
+
+    def test_zero(self):
+        # x + -0 is x, whatever x is
+        x = value("+rnd_normal_large")
+        result, _ = special_cases.lookup("fp.add", "RNE",
+                                         [x, value("-0")])
+        self.assertEqual(result.bv, x.bv)
+
+        # The sign of +0 + -0 depends on the rounding mode
+        result, _ = special_cases.lookup(
+            "fp.add", "RTN", [value("+0"), value("-0")])
+        self.assertTrue(result.isZero() and result.isNegative())
+        result, _ = special_cases.lookup(
+            "fp.add", "RNE", [value("+0"), value("-0")])
+        self.assertTrue(result.isZero() and not result.isNegative())
+
+    def test_unspecified(self):
+        result, oracles = special_cases.lookup(
+            "fp.min", None, [value("+0"), value("-0")])
+        self.assertIsInstance(result, Unspecified)
+        self.assertEqual(oracles, frozenset(["pympf"]))
+
+    def test_no_rule(self):
+        # Finite operands are not special
+        self.assertIsNone(special_cases.lookup(
+            "fp.add", "RNE", [value("+1"), value("-1")]))
+
+    def test_predicate(self):
+        result, _ = special_cases.lookup("fp.isNaN", None, [value("NaN")])
+        self.assertIs(result, True)
+
+    def test_other_precisions(self):
+        # The rules are derived in a few precisions, but must hold for
+        # all of them
+        kinds = ["+0", "-0", "+inf", "-inf", "NaN",
+                 "+min_subnormal", "-max_subnormal", "+1", "-max_normal"]
+        for fp_op in ("fp.add", "fp.mul", "fp.div", "fp.rem", "fp.min",
+                      "fp.leq", "smtlib.eq"):
+            attr = attributes.get_simple(fp_op)
+            for eb, sb in ((5, 11), (15, 64), (15, 113)):
+                for combination in itertools.product(kinds,
+                                                     repeat=attr.arity):
+                    args = [value(kind, eb, sb) for kind in combination]
+                    for rm in (MPF.ROUNDING_MODES if attr.rounding
+                               else [None]):
+                        rule = special_cases.lookup(fp_op, rm, args)
+                        if rule is None:
+                            continue
+                        expected = special_cases.pympf_result(attr, rm,
+                                                              args)
+                        if isinstance(expected, Unspecified):
+                            self.assertIsInstance(rule[0], Unspecified)
+                        elif isinstance(expected, bool):
+                            self.assertIs(rule[0], expected)
+                        else:
+                            self.assertTrue(
+                                smtlib_eq(rule[0], expected),
+                                "%s %s %s" % (fp_op, rm, combination))
+
+
+class Test_Configuration(Rules_Test):
+    def test_without_mpfr(self):
+        special_cases.configure(False)
+        for (_, _), (_, oracles) in special_cases.get_rules(
+                "fp.add").items():
+            self.assertEqual(oracles, frozenset(["pympf"]))
+
+    def test_mpfr_unsupported(self):
+        # If MPFR can't do it we still have the rules, but only PyMPF
+        # agreed
+        def unsupported(fp_op, rm, queries):
+            raise validation.Unsupported("not today")
+
+        saved = validation_mpfr.mpfr_batch
+        validation_mpfr.mpfr_batch = unsupported
+        try:
+            rules = special_cases.get_rules("fp.min")
+        finally:
+            validation_mpfr.mpfr_batch = saved
+        self.assertTrue(rules)
+        for (_, _), (_, oracles) in rules.items():
+            self.assertEqual(oracles, frozenset(["pympf"]))
+
+    def test_mpfr_error(self):
+        # Anything else is a bug, and must not be hidden
+        def broken(fp_op, rm, queries):
+            raise AttributeError("broken")
+
+        saved = validation_mpfr.mpfr_batch
+        validation_mpfr.mpfr_batch = broken
+        try:
+            with self.assertRaises(AttributeError):
+                special_cases.get_rules("fp.min")
+        finally:
+            validation_mpfr.mpfr_batch = saved
+
+    def test_validator_names(self):
+        self.assertEqual(special_cases.validator_name("pympf"),
+                         "PyMPF (special case rule)")
+        self.assertEqual(special_cases.validator_name("mpfr"),
+                         "%s (special case rule)" % validation_mpfr.NAME)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                          FP_TEST_GENERATOR                               ##
+##                                                                          ##
+##              Copyright (C) 2020, Florian Schanda                         ##
+##                                                                          ##
+##  This file is part of FP_Test_Generator.                                 ##
+##                                                                          ##
+##  FP_Test_Generator is free software: you can redistribute it and/or      ##
+##  modify it under the terms of the GNU General Public License as          ##
+##  published by the Free Software Foundation, either version 3 of the      ##
+##  License, or (at your option) any later version.                         ##
+##                                                                          ##
+##  FP_Test_Generator is distributed in the hope that it will be useful,    ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with FP_Test_Generator. If not, see                               ##
+##  <http://www.gnu.org/licenses/>.                                         ##
+##                                                                          ##
+##############################################################################
+
+
+"""Operands of the exhaustive tests"""
+
+import unittest
+
+from mpf.floats import MPF
+
+import tests_exhaustive
+
+
+def all_operands(eb, sb):
+    # Every bit pattern, except that there is only one NaN
+    nan = MPF(eb, sb)
+    nan.set_nan()
+    return [bv for bv in range(2 ** (eb + sb))
+            if bv == nan.bv or not MPF(eb, sb, bv).isNaN()]
+
+
+class Test_Operands(unittest.TestCase):
+    def test_operands(self):
+        for eb, sb in ((2, 3), (3, 4), (3, 5), (4, 4), (5, 5)):
+            expected = all_operands(eb, sb)
+            self.assertEqual(tests_exhaustive.number_of_operands(eb, sb),
+                             len(expected))
+            self.assertEqual([tests_exhaustive.get_operand(eb, sb, n).bv
+                              for n in range(len(expected))],
+                             expected)
+
+    def test_args(self):
+        operands = all_operands(3, 5)
+        self.assertEqual(tests_exhaustive.number_of_checks("fp.add", 3, 5),
+                         len(operands) ** 2)
+        n = 5 * len(operands) + 7
+        self.assertEqual([arg.bv for arg in
+                          tests_exhaustive.get_args("fp.add", 3, 5, n)],
+                         [operands[5], operands[7]])
+
+    def test_equality(self):
+        args = [MPF(3, 5, 0), MPF(3, 5, 0)]
+        self.assertEqual(
+            tests_exhaustive.check_term("smtlib.eq", None, args, True),
+            "(= (= (_ +zero 3 5) (_ +zero 3 5)) true)")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                          FP_TEST_GENERATOR                               ##
+##                                                                          ##
+##              Copyright (C) 2020, Florian Schanda                         ##
+##                                                                          ##
+##  This file is part of FP_Test_Generator.                                 ##
+##                                                                          ##
+##  FP_Test_Generator is free software: you can redistribute it and/or      ##
+##  modify it under the terms of the GNU General Public License as          ##
+##  published by the Free Software Foundation, either version 3 of the      ##
+##  License, or (at your option) any later version.                         ##
+##                                                                          ##
+##  FP_Test_Generator is distributed in the hope that it will be useful,    ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with FP_Test_Generator. If not, see                               ##
+##  <http://www.gnu.org/licenses/>.                                         ##
+##                                                                          ##
+##############################################################################
+
+
+"""Building and reading the truth tables of tiny formats"""
+
+import json
+import os
+import tempfile
+import unittest
+
+from mpf.floats import MPF, Unspecified, smtlib_eq
+
+import attributes
+import oracle_cache
+import truth_tables
+
+
+def all_args(fp_op, eb, sb):
+    values = [MPF(eb, sb, bv) for bv in range(2 ** (eb + sb))]
+    if attributes.get_simple(fp_op).arity == 1:
+        return [[x] for x in values]
+    else:
+        return [[x, y] for x in values for y in values]
+
+
+@unittest.skipIf(truth_tables.numpy is None, "numpy is not installed")
+class Test_Tables(unittest.TestCase):
+    def test_wide_results(self):
+        # Unary operations on 16 bit formats use all 16 bits of the
+        # results, so they must not be confused with the marker
+        table = truth_tables.compute_table("fp.neg", 5, 11, None)
+        self.assertEqual(table.dtype, truth_tables.numpy.dtype("uint32"))
+        self.assertEqual(len(table), 2 ** 16)
+        self.assertNotIn(truth_tables.UNSPECIFIED, table)
+        self.assertEqual(table[0x7bff], 0xfbff)
+        self.assertEqual(table[0xffff], 0xffff)
+        nan = truth_tables.decode("fp.neg", 5, 11, table[0xffff])
+        self.assertTrue(nan.isNaN())
+
+    def test_unspecified(self):
+        # min(+0, -0) is either of them
+        table = truth_tables.compute_table("fp.min", 2, 3, None)
+        plus_zero, minus_zero = MPF(2, 3, 0), MPF(2, 3, 0x10)
+        for args in ([plus_zero, minus_zero], [minus_zero, plus_zero]):
+            value = table[truth_tables.table_index(args)]
+            self.assertEqual(value, truth_tables.UNSPECIFIED)
+            self.assertIsInstance(truth_tables.decode("fp.min", 2, 3, value),
+                                  Unspecified)
+        value = table[truth_tables.table_index([plus_zero, plus_zero])]
+        self.assertEqual(truth_tables.decode("fp.min", 2, 3, value).bv, 0)
+
+
+@unittest.skipIf(truth_tables.numpy is None, "numpy is not installed")
+class Test_Lookup(unittest.TestCase):
+    OPERATIONS = ("fp.add", "fp.sqrt", "fp.lt", "fp.min")
+
+    def setUp(self):
+        self.saved = (truth_tables.TABLE_DIR, truth_tables.MANIFEST)
+        self.directory = tempfile.TemporaryDirectory()
+        truth_tables.TABLE_DIR = self.directory.name
+        truth_tables.MANIFEST = os.path.join(self.directory.name,
+                                             "manifest.json")
+        truth_tables.tables = None
+        truth_tables.open_tables.clear()
+
+        self.names = []
+        for fp_op in Test_Lookup.OPERATIONS:
+            for rm in truth_tables.rounding_modes(fp_op):
+                name = truth_tables.table_name(fp_op, 2, 3, rm)
+                truth_tables.numpy.save(
+                    os.path.join(self.directory.name, name),
+                    truth_tables.compute_table(fp_op, 2, 3, rm))
+                self.names.append(name)
+
+    def tearDown(self):
+        truth_tables.TABLE_DIR, truth_tables.MANIFEST = self.saved
+        truth_tables.tables = None
+        truth_tables.open_tables.clear()
+        self.directory.cleanup()
+
+    def write_manifest(self, format_version):
+        with open(truth_tables.MANIFEST, "w") as fd:
+            json.dump({"pympf"  : oracle_cache.get_pympf_version(),
+                       "format" : format_version,
+                       "tables" : self.names},
+                      fd)
+
+    def test_lookup(self):
+        self.write_manifest(truth_tables.FORMAT_VERSION)
+        self.assertFalse(truth_tables.has_tables("fp.mul", 2, 3))
+        for fp_op in Test_Lookup.OPERATIONS:
+            self.assertTrue(truth_tables.has_tables(fp_op, 2, 3))
+            attr = attributes.get_simple(fp_op)
+            queries = all_args(fp_op, 2, 3)
+            for rm in truth_tables.rounding_modes(fp_op):
+                results = truth_tables.lookup_batch(fp_op, rm, queries)
+                for args, result in zip(queries, results):
+                    try:
+                        if rm is None:
+                            expected = attr.function(*args)
+                        else:
+                            expected = attr.function(rm, *args)
+                    except Unspecified:
+                        self.assertIsInstance(result, Unspecified)
+                        continue
+                    if isinstance(expected, bool):
+                        self.assertIs(result, expected)
+                    else:
+                        self.assertTrue(smtlib_eq(result, expected))
+
+    def test_old_format(self):
+        # Tables in the old format are ignored
+        self.write_manifest(truth_tables.FORMAT_VERSION - 1)
+        self.assertFalse(truth_tables.has_tables("fp.add", 2, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                          FP_TEST_GENERATOR                               ##
+##                                                                          ##
+##              Copyright (C) 2020, Florian Schanda                         ##
+##                                                                          ##
+##  This file is part of FP_Test_Generator.                                 ##
+##                                                                          ##
+##  FP_Test_Generator is free software: you can redistribute it and/or      ##
+##  modify it under the terms of the GNU General Public License as          ##
+##  published by the Free Software Foundation, either version 3 of the      ##
+##  License, or (at your option) any later version.                         ##
+##                                                                          ##
+##  FP_Test_Generator is distributed in the hope that it will be useful,    ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with FP_Test_Generator. If not, see                               ##
+##  <http://www.gnu.org/licenses/>.                                         ##
+##                                                                          ##
+##############################################################################
+
+
+"""Packed values and the binary protocol of the host oracle"""
+
+import unittest
+
+from mpf.floats import MPF, RM_RNE, RM_RNA, RM_RTZ, fp_add, fp_from_float, \
+    smtlib_eq
+
+import validation
+import validation_host
+
+from float_vectors import fp_test_points
+from rng import RNG
+
+
+HOST_PRECISIONS = ((8, 24), (11, 53), (15, 64), (15, 113))
+
+OP_PRECISIONS = ((8, 24), (11, 53), (15, 64))
+# __float128 is only built for conversions
+
+
+def value(kind, eb, sb, seed=1):
+    return fp_test_points[kind](eb, sb, RNG(seed))
+
+
+def describe(f):
+    return "%s(%u, %u, 0x%x)" % (type(f).__name__, f.w, f.p, f.bv)
+
+
+class Test_Bytes(unittest.TestCase):
+    def test_round_trip(self):
+        for eb, sb in HOST_PRECISIONS:
+            width = validation_host.WIDTH[
+                validation_host.get_precision(MPF(eb, sb))]
+            for kind in fp_test_points:
+                x = value(kind, eb, sb)
+                data = validation_host.to_bytes(x)
+                self.assertEqual(len(data), width)
+                self.assertEqual(validation_host.from_bytes(x, data).bv,
+                                 x.bv, "%s %s" % (kind, describe(x)))
+
+    def test_explicit_bit(self):
+        # The x87 format has an explicit integer bit, which is set iff
+        # the exponent is not zero
+        def packed(kind):
+            return int.from_bytes(
+                validation_host.to_bytes(value(kind, 15, 64)), "little")
+
+        self.assertEqual(packed("+1"), (0x3fff << 64) | (1 << 63))
+        self.assertEqual(packed("-1"), (0xbfff << 64) | (1 << 63))
+        self.assertEqual(packed("+min_normal"), (1 << 64) | (1 << 63))
+        self.assertEqual(packed("+inf"), (0x7fff << 64) | (1 << 63))
+        self.assertEqual(packed("+0"), 0)
+        self.assertEqual(packed("-0"), 0x8000 << 64)
+        self.assertEqual(packed("+min_subnormal"), 1)
+        self.assertEqual(packed("+max_subnormal"), (1 << 63) - 1)
+        self.assertEqual(packed("NaN") >> 63, (0xffff << 1) | 1)
+
+    def test_unsupported_precision(self):
+        with self.assertRaises(validation.Unsupported):
+            validation_host.get_precision(MPF(5, 11))
+
+
+@unittest.skipUnless(validation_host.get_build(),
+                     "host validation is not built")
+class Test_Protocol(unittest.TestCase):
+    def setUp(self):
+        self.saved_library = validation_host.host_library
+
+    def tearDown(self):
+        validation_host.close_validators()
+        validation_host.host_library = self.saved_library
+
+    def queries(self, eb, sb, count, rm):
+        kinds = sorted(fp_test_points)
+        return [([value(kinds[n % len(kinds)], eb, sb, n),
+                  value(kinds[(n // len(kinds)) % len(kinds)], eb, sb, n)],
+                 rm)
+                for n in range(count)]
+
+    def test_validators(self):
+        # Without the library we go through the validators; use more
+        # queries than fit into one window
+        validation_host.host_library = False
+        count = validation_host.Validator_Process.WINDOW + 100
+        for eb, sb in OP_PRECISIONS:
+            queries = self.queries(eb, sb, count, RM_RTZ)
+            results = validation_host.call_validator_batch("fp.add",
+                                                           queries)
+            self.assertEqual(len(results), count)
+            for (args, rm), result in zip(queries, results):
+                expected = fp_add(rm, *args)
+                self.assertTrue(smtlib_eq(result, expected),
+                                "%s + %s: %s, expected %s" %
+                                (describe(args[0]), describe(args[1]),
+                                 describe(result), describe(expected)))
+
+    def test_unsupported(self):
+        # The host can't do RNA, or arithmetic in __float128, which
+        # the validator answers with a status of 0
+        validation_host.host_library = False
+        for eb, sb, rm in ((11, 53, RM_RNA), (15, 113, RM_RNE)):
+            queries = self.queries(eb, sb, 3, rm)
+            for result in validation_host.call_validator_batch("fp.add",
+                                                               queries):
+                self.assertIsInstance(result, validation.Unsupported)
+            with self.assertRaises(validation.Unsupported):
+                validation_host.host_add(rm, *queries[0][0])
+
+    def test_conversion(self):
+        validation_host.host_library = False
+        for (eb, sb), (target_eb, target_sb) in (((11, 53), (8, 24)),
+                                                 ((15, 113), (15, 64)),
+                                                 ((8, 24), (15, 113))):
+            for kind in fp_test_points:
+                x = value(kind, eb, sb)
+                result = validation_host.host_to_fp(target_eb, target_sb,
+                                                    RM_RTZ, x)
+                expected = fp_from_float(target_eb, target_sb, RM_RTZ, x)
+                self.assertEqual((result.w, result.p),
+                                 (target_eb, target_sb))
+                self.assertTrue(smtlib_eq(result, expected),
+                                "%s: %s, expected %s" %
+                                (kind, describe(result),
+                                 describe(expected)))
+
+    def test_library(self):
+        # The library and the validators are built from the same
+        # kernels, so they must give the same answers
+        if not validation_host.get_library():
+            self.skipTest("host library is not built")
+        for eb, sb in OP_PRECISIONS:
+            queries = (self.queries(eb, sb, 100, RM_RNE) +
+                       self.queries(eb, sb, 100, RM_RNA))
+            from_library = validation_host.call_validator_batch("fp.add",
+                                                                queries)
+            validation_host.host_library = False
+            try:
+                from_validator = validation_host.call_validator_batch(
+                    "fp.add", queries)
+            finally:
+                validation_host.host_library = self.saved_library
+            for a, b in zip(from_library, from_validator):
+                if isinstance(a, validation.Unsupported):
+                    self.assertIsInstance(b, validation.Unsupported)
+                else:
+                    self.assertEqual(a.bv, b.bv)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                          FP_TEST_GENERATOR                               ##
+##                                                                          ##
+##              Copyright (C) 2020, Florian Schanda                         ##
+##                                                                          ##
+##  This file is part of FP_Test_Generator.                                 ##
+##                                                                          ##
+##  FP_Test_Generator is free software: you can redistribute it and/or      ##
+##  modify it under the terms of the GNU General Public License as          ##
+##  published by the Free Software Foundation, either version 3 of the      ##
+##  License, or (at your option) any later version.                         ##
+##                                                                          ##
+##  FP_Test_Generator is distributed in the hope that it will be useful,    ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with FP_Test_Generator. If not, see                               ##
+##  <http://www.gnu.org/licenses/>.                                         ##
+##                                                                          ##
+##############################################################################
+
+
+"""MPFR's emulation of RNA against PyMPF"""
+
+import random
+import unittest
+
+from mpf.floats import MPF, fp_add, fp_sub, fp_mul, fp_div, fp_fma, \
+    fp_sqrt, fp_min, fp_max, smtlib_eq
+
+import validation
+import validation_mpfr
+
+
+PRECISIONS = ((3, 5), (4, 4), (5, 11), (8, 24), (11, 53), (15, 113))
+
+OPERATIONS = {
+    "fp.add"  : (fp_add, 2),
+    "fp.sub"  : (fp_sub, 2),
+    "fp.mul"  : (fp_mul, 2),
+    "fp.div"  : (fp_div, 2),
+    "fp.fma"  : (fp_fma, 3),
+    "fp.sqrt" : (fp_sqrt, 1),
+}
+
+CHECKS = 400
+# Number of random checks for each operation
+
+
+def random_operand(r, eb, sb):
+    # Biased towards extreme exponents (where rounding may overflow or
+    # become subnormal) and short significands (to get ties)
+    t = sb - 1
+    sign = r.getrandbits(1) << (eb + t)
+    choice = r.random()
+    if choice < 0.3:
+        exponent = r.choice([0, 1, 2, 2 ** eb - 3, 2 ** eb - 2,
+                             2 ** (eb - 1) - 1])
+        significand = r.getrandbits(t)
+    elif choice < 0.5:
+        exponent = r.randrange(2 ** eb - 1)
+        significand = r.getrandbits(2) << max(0, t - 2)
+    else:
+        return MPF(eb, sb, r.getrandbits(eb + sb))
+    return MPF(eb, sb, sign | (exponent << t) | significand)
+
+
+def describe(value):
+    # MPF's str doesn't work for the larger formats
+    if isinstance(value, MPF):
+        return "MPF(%u, %u, 0x%x)" % (value.w, value.p, value.bv)
+    else:
+        return str(value)
+
+
+class Test_RNA(unittest.TestCase):
+    def check_operation(self, fp_op):
+        function, arity = OPERATIONS[fp_op]
+        r = random.Random(fp_op)
+        for _ in range(CHECKS):
+            eb, sb = r.choice(PRECISIONS)
+            args = [random_operand(r, eb, sb) for _ in range(arity)]
+            expected = function("RNA", *args)
+            result = validation_mpfr.mpfr_batch(fp_op, "RNA", [args])[0]
+            if not smtlib_eq(result, expected):
+                self.fail("%s %s: MPFR %s, PyMPF %s" %
+                          (fp_op,
+                           ", ".join(map(describe, args)),
+                           describe(result),
+                           describe(expected)))
+
+    def test_add(self):
+        self.check_operation("fp.add")
+
+    def test_sub(self):
+        self.check_operation("fp.sub")
+
+    def test_mul(self):
+        self.check_operation("fp.mul")
+
+    def test_div(self):
+        self.check_operation("fp.div")
+
+    def test_fma(self):
+        self.check_operation("fp.fma")
+
+    def test_sqrt(self):
+        self.check_operation("fp.sqrt")
+
+    def test_to_fp(self):
+        r = random.Random("to_fp")
+        for _ in range(CHECKS):
+            eb, sb = r.choice(PRECISIONS)
+            target_eb, target_sb = r.choice(PRECISIONS)
+            arg = random_operand(r, eb, sb)
+            if not arg.isFinite() or arg.isZero():
+                continue
+            expected = MPF(target_eb, target_sb)
+            expected.from_rational("RNA", arg.to_rational())
+            result = validation_mpfr.mpfr_to_fp(target_eb, target_sb,
+                                                "RNA", arg)
+            if not smtlib_eq(result, expected):
+                self.fail("to_fp %s: MPFR %s, PyMPF %s" %
+                          (describe(arg),
+                           describe(result),
+                           describe(expected)))
+
+
+class Test_Min_Max(unittest.TestCase):
+    def test_min_max(self):
+        r = random.Random("min_max")
+        for fp_op, function in (("fp.min", fp_min), ("fp.max", fp_max)):
+            for _ in range(CHECKS):
+                eb, sb = r.choice(PRECISIONS)
+                args = [random_operand(r, eb, sb) for _ in range(2)]
+                result = validation_mpfr.mpfr_batch(fp_op, None, [args])[0]
+                if args[0].isZero() and args[1].isZero() and \
+                   args[0].isNegative() != args[1].isNegative():
+                    self.assertIsInstance(result, validation.Unsupported)
+                elif not smtlib_eq(result, function(*args)):
+                    self.fail("%s %s: MPFR %s, PyMPF %s" %
+                              (fp_op,
+                               ", ".join(map(describe, args)),
+                               describe(result),
+                               describe(function(*args))))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                          FP_TEST_GENERATOR                               ##
+##                                                                          ##
+##              Copyright (C) 2020, Florian Schanda                         ##
+##                                                                          ##
+##  This file is part of FP_Test_Generator.                                 ##
+##                                                                          ##
+##  FP_Test_Generator is free software: you can redistribute it and/or      ##
+##  modify it under the terms of the GNU General Public License as          ##
+##  published by the Free Software Foundation, either version 3 of the      ##
+##  License, or (at your option) any later version.                         ##
+##                                                                          ##
+##  FP_Test_Generator is distributed in the hope that it will be useful,    ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with FP_Test_Generator. If not, see                               ##
+##  <http://www.gnu.org/licenses/>.                                         ##
+##                                                                          ##
+##############################################################################
+
+
+"""Comparisons and classification in NumPy against PyMPF"""
+
+import itertools
+import unittest
+
+from mpf.floats import MPF
+
+import attributes
+import validation
+import validation_numpy
+
+from float_vectors import fp_test_points
+from rng import RNG
+
+
+def value(kind, eb, sb):
+    return fp_test_points[kind](eb, sb, RNG(1))
+
+
+def other_nan(eb, sb):
+    # A NaN with a different bit pattern from the one PyMPF builds
+    return MPF(eb, sb, ((1 << eb) - 1) << (sb - 1) | 1)
+
+
+@unittest.skipIf(validation_numpy.numpy is None, "numpy is not installed")
+class Test_Predicates(unittest.TestCase):
+    def test_against_pympf(self):
+        for fp_op, attr in attributes.op_attr.items():
+            if attr.numpy_function is None:
+                continue
+            for eb, sb in validation_numpy.DTYPES:
+                values = [value(kind, eb, sb)
+                          for kind in sorted(fp_test_points)]
+                values.append(other_nan(eb, sb))
+                queries = [list(args) for args in
+                           itertools.product(values, repeat=attr.arity)]
+                for args, result in zip(queries,
+                                        attr.numpy_function(queries)):
+                    self.assertIs(result, attr.function(*args),
+                                  "%s %s" % (fp_op,
+                                             ", ".join("0x%x" % arg.bv
+                                                       for arg in args)))
+
+    def test_nan(self):
+        # All NaNs are the same for SMT-LIB's equality, but fp.eq
+        # never holds for NaN
+        for eb, sb in validation_numpy.DTYPES:
+            nan = value("NaN", eb, sb)
+            queries = [[nan, nan],
+                       [nan, other_nan(eb, sb)],
+                       [other_nan(eb, sb), nan],
+                       [nan, value("+inf", eb, sb)]]
+            self.assertEqual(validation_numpy.numpy_smtlib_eq(queries),
+                             [True, True, True, False])
+            self.assertEqual(validation_numpy.numpy_eq(queries),
+                             [False, False, False, False])
+
+    def test_zero(self):
+        # +0 and -0 are equal for fp.eq, but not for SMT-LIB
+        queries = [[value("+0", 8, 24), value("-0", 8, 24)]]
+        self.assertEqual(validation_numpy.numpy_smtlib_eq(queries),
+                         [False])
+        self.assertEqual(validation_numpy.numpy_eq(queries), [True])
+
+    def test_unsupported(self):
+        for eb, sb in ((15, 64), (15, 113), (3, 5)):
+            with self.assertRaises(validation.Unsupported):
+                validation_numpy.numpy_isNaN([[value("NaN", eb, sb)]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -24,166 +24,409 @@
 ##############################################################################
 
 import os
-import multiprocessing
+import hashlib
+import functools
+import concurrent.futures
 
 from mpf.floats import MPF, Unspecified, smtlib_eq
 
 import attributes
+import oracle_cache
 import smtlib
+import special_cases
+import truth_tables
 import validation
 import validation_host
 import validation_mpfr
+import validation_numpy
 
 from core import Seed, Work_Package, precision_name
 from float_vectors import fp_test_points, Float_Vector, Float_Vector_With_RM
 
 
+GROUP_SIZE = 25
+# Number of vectors in each work package. The host validation of a
+# whole group runs in the background while we work out the expected
+# results with PyMPF.
+
+ORACLES = ("pympf", "mpfr", "host", "numpy")
+PRIMARY_ORACLES = ("pympf", "mpfr", "host")
+
+HARD_KINDS = frozenset(["+min_subnormal", "+rnd_subnormal", "+max_subnormal",
+                        "-min_subnormal", "-rnd_subnormal", "-max_subnormal",
+                        "+min_normal", "+max_normal",
+                        "-min_normal", "-max_normal"])
+# Input kinds for which --always-validate-hard ignores the validation
+# rates
+
+primary_oracle = "pympf"
+enabled_oracles = frozenset(ORACLES)
+validation_rates = {}
+validate_hard = False
+# Set by configure, before any workers are started. The primary oracle
+# computes the expected results, and PyMPF computes the ones it can't.
+# The other enabled oracles check a fraction of the tests (chosen by
+# their seed), given in validation_rates for each (oracle, precision
+# name) or (oracle, None); the default is all of them.
+
+
+def configure(primary, enabled, rates, hard):
+    global primary_oracle
+    global enabled_oracles
+    global validation_rates
+    global validate_hard
+
+    assert primary in PRIMARY_ORACLES
+    assert primary in enabled
+    assert all(oracle in ORACLES for oracle in enabled)
+    assert all(0.0 <= rate <= 1.0 for rate in rates.values())
+    primary_oracle   = primary
+    enabled_oracles  = frozenset(enabled)
+    validation_rates = dict(rates)
+    validate_hard    = hard
+
+    special_cases.configure("mpfr" in enabled_oracles)
+
+
+def get_rate(oracle, eb, sb):
+    name = precision_name(eb, sb)
+    if (oracle, name) in validation_rates:
+        return validation_rates[(oracle, name)]
+    else:
+        return validation_rates.get((oracle, None), 1.0)
+
+
+def oracle_selected(oracle, eb, sb, name, hard):
+    # Decide if we should ask the given oracle about the test with the
+    # given (unique) name, in precision (eb, sb), and with hard inputs
+    # or not. This is deterministic, so that re-generating the suite
+    # consults the same oracles for the same tests.
+    if oracle == primary_oracle:
+        return True
+    elif oracle not in enabled_oracles:
+        return False
+    elif validate_hard and hard:
+        return True
+
+    rate = get_rate(oracle, eb, sb)
+    if rate >= 1.0:
+        return True
+    elif rate <= 0.0:
+        return False
+    m = hashlib.md5()
+    m.update(bytes(oracle + name, encoding="utf-8"))
+    return int(m.hexdigest()[:8], 16) / 2 ** 32 < rate
+
+
+def selected(test, oracle):
+    return oracle_selected(oracle, test.eb, test.sb,
+                           test.seed.get_base_filename(),
+                           any(kind in HARD_KINDS for kind in test.vec.vec))
+
+
 class Basic_Test_WP(Work_Package):
-    def __init__(self, fp_op, eb, sb, vec):
+    def __init__(self, fp_op, eb, sb, vecs):
         self.fp_op = fp_op
         self.eb    = eb
         self.sb    = sb
-        self.vec   = vec
+        self.vecs  = vecs
 
+    def __str__(self):
+        return "Basic_Test_WP<%s,%s,%s>" % (
+            self.fp_op,
+            precision_name(self.eb, self.sb),
+            ", ".join(map(str, self.vecs)))
 
-def basic_test_build(wp):
-    assert isinstance(wp, Basic_Test_WP)
-
-    attr = attributes.get_simple(wp.fp_op)
 
-    # Setup seed
-    seed = Seed()
-    seed.set_key("operation", wp.fp_op)
-    for i in range(attr.arity):
-        seed.set_key("input_kind_%u" % (i + 1),
-                     wp.vec.vec[i])
-    if attr.rounding:
-        seed.set_key("rounding_mode", wp.vec.rm)
+class Basic_Test:
+    def __init__(self, wp, vec, parent_seed):
+        self.fp_op = wp.fp_op
+        self.eb    = wp.eb
+        self.sb    = wp.sb
+        self.vec   = vec
 
-    # Get rng based on seed
-    rng = seed.get_rng()
+        attr = attributes.get_simple(self.fp_op)
 
-    # Create inputs
-    inputs = []
-    for input_id, input_kind in enumerate(wp.vec.vec, 1):
-        inputs.append(("input_%u" % input_id,
-                       fp_test_points[input_kind](wp.eb, wp.sb, rng)))
+        # Setup seed. The parent seed only has the operation, and is
+        # shared by all tests of the work package.
+        items = [("input_kind_%u" % (i + 1), vec.vec[i])
+                 for i in range(attr.arity)]
+        if attr.rounding:
+            items.append(("rounding_mode", vec.rm))
+        self.seed = parent_seed.child(*items[0])
+        for key, value in items[1:]:
+            self.seed.set_key(key, value)
+
+        # Get rng based on seed
+        self.rng = self.seed.get_rng()
+
+        # Create inputs
+        self.inputs = []
+        for input_id, input_kind in enumerate(vec.vec, 1):
+            self.inputs.append(("input_%u" % input_id,
+                                fp_test_points[input_kind](self.eb,
+                                                           self.sb,
+                                                           self.rng)))
+
+        # Decide if this test should be sat or unsat
+        self.expect_unsat = self.rng.random_bool()
+
+        # Arguments for the oracles
+        self.args = []
+        if attr.rounding:
+            self.args.append(vec.rm)
+        self.args += [input_value for _, input_value in self.inputs]
+        self.query = oracle_cache.query_key(
+            self.fp_op,
+            vec.rm if attr.rounding else None,
+            [input_value for _, input_value in self.inputs])
+        # Key for looking up oracle results in the cache
+
+        self.expected_result = None
+        self.unspecified     = False
+        self.validation_ok   = True
+        self.validators      = set()
+
+
+host_executor = None
+# Per-process thread used to run host validation in the background
+host_executor_pid = None
+
+
+def get_host_executor():
+    global host_executor
+    global host_executor_pid
+
+    if host_executor_pid != os.getpid():
+        host_executor = concurrent.futures.ThreadPoolExecutor(1)
+        host_executor_pid = os.getpid()
+
+    return host_executor
+
+
+def host_results(attr, tests):
+    # Runs in the background thread. The host oracle spends its time
+    # in C code or waiting on a pipe, both of which release the GIL.
+    rv = []
+    for test in tests:
+        try:
+            rv.append(attr.host_function(*test.args))
+        except validation.Unsupported as ex:
+            rv.append(ex)
+    return rv
+
+
+def submit_host(attr, tests):
+    # Sends the tests we don't already know the answer for off to the
+    # host oracle. Returns a function that waits for the results.
+    if attr.host_function is None:
+        return lambda: [validation.Unsupported("no host function")] * \
+            len(tests)
+
+    cache = oracle_cache.get_cache()
+    host_oracle = validation_host.get_oracle_id()
+    if cache is None:
+        host_known = [None] * len(tests)
+    else:
+        host_known = cache.lookup(host_oracle,
+                                  [test.query for test in tests])
+    host_todo = [test
+                 for test, known in zip(tests, host_known)
+                 if known is None]
+    if not host_todo:
+        return lambda: host_known
+    pending = get_host_executor().submit(host_results, attr, host_todo)
+
+    def join():
+        new_results = pending.result()
+        if cache is not None:
+            cache.store(host_oracle,
+                        [(test.query, host_result)
+                         for test, host_result in zip(host_todo,
+                                                      new_results)])
+        new_results = iter(new_results)
+        return [next(new_results) if known is None else known
+                for known in host_known]
+
+    return join
+
+
+def pympf_results(attr, tests):
+    rv = []
+    for test in tests:
+        try:
+            rv.append(attr.function(*test.args))
+        except Unspecified as ex:
+            rv.append(ex)
+    return rv
+
+
+def pympf_answers(attr, tests):
+    # From the truth tables for tiny formats (which is even cheaper
+    # than the cache), or PyMPF itself
+    if not tests:
+        return []
+    elif truth_tables.has_tables(tests[0].fp_op, tests[0].eb, tests[0].sb):
+        return [truth_tables.lookup(test.fp_op,
+                                    test.vec.rm if attr.rounding else None,
+                                    [input_value
+                                     for _, input_value in test.inputs])
+                for test in tests]
+    else:
+        return oracle_cache.lookup_or_compute(
+            oracle_cache.PYMPF,
+            [test.query for test in tests],
+            lambda todo: pympf_results(attr,
+                                       [tests[idx] for idx in todo]))
+
+
+def compute_result(test, result):
+    # Result is what PyMPF said (possibly Unspecified)
+    if not isinstance(result, Unspecified):
+        test.expected_result = result
+        test.unspecified = False
+    else:
+        test.unspecified = True
+        if test.fp_op in ("fp.min", "fp.max"):
+            if test.rng.random_bool():
+                test.expected_result = test.inputs[0][1]
+            else:
+                test.expected_result = test.inputs[1][1]
+                test.expect_unsat = True
+        else:
+            assert False
 
-    # Decide if this test should be sat or unsat
-    expect_unsat = rng.random_bool()
 
-    # Compute result
-    args = []
-    if attr.rounding:
-        args.append(wp.vec.rm)
-    args += [input_value for _, input_value in inputs]
+def mpfr_results(tests, rm, todo):
+    # MPFR results for the given indices into tests
     try:
-        expected_result = attr.function(*args)
-        unspecified = False
-    except Unspecified:
-        unspecified = True
-        if wp.fp_op in ("fp.min", "fp.max"):
-            if rng.random_bool():
-                expected_result = inputs[0][1]
+        return validation_mpfr.mpfr_batch(
+            tests[0].fp_op,
+            rm,
+            [[input_value for _, input_value in tests[idx].inputs]
+             for idx in todo])
+    except validation.Unsupported as ex:
+        return [ex] * len(todo)
+
+
+def mpfr_answers(attr, tests):
+    # We ask for a whole group at once, one batch for each rounding
+    # mode, so that MPFR only needs to set up its context once per
+    # batch.
+    if attr.mpfr_function is None:
+        return [validation.Unsupported("no mpfr function")] * len(tests)
+
+    by_rm = {}
+    for idx, test in enumerate(tests):
+        by_rm.setdefault(test.vec.rm if attr.rounding else None,
+                         []).append(idx)
+
+    rv = [None] * len(tests)
+    for rm, indices in by_rm.items():
+        group = [tests[idx] for idx in indices]
+        results = oracle_cache.lookup_or_compute(
+            validation_mpfr.ORACLE_ID,
+            [test.query for test in group],
+            functools.partial(mpfr_results, group, rm))
+        for idx, result in zip(indices, results):
+            rv[idx] = result
+    return rv
+
+
+def primary_name():
+    return {"pympf" : "PyMPF",
+            "mpfr"  : validation_mpfr.NAME,
+            "host"  : validation_host.NAME}[primary_oracle]
+
+
+def validate(test, oracle, result):
+    # Compare the answer of an oracle with the expected result, and
+    # record it as a validator if it agrees
+    if isinstance(result, validation.Unsupported) or test.unspecified:
+        return
+
+    if isinstance(test.expected_result, bool):
+        agrees = result == test.expected_result
+    else:
+        agrees = smtlib_eq(result, test.expected_result)
+
+    if agrees:
+        test.validators.add(oracle)
+    else:
+        print("Validation failed for %s:" % test.fp_op)
+        for arg in test.args:
+            if isinstance(arg, MPF):
+                print("  ", arg, arg.bv)
             else:
-                expected_result = inputs[1][1]
-                expect_unsat = True
-        else:
-            assert False
+                print("  ", arg)
+        print("Expected result (%s): %s" % (", ".join(sorted(
+            test.validators)), test.expected_result))
+        print("%s result: %s" % (oracle, result))
+        test.validation_ok = False
+
+
+def write_test(test, expect_unsat):
+    attr = attributes.get_simple(test.fp_op)
 
-    # Validate, if the answer is not unspecified
-    validation_ok = True
-    validators = set(["PyMPF"])
-    if not unspecified:
-        if attr.mpfr_function is not None:
-            try:
-                mpfr_result = attr.mpfr_function(*args)
-                if smtlib_eq(mpfr_result, expected_result):
-                    validators.add(validation_mpfr.NAME)
-                else:
-                    print("Validation failed for %s:" % wp.fp_op)
-                    for arg in args:
-                        print("  ", arg)
-                    print("PyMPF result: %s" % expected_result)
-                    print("MPFR result: %s" % mpfr_result)
-                    validation_ok = False
-
-            except validation.Unsupported:
-                pass
-
-        if attr.host_function is not None:
-            try:
-                host_result = attr.host_function(*args)
-                if smtlib_eq(host_result, expected_result):
-                    validators.add(validation_host.NAME)
-                else:
-                    print("Validation failed for %s:" % wp.fp_op)
-                    for arg in args:
-                        if isinstance(arg, MPF):
-                            print("  ", arg, arg.bv)
-                        else:
-                            print(arg)
-                    print("PyMPF result: %s" % expected_result)
-                    print("Host result: %s" % host_result)
-                    validation_ok = False
-
-            except validation.Unsupported:
-                pass
+    # Tests exploiting unspecified behaviour are always sat
+    status = "unsat" if expect_unsat and not test.unspecified else "sat"
 
     # Decide on filename
-    if not validation_ok:
+    if not test.validation_ok:
         prefix = "controversial"
-    elif len(validators) > 1:
+    elif len(test.validators) > 1:
         prefix = "tests_validated"
     else:
         prefix = "tests"
     prefix = os.path.join("fptg_testsuite",
                           prefix,
-                          precision_name(wp.eb, wp.sb),
-                          wp.fp_op)
+                          precision_name(test.eb, test.sb),
+                          test.fp_op)
     if attr.rounding:
-        filename = "%s_%s.smt2" % (wp.vec.rm,
-                                   seed.get_base_filename())
+        filename = "%s_%s%s.smt2" % (test.vec.rm,
+                                     test.seed.get_base_filename(),
+                                     smtlib.status_suffix(status))
     else:
-        filename = "%s.smt2" % seed.get_base_filename()
+        filename = "%s%s.smt2" % (test.seed.get_base_filename(),
+                                  smtlib.status_suffix(status))
 
     # Build testcase
     os.makedirs(prefix, exist_ok=True)
     with open(os.path.join(prefix, filename), "w") as fd:
         # Create smtlib output for this test
-        smtlib.write_header(fd, seed, validators)
-        if unspecified:
-            smtlib.set_status(fd, "sat")
+        smtlib.write_header(fd, test.seed, test.validators)
+        smtlib.set_status(fd, status)
+        if test.unspecified:
             smtlib.comment(fd,
                            "this result exploits unspecified behaviour")
-        else:
-            smtlib.set_status(fd, "unsat" if expect_unsat else "sat")
 
         smtlib.set_logic(fd, "QF_FP")
 
         # Emit inputs
-        for input_name, input_value in inputs:
+        for input_name, input_value in test.inputs:
             smtlib.define_fp_const(fd, input_name, input_value)
 
         # Emit expected result
         if attr.returns == "bool":
-            assert isinstance(expected_result, bool)
+            assert isinstance(test.expected_result, bool)
             smtlib.define_const(fd, "expected_result", "Bool",
-                                str(expected_result).lower())
+                                str(test.expected_result).lower())
         else:
-            assert isinstance(expected_result, MPF)
-            smtlib.define_fp_const(fd, "expected_result", expected_result)
+            assert isinstance(test.expected_result, MPF)
+            smtlib.define_fp_const(fd, "expected_result",
+                                   test.expected_result)
 
         # Emit caluclation
-        result_sort = (expected_result.smtlib_sort()
+        result_sort = (test.expected_result.smtlib_sort()
                        if attr.returns == "float"
                        else "Bool")
         args = []
         if attr.rounding:
-            args.append(wp.vec.rm)
-        args += [input_name for input_name, _ in inputs]
+            args.append(test.vec.rm)
+        args += [input_name for input_name, _ in test.inputs]
         smtlib.define_const(fd, "computed_result", result_sort,
-                            "(%s %s)" % (wp.fp_op, " ".join(args)))
+                            "(%s %s)" % (smtlib.function_name(test.fp_op),
+                                         " ".join(args)))
 
         # Emit goal
         smtlib.goal_eq(fd, "expected_result", "computed_result",
@@ -193,20 +436,112 @@ def basic_test_build(wp):
         smtlib.write_footer(fd)
 
 
-def create(eb, sb, fp_op, reduced):
-    print("Generating %s (%s)" % (fp_op,
-                                  precision_name(eb, sb)))
+def basic_test_build(wp):
+    assert isinstance(wp, Basic_Test_WP)
+
+    attr = attributes.get_simple(wp.fp_op)
+
+    # Create all inputs, and answer the ones with special operands
+    # (zeros, infinities, NaN) from the rule table. Only the others
+    # need to go to the oracles.
+    seed = Seed()
+    seed.set_key("operation", wp.fp_op)
+    tests = []
+    todo = []
+    for vec in wp.vecs:
+        test = Basic_Test(wp, vec, seed)
+        tests.append(test)
+        rule = special_cases.lookup(wp.fp_op,
+                                    vec.rm if attr.rounding else None,
+                                    [input_value
+                                     for _, input_value in test.inputs])
+        if rule is None:
+            todo.append(test)
+        else:
+            result, oracles = rule
+            compute_result(test, result)
+            # PyMPF made the rule, so it always counts
+            test.validators = set(special_cases.validator_name(oracle)
+                                  for oracle in oracles
+                                  if oracle == "pympf" or
+                                  selected(test, oracle))
+
+    # Send the others off to the host oracle (in the background, unless
+    # it is the primary oracle), and to MPFR
+    host_tests = [test for test in todo if selected(test, "host")]
+    join_host = submit_host(attr, host_tests)
+    mpfr_tests = [test for test in todo if selected(test, "mpfr")]
+    mpfr = dict(zip(mpfr_tests, mpfr_answers(attr, mpfr_tests)))
+    if primary_oracle == "host":
+        host = dict(zip(host_tests, join_host()))
+    else:
+        host = None
+
+    # Compute results. PyMPF computes the ones the primary oracle can't
+    # answer, and checks a sample of the others.
+    if primary_oracle == "mpfr":
+        primary = mpfr
+    elif primary_oracle == "host":
+        primary = host
+    else:
+        primary = {}
+    pympf_todo = [test
+                  for test in todo
+                  if test not in primary or
+                  isinstance(primary[test], validation.Unsupported) or
+                  selected(test, "pympf")]
+    pympf = dict(zip(pympf_todo, pympf_answers(attr, pympf_todo)))
+    for test in todo:
+        if test in pympf:
+            compute_result(test, pympf[test])
+            test.validators.add("PyMPF")
+        else:
+            compute_result(test, primary[test])
+            test.validators.add(primary_name())
+
+    # Validate with the others, if the answer is not unspecified
+    for test, mpfr_result in mpfr.items():
+        validate(test, validation_mpfr.NAME, mpfr_result)
+
+    # Validate the whole group at once with NumPy
+    numpy_tests = [test for test in tests if selected(test, "numpy")]
+    if attr.numpy_function is not None and numpy_tests:
+        try:
+            numpy_results = attr.numpy_function([test.args
+                                                 for test in numpy_tests])
+            for test, numpy_result in zip(numpy_tests, numpy_results):
+                validate(test, validation_numpy.NAME, numpy_result)
+        except validation.Unsupported:
+            pass
+
+    # Join with the host oracle and build testcases
+    if host is None:
+        host = dict(zip(host_tests, join_host()))
+    for test, host_result in host.items():
+        validate(test, validation_host.NAME, host_result)
+
+    for test in tests:
+        if test.unspecified:
+            # Both variants would be sat, so one is enough
+            variants = [test.expect_unsat]
+        else:
+            variants = smtlib.goal_variants(test.expect_unsat)
+        for expect_unsat in variants:
+            write_test(test, expect_unsat)
+
 
+def build_wp(fp_op, eb, sb, reduced):
     attr = attributes.get_simple(fp_op)
 
     generator_class = (Float_Vector_With_RM
                        if attr.rounding
                        else Float_Vector)
 
-    def build_wp():
-        for vec in generator_class.generate(eb, sb, attr.arity, reduced):
-            yield Basic_Test_WP(fp_op, eb, sb, vec)
-
-    pool = multiprocessing.Pool()
-    for _ in pool.imap_unordered(basic_test_build, build_wp(), 5):
-        pass
+    vecs = []
+    for vec in generator_class.generate(eb, sb, attr.arity, reduced):
+        vecs.append(vec)
+        if len(vecs) == GROUP_SIZE:
+            yield Basic_Test_WP(fp_op, eb, sb, vecs)
+            vecs = []
+    if vecs:
+        yield Basic_Test_WP(fp_op, eb, sb, vecs)
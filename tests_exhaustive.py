@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                          FP_TEST_GENERATOR                               ##
+##                                                                          ##
+##              Copyright (C) 2020, Florian Schanda                         ##
+##                                                                          ##
+##  This file is part of FP_Test_Generator.                                 ##
+##                                                                          ##
+##  FP_Test_Generator is free software: you can redistribute it and/or      ##
+##  modify it under the terms of the GNU General Public License as          ##
+##  published by the Free Software Foundation, either version 3 of the      ##
+##  License, or (at your option) any later version.                         ##
+##                                                                          ##
+##  FP_Test_Generator is distributed in the hope that it will be useful,    ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with FP_Test_Generator. If not, see                               ##
+##  <http://www.gnu.org/licenses/>.                                         ##
+##                                                                          ##
+##############################################################################
+
+
+"""Exhaustive tests for small formats
+
+For small formats we can afford to check every combination of
+operands (and rounding mode), rather than just the interesting kinds
+from fp_test_points. Since that is a lot of checks we put many of them
+(CHECKS_PER_FILE) into each benchmark. Work packages are one file
+each, and are created lazily, so memory use does not depend on how
+many checks we produce.
+"""
+
+import os
+
+from mpf.floats import MPF, Unspecified, smtlib_eq
+
+import attributes
+import smtlib
+import tests_basic
+import truth_tables
+import validation
+import validation_mpfr
+
+from core import Seed, Work_Package, precision_name
+
+
+CHECKS_PER_FILE = 1000
+
+MAX_CHECKS = 2 ** 24
+# Maximum number of checks for each operation, precision and rounding
+# mode we are prepared to generate
+
+
+class Exhaustive_WP(Work_Package):
+    def __init__(self, fp_op, eb, sb, rm, chunk):
+        self.fp_op = fp_op
+        self.eb    = eb
+        self.sb    = sb
+        self.rm    = rm
+        self.chunk = chunk
+        # We do checks chunk * CHECKS_PER_FILE up to (but excluding)
+        # (chunk + 1) * CHECKS_PER_FILE
+
+    def __str__(self):
+        return "Exhaustive_WP<%s,%s,%s,%u>" % (self.fp_op,
+                                               precision_name(self.eb,
+                                                              self.sb),
+                                               self.rm,
+                                               self.chunk)
+
+
+def operand_segments(eb, sb):
+    # The operands are all bit patterns of the format, except that we
+    # only keep one NaN (SMT-LIB only has one). In order of their bit
+    # patterns they are the ranges of (start, length) returned here:
+    # the non-NaN values of each sign, and the NaN.
+    t = sb - 1
+    nan = MPF(eb, sb)
+    nan.set_nan()
+    non_nan = ((2 ** eb - 1) << t) + 1
+    # Zero up to infinity
+    return sorted([(0, non_nan),
+                   (1 << (eb + t), non_nan),
+                   (nan.bv, 1)])
+
+
+def number_of_operands(eb, sb):
+    return sum(length for _, length in operand_segments(eb, sb))
+
+
+def get_operand(eb, sb, n):
+    # The n-th operand, without building all of them
+    for start, length in operand_segments(eb, sb):
+        if n < length:
+            return MPF(eb, sb, start + n)
+        n -= length
+    assert False
+
+
+def is_feasible(fp_op, eb, sb):
+    # Test if the number of checks is acceptable (this is a bound, so
+    # that we don't need to count the operands to find out)
+    return (2 ** ((eb + sb) * attributes.get_simple(fp_op).arity) <=
+            MAX_CHECKS)
+
+
+def number_of_checks(fp_op, eb, sb):
+    return (number_of_operands(eb, sb) **
+            attributes.get_simple(fp_op).arity)
+
+
+def get_args(fp_op, eb, sb, n):
+    # The n-th combination of operands
+    count = number_of_operands(eb, sb)
+    args = []
+    for _ in range(attributes.get_simple(fp_op).arity):
+        n, idx = divmod(n, count)
+        args.insert(0, get_operand(eb, sb, idx))
+    return args
+
+
+def pympf_results(fp_op, rm, queries):
+    attr = attributes.get_simple(fp_op)
+    if truth_tables.has_tables(fp_op, queries[0][0].w, queries[0][0].p):
+        return truth_tables.lookup_batch(fp_op, rm, queries)
+
+    rv = []
+    for args in queries:
+        try:
+            if attr.rounding:
+                rv.append(attr.function(rm, *args))
+            else:
+                rv.append(attr.function(*args))
+        except Unspecified as ex:
+            rv.append(ex)
+    return rv
+
+
+def check_term(fp_op, rm, args, expected_result):
+    term = "(%s %s)" % (smtlib.function_name(fp_op),
+                        " ".join(([rm] if rm else []) +
+                                 [arg.smtlib_literal() for arg in args]))
+    if isinstance(expected_result, Unspecified):
+        # Only min and max can be unspecified: we can return either
+        # argument
+        assert fp_op in ("fp.min", "fp.max")
+        return "(or (= %s %s) (= %s %s))" % (term, args[0].smtlib_literal(),
+                                             term, args[1].smtlib_literal())
+    elif isinstance(expected_result, bool):
+        return "(= %s %s)" % (term, str(expected_result).lower())
+    else:
+        return "(= %s %s)" % (term, expected_result.smtlib_literal())
+
+
+def execute(wp):
+    assert isinstance(wp, Exhaustive_WP)
+
+    attr = attributes.get_simple(wp.fp_op)
+
+    # Create seed
+    seed = Seed()
+    seed.set_key("operation", wp.fp_op)
+    seed.set_key("precision", precision_name(wp.eb, wp.sb))
+    if attr.rounding:
+        seed.set_key("rounding_mode", wp.rm)
+    seed.set_key("chunk", str(wp.chunk))
+
+    # Create RNG
+    rng = seed.get_rng()
+
+    # Decide if this test should be sat or unsat
+    expect_unsat = rng.random_bool()
+
+    # Work out the checks in this file
+    first = wp.chunk * CHECKS_PER_FILE
+    last = min(first + CHECKS_PER_FILE,
+               number_of_checks(wp.fp_op, wp.eb, wp.sb))
+    queries = [get_args(wp.fp_op, wp.eb, wp.sb, n)
+               for n in range(first, last)]
+
+    # Compute results
+    expected_results = pympf_results(wp.fp_op, wp.rm, queries)
+    validators = set(["PyMPF"])
+
+    # Validate everything that is specified with MPFR, if it is
+    # selected for this file. The file only counts as validated if all
+    # of it is. Files with subnormal operands count as hard.
+    validation_ok = True
+    hard = any(arg.isSubnormal() for args in queries for arg in args)
+    if attr.mpfr_function is not None and \
+       tests_basic.oracle_selected("mpfr", wp.eb, wp.sb,
+                                   seed.get_base_filename(), hard):
+        specified = [idx for idx, result in enumerate(expected_results)
+                     if not isinstance(result, Unspecified)]
+        try:
+            mpfr_results = validation_mpfr.mpfr_batch(
+                wp.fp_op,
+                wp.rm,
+                [queries[idx] for idx in specified])
+        except validation.Unsupported:
+            mpfr_results = None
+        if mpfr_results is not None:
+            mpfr_complete = True
+            for idx, mpfr_result in zip(specified, mpfr_results):
+                if isinstance(mpfr_result, validation.Unsupported):
+                    mpfr_complete = False
+                elif not smtlib_eq(mpfr_result, expected_results[idx]):
+                    print("Validation failed for %s:" % wp.fp_op)
+                    for arg in queries[idx]:
+                        print("  ", arg)
+                    print("PyMPF result: %s" % expected_results[idx])
+                    print("MPFR result: %s" % mpfr_result)
+                    validation_ok = False
+            if validation_ok and mpfr_complete and specified:
+                validators.add(validation_mpfr.NAME)
+
+    # Decide on filename
+    if not validation_ok:
+        prefix = "controversial"
+    elif len(validators) > 1:
+        prefix = "tests_validated"
+    else:
+        prefix = "tests"
+    prefix = os.path.join("fptg_testsuite",
+                          prefix,
+                          precision_name(wp.eb, wp.sb),
+                          wp.fp_op,
+                          "exhaustive")
+    if attr.rounding:
+        filename = "%s_%06u.smt2" % (wp.rm, wp.chunk)
+    else:
+        filename = "%06u.smt2" % wp.chunk
+
+    # Build testcase
+    os.makedirs(prefix, exist_ok=True)
+    with open(os.path.join(prefix, filename), "w") as fd:
+        smtlib.write_header(fd, seed, validators)
+        smtlib.set_status(fd, "unsat" if expect_unsat else "sat")
+
+        smtlib.set_logic(fd, "QF_FP")
+
+        # Emit goal: either all checks hold, or (for unsat) at least
+        # one does not
+        fd.write("\n")
+        smtlib.comment(fd, "goal (checks %u to %u)" % (first, last - 1))
+        fd.write("(assert (%s\n" % ("not (and" if expect_unsat else "and"))
+        for args, expected_result in zip(queries, expected_results):
+            fd.write("  %s\n" % check_term(wp.fp_op, wp.rm, args,
+                                           expected_result))
+        fd.write("))%s\n" % (")" if expect_unsat else ""))
+
+        # Finish
+        smtlib.write_footer(fd)
+
+
+def build_wp(fp_op, eb, sb):
+    attr = attributes.get_simple(fp_op)
+    chunks = ((number_of_checks(fp_op, eb, sb) + CHECKS_PER_FILE - 1) //
+              CHECKS_PER_FILE)
+
+    for rm in (MPF.ROUNDING_MODES if attr.rounding else [None]):
+        for chunk in range(chunks):
+            yield Exhaustive_WP(fp_op, eb, sb, rm, chunk)
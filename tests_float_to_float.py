@@ -24,11 +24,15 @@
 ##############################################################################
 
 import os
-import multiprocessing
 
-from mpf.floats import fp_from_float
+from mpf.floats import MPF, fp_from_float, smtlib_eq
 
+import oracle_cache
 import smtlib
+import tests_basic
+import validation
+import validation_host
+import validation_mpfr
 
 from core import Seed, Work_Package
 from float_vectors import fp_test_points, Float_Vector_With_RM
@@ -55,6 +59,61 @@ class Float_To_Float_WP(Work_Package):
         self.input_kind = vec.vec[0]
         # Input kind
 
+    def __str__(self):
+        return "Float_To_Float_WP<%s,%s,%s,%s>" % (self.source_precision,
+                                                   self.target_precision,
+                                                   self.rm,
+                                                   self.input_kind)
+
+
+class Float_To_Float_Fan_Out_WP(Work_Package):
+    def __init__(self, source_precision, p_source, targets, vec):
+        self.source_precision = source_precision
+        self.p_source = p_source
+        # Source precision kind and actual numbers
+
+        self.targets = targets
+        # List of target precision kind and actual numbers
+
+        self.rm = vec.rm
+        # Rounding mode for operation
+
+        self.input_kind = vec.vec[0]
+        # Input kind
+
+    def __str__(self):
+        return "Float_To_Float_Fan_Out_WP<%s,%s,%s>" % (self.source_precision,
+                                                        self.rm,
+                                                        self.input_kind)
+
+
+def conversion_result(oracle, query, function, p_target, rm, input_value):
+    # Result of the given oracle, from the cache if we have asked it
+    # before
+    def compute(_):
+        try:
+            return [function(p_target[0], p_target[1],
+                             rm,
+                             input_value)]
+        except validation.Unsupported as ex:
+            return [ex]
+
+    return oracle_cache.lookup_or_compute(oracle, [query], compute)[0]
+
+
+def pympf_conversion(rational):
+    # Returns a function like fp_from_float, that uses the given
+    # (pre-computed) value of the input if it is finite and not zero
+    if rational is None:
+        return fp_from_float
+
+    def convert(eb, sb, rm, _):
+        rv = MPF(eb, sb)
+        rv.from_rational(rm, rational)
+        return rv
+
+    return convert
+
 
 def execute(wp):
     assert isinstance(wp, Float_To_Float_WP)
@@ -77,49 +136,128 @@ def execute(wp):
     # Decide if this test should be sat or unsat
     expect_unsat = rng.random_bool()
 
+    build_test(seed, wp.source_precision, wp.target_precision, wp.p_target,
+               wp.rm, wp.input_kind, input_value, expect_unsat,
+               fp_from_float)
+
+
+def execute_fan_out(wp):
+    assert isinstance(wp, Float_To_Float_Fan_Out_WP)
+
+    # Create seed; the input is the same for all targets
+    seed = Seed()
+    seed.set_key("operation", "float_to_float")
+    seed.set_key("precision_source", wp.source_precision)
+    seed.set_key("precision_target", "all")
+    seed.set_key("input_kind", wp.input_kind)
+    seed.set_key("rounding_mode", wp.rm)
+
+    # Create RNG
+    rng = seed.get_rng()
+
+    # Create random instances, and work out its value only once
+    input_value = fp_test_points[wp.input_kind](wp.p_source[0], wp.p_source[1],
+                                                rng)
+    if input_value.isFinite() and not input_value.isZero():
+        rational = input_value.to_rational()
+    else:
+        rational = None
+    pympf_function = pympf_conversion(rational)
+
+    for target_precision, p_target in wp.targets:
+        # Decide if this test should be sat or unsat
+        expect_unsat = rng.random_bool()
+
+        build_test(seed, wp.source_precision, target_precision, p_target,
+                   wp.rm, wp.input_kind, input_value, expect_unsat,
+                   pympf_function)
+
+
+def build_test(seed, source_precision, target_precision, p_target, rm,
+               input_kind, input_value, expect_unsat, pympf_function):
     # Compute result
-    expected_result = fp_from_float(wp.p_target[0], wp.p_target[1],
-                                    wp.rm,
-                                    input_value)
+    query = oracle_cache.query_key("to_fp %u %u" % p_target,
+                                   rm,
+                                   [input_value])
+    expected_result = conversion_result(oracle_cache.PYMPF, query,
+                                        pympf_function,
+                                        p_target, rm, input_value)
     validators = set(["PyMPF"])
 
+    # Cross-check with MPFR and the host, if they are selected for
+    # this test
+    validation_ok = True
+    for key, name, oracle, function in (("mpfr",
+                                         validation_mpfr.NAME,
+                                         validation_mpfr.ORACLE_ID,
+                                         validation_mpfr.mpfr_to_fp),
+                                        ("host",
+                                         validation_host.NAME,
+                                         validation_host.get_oracle_id(),
+                                         validation_host.host_to_fp)):
+        if not tests_basic.oracle_selected(
+                key, p_target[0], p_target[1],
+                target_precision + seed.get_base_filename(),
+                input_kind in tests_basic.HARD_KINDS):
+            continue
+        result = conversion_result(oracle, query, function,
+                                   p_target, rm, input_value)
+        if isinstance(result, validation.Unsupported):
+            continue
+        if smtlib_eq(result, expected_result):
+            validators.add(name)
+        else:
+            print("Validation failed for to_fp (%u, %u):" % p_target)
+            print("  ", input_value)
+            print("PyMPF result: %s" % expected_result)
+            print("%s result: %s" % (name, result))
+            validation_ok = False
+
     # Decide on filename
+    if not validation_ok:
+        prefix = "controversial"
+    elif len(validators) > 1:
+        prefix = "tests_validated"
+    else:
+        prefix = "tests"
     prefix = os.path.join("fptg_testsuite",
-                          "tests",
-                          wp.source_precision,
+                          prefix,
+                          source_precision,
                           "to_fp")
-    filename = "to_%s_%s_%s.smt2" % (wp.target_precision,
-                                     wp.rm,
-                                     seed.get_base_filename()[:4])
+    for goal_unsat in smtlib.goal_variants(expect_unsat):
+        status = "unsat" if goal_unsat else "sat"
+        filename = "to_%s_%s_%s%s.smt2" % (target_precision,
+                                           rm,
+                                           seed.get_base_filename()[:4],
+                                           smtlib.status_suffix(status))
 
-    # Build testcase
-    os.makedirs(prefix, exist_ok=True)
-    with open(os.path.join(prefix, filename), "w") as fd:
-        # Create smtlib output for this test
-        smtlib.write_header(fd, seed, validators)
-        smtlib.set_status(fd, "unsat" if expect_unsat else "sat")
+        # Build testcase
+        os.makedirs(prefix, exist_ok=True)
+        with open(os.path.join(prefix, filename), "w") as fd:
+            # Create smtlib output for this test
+            smtlib.write_header(fd, seed, validators)
+            smtlib.set_status(fd, status)
 
-        smtlib.set_logic(fd, "QF_FP")
+            smtlib.set_logic(fd, "QF_FP")
 
-        # Emit input
-        smtlib.define_fp_const(fd, "potato", input_value)
+            # Emit input
+            smtlib.define_fp_const(fd, "potato", input_value)
 
-        # Emit expected result
-        smtlib.define_fp_const(fd, "expected_result", expected_result)
+            # Emit expected result
+            smtlib.define_fp_const(fd, "expected_result", expected_result)
 
-        # Emit caluclation
-        smtlib.define_const(fd, "computed_result",
-                            expected_result.smtlib_sort(),
-                            "((_ to_fp %u %u) %s potato)" %
-                            (wp.p_target[0], wp.p_target[1],
-                             wp.rm))
+            # Emit caluclation
+            smtlib.define_const(fd, "computed_result",
+                                expected_result.smtlib_sort(),
+                                "((_ to_fp %u %u) %s potato)" %
+                                (p_target[0], p_target[1], rm))
 
-        # Emit goal
-        smtlib.goal_eq(fd, "expected_result", "computed_result",
-                       expect_unsat)
+            # Emit goal
+            smtlib.goal_eq(fd, "expected_result", "computed_result",
+                           goal_unsat)
 
-        # Finish
-        smtlib.write_footer(fd)
+            # Finish
+            smtlib.write_footer(fd)
 
 
 def build_wp(reduced):
@@ -149,9 +287,22 @@ def build_wp(reduced):
                                     i_vec)
 
 
-def create(reduced):
-    print("Generating float -> float tests")
+def build_fan_out_wp(reduced):
+    seed = Seed()
+    seed.set_key("operation", "float_to_float")
+    seed.set_key("precision_target", "all")
+
+    for source in sorted(precision_test_points):
+        seed.set_key("precision_source", source)
+        print("  from %s" % source)
+
+        # Create RNG
+        rng = seed.get_rng()
+
+        p_source = precision_test_points[source](rng)
+        targets = [(target, precision_test_points[target](rng))
+                   for target in sorted(precision_test_points)]
 
-    pool = multiprocessing.Pool()
-    for _ in pool.imap_unordered(execute, build_wp(reduced), 5):
-        pass
+        for i_vec in Float_Vector_With_RM.generate(p_source[0], p_source[1],
+                                                   1, reduced):
+            yield Float_To_Float_Fan_Out_WP(source, p_source, targets, i_vec)
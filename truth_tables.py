@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                          FP_TEST_GENERATOR                               ##
+##                                                                          ##
+##              Copyright (C) 2020, Florian Schanda                         ##
+##                                                                          ##
+##  This file is part of FP_Test_Generator.                                 ##
+##                                                                          ##
+##  FP_Test_Generator is free software: you can redistribute it and/or      ##
+##  modify it under the terms of the GNU General Public License as          ##
+##  published by the Free Software Foundation, either version 3 of the      ##
+##  License, or (at your option) any later version.                         ##
+##                                                                          ##
+##  FP_Test_Generator is distributed in the hope that it will be useful,    ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with FP_Test_Generator. If not, see                               ##
+##  <http://www.gnu.org/licenses/>.                                         ##
+##                                                                          ##
+##############################################################################
+
+
+"""Complete result tables for tiny formats
+
+Q: Why?
+
+A: For formats with at most 8 bits there are at most 2^16 inputs to a
+   binary operation, so it is cheaper to work out all of them once
+   (see build_truth_tables.py) than to ask PyMPF for every test. The
+   tables are NumPy arrays of result bit patterns, memory-mapped so
+   that all workers share the same pages.
+
+The answers are still PyMPF's answers, so using a table does not
+count as an additional validation.
+"""
+
+import json
+import os
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from mpf.floats import MPF, Unspecified
+
+import attributes
+import oracle_cache
+
+TABLE_DIR = "truth_tables"
+MANIFEST = os.path.join(TABLE_DIR, "manifest.json")
+
+MAX_ENTRIES = 2 ** 16
+# We only build tables with at most this many entries
+
+DTYPE = "uint32"
+UNSPECIFIED = 0xffffffff
+# Marker for inputs where PyMPF says the result is unspecified. All
+# other entries are the bit pattern of the result (or 0 and 1 for
+# predicates). Unary operations on 16 bit formats fit in MAX_ENTRIES,
+# so results can use all 16 bits, and the marker must be wider.
+
+FORMAT_VERSION = 2
+# Recorded in the manifest; tables in an older format are ignored
+#
+# 2: DTYPE went from uint16 to uint32
+
+
+def table_name(fp_op, eb, sb, rm):
+    return "%s.%u.%u.%s.npy" % (fp_op, eb, sb, rm if rm else "none")
+
+
+def table_size(fp_op, eb, sb):
+    return 2 ** ((eb + sb) * attributes.get_simple(fp_op).arity)
+
+
+def table_index(args):
+    # The operands' bit patterns, concatenated
+    idx = 0
+    for arg in args:
+        idx = (idx << arg.k) | arg.bv
+    return idx
+
+
+def rounding_modes(fp_op):
+    if attributes.get_simple(fp_op).rounding:
+        return MPF.ROUNDING_MODES
+    else:
+        return [None]
+
+
+def compute_table(fp_op, eb, sb, rm):
+    assert table_size(fp_op, eb, sb) <= MAX_ENTRIES
+    attr = attributes.get_simple(fp_op)
+    k = eb + sb
+
+    table = numpy.zeros(table_size(fp_op, eb, sb), dtype=DTYPE)
+    for idx in range(len(table)):
+        args = [MPF(eb, sb, (idx >> (k * (attr.arity - 1 - i))) &
+                    (2 ** k - 1))
+                for i in range(attr.arity)]
+        if rm is not None:
+            args.insert(0, rm)
+        try:
+            result = attr.function(*args)
+        except Unspecified:
+            table[idx] = UNSPECIFIED
+            continue
+        if attr.returns == "bool":
+            table[idx] = int(result)
+        else:
+            table[idx] = result.bv
+    return table
+
+
+tables = None
+# Names of the tables in the manifest, loaded once; empty if there are
+# none, or they were built by a different version of PyMPF or in a
+# different format
+
+open_tables = {}
+# Memory-mapped tables, by name
+
+
+def get_tables():
+    global tables
+
+    if tables is None:
+        tables = set()
+        if numpy is not None:
+            try:
+                with open(MANIFEST, "r") as fd:
+                    manifest = json.load(fd)
+                if manifest["pympf"] == oracle_cache.get_pympf_version() \
+                   and manifest.get("format") == FORMAT_VERSION:
+                    tables = set(manifest["tables"])
+            except FileNotFoundError:
+                pass
+
+    return tables
+
+
+def has_tables(fp_op, eb, sb):
+    """Test if we have all tables for the operation and precision"""
+    return all(table_name(fp_op, eb, sb, rm) in get_tables()
+               for rm in rounding_modes(fp_op))
+
+
+def get_table(fp_op, eb, sb, rm):
+    name = table_name(fp_op, eb, sb, rm)
+    if name not in open_tables:
+        open_tables[name] = numpy.load(os.path.join(TABLE_DIR, name),
+                                       mmap_mode="r")
+    return open_tables[name]
+
+
+def decode(fp_op, eb, sb, value):
+    value = int(value)
+    if value == UNSPECIFIED:
+        return Unspecified()
+    elif attributes.get_simple(fp_op).returns == "bool":
+        return value == 1
+    else:
+        return MPF(eb, sb, value)
+
+
+def lookup_batch(fp_op, rm, queries):
+    """PyMPF's results for a list of (unrounded) argument lists
+
+    Returns a list of MPF, bool, or Unspecified instances. All
+    arguments must have the same precision, and there must be a table
+    for it (see has_tables).
+    """
+    template = queries[0][0]
+    table = get_table(fp_op, template.w, template.p, rm)
+    values = table[numpy.array([table_index(args) for args in queries])]
+    return [decode(fp_op, template.w, template.p, value)
+            for value in values]
+
+
+def lookup(fp_op, rm, args):
+    """As lookup_batch, for a single query"""
+    return lookup_batch(fp_op, rm, [args])[0]
@@ -25,6 +25,9 @@
 
 
 class Unsupported(Exception):
-    def __init__(self, reason):
+    def __init__(self, reason, transient=False):
         super().__init__()
-        self.reason = reason
+        self.reason    = reason
+        self.transient = transient
+        # Transient problems (e.g. a validator timing out) may go away
+        # if we ask again, so we don't remember them in the cache
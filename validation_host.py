@@ -23,8 +23,13 @@
 ##                                                                          ##
 ##############################################################################
 
+import atexit
+import ctypes
+import json
 import os
+import select
 import subprocess
+import time
 
 from mpf.floats import *
 from mpf.rationals import Rational
@@ -52,94 +57,372 @@ def has_explicit_bit(f):
     return f.k == 79
 
 
-def to_bits(f):
-    bits = "{0:b}".format(f.bv)
-    assert len(bits) <= f.k
-    bits = "0" * (f.k - len(bits)) + bits
-    assert len(bits) == f.k
-
-    if has_explicit_bit(f):
-        # Float80 (x87_extended) does not have a hidden bit, so we
-        # need to add it. Its a bit weird, look at
-        # https://en.wikipedia.org/wiki/Extended_precision for the
-        # table on how the explicit bit should be set. It's not
-        # intuitive.
-        if f.isNormal():
-            hb = "1"
-        elif f.isSubnormal():
-            hb = "0"
-        elif f.isInfinite():
-            hb = "1"
-            # And not 0 as you might expect
-        elif f.isNaN():
-            hb = "1"
-        else:
-            hb = "0"
-        # print(bits[:16], "[%s]" % hb, bits[16:])
-        bits = bits[:16] + hb + bits[16:]
-        assert len(bits) == 80, "bits should be 80 now, not %u" % len(bits)
-
-    return bits
-
-
-def get_binary_name(fp_op, arg):
+def get_precision(arg):
     if arg.w == 8 and arg.p == 24:
-        prec = 32
+        return 32
     elif arg.w == 11 and arg.p == 53:
-        prec = 64
+        return 64
     elif arg.w == 15 and arg.p == 64:
-        prec = 80
+        return 80
     elif arg.w == 15 and arg.p == 113:
-        prec = 128
+        return 128
     else:
         raise validation.Unsupported("only single, double, long "
                                      "double, and __float128 work")
 
-    name = os.path.join("host_validation",
-                        "%s.float%s.val" % (fp_op, prec))
 
-    if os.path.isfile(name):
-        return name
+MANIFEST = os.path.join("host_validation", "manifest.json")
+# Written by build_host_validation.py, tells us the op codes and the
+# names of the validators and library.
 
-    else:
+host_build = None
+# Loaded once from the manifest; False if nothing has been built
+
+
+def get_build():
+    global host_build
+
+    if host_build is None:
+        try:
+            with open(MANIFEST, "r") as fd:
+                host_build = json.load(fd)
+        except FileNotFoundError:
+            host_build = False
+
+    return host_build
+
+
+ADAPTER_VERSION = 1
+# Version of the code in this module; increase this when it changes
+# the results, so that we don't use old results from the cache
+
+
+def get_oracle_id():
+    # Identifies this oracle for the result cache. The names of the
+    # build targets include a hash of their sources, flags and the
+    # compiler.
+    build = get_build()
+    return "%s %s adapter %u" % (NAME,
+                                 (build["targets"]["library"]
+                                  if build
+                                  else "unbuilt"),
+                                 ADAPTER_VERSION)
+
+
+def get_binary_name(fp_op, arg):
+    precision = get_precision(arg)
+    build = get_build()
+
+    if not build:
+        raise validation.Unsupported("no validation binary exists")
+    elif "validator.float%u" % precision not in build["targets"]:
+        raise validation.Unsupported("no validation binary exists")
+    elif fp_op not in build["op_codes"]:
         raise validation.Unsupported("no validation binary exists")
 
+    return os.path.join("host_validation",
+                        build["targets"]["validator.float%u" % precision])
 
-def call_validator(fp_op, args, rm=None):
-    assert len(args) >= 1
-    p = subprocess.Popen([],
-                         executable=get_binary_name(fp_op, args[0]),
-                         stdin=subprocess.PIPE,
-                         stdout=subprocess.PIPE,
-                         encoding="utf-8")
-    if rm:
-        in_str = rm + "\n"
-    else:
-        in_str = ""
 
-    for arg in args:
-        in_str += to_bits(arg) + "\n"
+WIDTH = {32  : 4,
+         64  : 8,
+         80  : 10,
+         128 : 16}
+# Bytes per value in the packed format used by the shared library and
+# the validators
 
-    stdout, _ = p.communicate(in_str)
-    # print(stdout)
+ANSWER_SIZE = 1 + max(WIDTH.values())
+# Validators answer with a status byte and space for a result in the
+# widest format, since conversions change the precision
 
-    if p.returncode != 0:
-        raise validation.Unsupported("calling validator failed")
+RM_CODE = {RM_RNE : 0,
+           RM_RNA : 1,
+           RM_RTP : 2,
+           RM_RTN : 3,
+           RM_RTZ : 4}
+# Must match enum rounding_mode in vlib.h
 
-    assert stdout.startswith("result: ")
-    bits = stdout.split(": ", 1)[1].strip()
 
-    rv = args[0].new_mpf()
+def to_bytes(f):
+    bv = f.bv
 
-    if has_explicit_bit(rv):
-        bits = "{0:b}".format(int(bits, 16))
-        bits = "0" * (80 - len(bits)) + bits
-        bits = bits[:16] + bits[17:]
-        rv.bv = int(bits, 2)
+    if has_explicit_bit(f):
+        # Float80 (x87_extended) does not have a hidden bit, so we
+        # need to add it. Its a bit weird, look at
+        # https://en.wikipedia.org/wiki/Extended_precision for the
+        # table on how the explicit bit should be set. It's not
+        # intuitive: it is set for normals, infinities, and NaN; and
+        # clear for zero and subnormals. I.e. it is set iff the
+        # exponent is not zero.
+        sign_exp = bv >> 63
+        hb = 1 if sign_exp & 0x7fff else 0
+        bv = (sign_exp << 64) | (hb << 63) | (bv & (2 ** 63 - 1))
+        return bv.to_bytes(10, "little")
 
     else:
-        rv.bv = int(bits, 16)
+        return bv.to_bytes(f.k // 8, "little")
+
 
+def from_bytes(template, data):
+    bv = int.from_bytes(data, "little")
+
+    if has_explicit_bit(template):
+        bv = ((bv >> 64) << 63) | (bv & (2 ** 63 - 1))
+
+    rv = template.new_mpf()
+    rv.bv = bv
+    return rv
+
+
+class Host_Library:
+    """In-process host oracle
+
+    Wraps libfptg_host.so, which has one entry point per operation
+    and precision that works on packed arrays of inputs.
+    """
+
+    def __init__(self, filename):
+        self.lib     = ctypes.CDLL(os.path.abspath(filename))
+        self.kernels = {}
+
+    def get_kernel(self, fp_op, precision):
+        key = (fp_op, precision)
+        if key not in self.kernels:
+            try:
+                kernel = getattr(self.lib,
+                                 "fptg_%s_float%u" % (fp_op.replace(".", "_"),
+                                                      precision))
+                kernel.argtypes = [ctypes.c_int,
+                                   ctypes.c_char_p,
+                                   ctypes.c_char_p,
+                                   ctypes.c_size_t]
+                kernel.restype = ctypes.c_int
+            except AttributeError:
+                kernel = None
+            self.kernels[key] = kernel
+        return self.kernels[key]
+
+    def call(self, kernel, queries, template):
+        width = WIDTH[get_precision(template)]
+
+        # A kernel invocation works for a single rounding mode, so we
+        # group the queries first.
+        by_rm = {}
+        for idx, (_, rm) in enumerate(queries):
+            by_rm.setdefault(rm, []).append(idx)
+
+        results = [None] * len(queries)
+        for rm, indices in by_rm.items():
+            in_buf = b"".join(to_bytes(arg)
+                              for idx in indices
+                              for arg in queries[idx][0])
+            out_buf = ctypes.create_string_buffer(width * len(indices))
+
+            if kernel(RM_CODE[rm] if rm else 0,
+                      in_buf, out_buf, len(indices)):
+                data = memoryview(out_buf.raw)
+                for n, idx in enumerate(indices):
+                    results[idx] = from_bytes(template,
+                                              data[n * width:
+                                                   (n + 1) * width])
+            else:
+                for idx in indices:
+                    results[idx] = validation.Unsupported(
+                        "rounding mode %s" % rm)
+
+        return results
+
+
+host_library = None
+# Loaded on first use, if it has been built
+
+
+def get_library():
+    global host_library
+
+    if host_library is None:
+        build = get_build()
+        if build and "library" in build["targets"]:
+            host_library = Host_Library(
+                os.path.join("host_validation", build["targets"]["library"]))
+        else:
+            host_library = False
+
+    return host_library
+
+
+class Validator_Process:
+    """Long-lived validator process answering requests in batch mode
+
+    There is one validator binary per precision, which answers
+    fixed-size binary requests on stdin until it is closed. A request
+    is an op code byte, a rounding mode byte, and space for three
+    packed operands; an answer is a status byte (1 if ok, 0 if
+    unsupported) followed by the packed result (padded to the widest
+    format).
+    """
+
+    WINDOW = 1024
+    # Maximum number of requests we write before reading back the
+    # answers. Each answer is 17 bytes, so this never fills up
+    # the pipe buffer of the validator's stdout, which would otherwise
+    # deadlock us. The requests themselves (at most 50 bytes each)
+    # also fit into the pipe buffer of its stdin, so we never block on
+    # writing to a hung validator.
+
+    TIMEOUT = 60.0
+    # Seconds we wait for the answers to a window
+
+    def __init__(self, binary):
+        self.binary = binary
+        self.proc   = subprocess.Popen([],
+                                       executable=binary,
+                                       stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE,
+                                       bufsize=0)
+
+    def read(self, size):
+        deadline = time.monotonic() + Validator_Process.TIMEOUT
+        fd = self.proc.stdout.fileno()
+        data = bytearray()
+        while len(data) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                raise TimeoutError
+            chunk = os.read(fd, size - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def query(self, requests, answer_size):
+        answers = []
+        for i in range(0, len(requests), Validator_Process.WINDOW):
+            window = requests[i:i + Validator_Process.WINDOW]
+            self.proc.stdin.write(b"".join(window))
+
+            data = memoryview(self.read(len(window) * answer_size))
+            for n in range(len(window)):
+                answers.append(data[n * answer_size:(n + 1) * answer_size])
+        return answers
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(Validator_Process.TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.kill()
+        self.proc.stdout.close()
+
+    def kill(self):
+        self.proc.kill()
+        self.proc.wait()
+        # Our end of the pipes is unbuffered, so closing them can't
+        # block on the dead validator
+        self.proc.stdin.close()
+        self.proc.stdout.close()
+
+
+validator_pool = {}
+# Per-process pool of validators, indexed by binary name. Each
+# worker of the multiprocessing pool gets its own (the pid check below
+# makes sure we don't share pipes with our parent after a fork).
+validator_pool_pid = None
+
+
+def get_validator(binary):
+    global validator_pool_pid
+
+    if validator_pool_pid != os.getpid():
+        validator_pool.clear()
+        validator_pool_pid = os.getpid()
+
+    if binary not in validator_pool:
+        validator_pool[binary] = Validator_Process(binary)
+    return validator_pool[binary]
+
+
+def close_validators():
+    if validator_pool_pid == os.getpid():
+        for validator in validator_pool.values():
+            validator.close()
+    validator_pool.clear()
+
+
+atexit.register(close_validators)
+
+
+def call_validator_batch(fp_op, queries, template=None):
+    """Send many queries for the same operation to a validator
+
+    Queries is a list of (args, rm) tuples, all of the same
+    precision. Returns a list of results, each either an MPF or an
+    Unsupported exception (which is not raised). The results have the
+    precision of template if given (for conversions), and of the
+    arguments otherwise.
+    """
+    assert len(queries) >= 1
+    precision = get_precision(queries[0][0][0])
+    if template is None:
+        template = queries[0][0][0]
+    result_width = WIDTH[get_precision(template)]
+
+    library = get_library()
+    if library:
+        kernel = library.get_kernel(fp_op, precision)
+        if kernel is None:
+            # The library and validators are built from the same
+            # kernels, so there is no point asking a validator.
+            raise validation.Unsupported("no kernel for %s in float%u" %
+                                         (fp_op, precision))
+        return library.call(kernel, queries, template)
+
+    binary = get_binary_name(fp_op, queries[0][0][0])
+    width = WIDTH[precision]
+
+    op_code = get_build()["op_codes"][fp_op]
+    requests = []
+    for args, rm in queries:
+        assert 1 <= len(args) <= 3
+        requests.append(bytes([op_code, RM_CODE[rm] if rm else 0]) +
+                        b"".join(to_bytes(arg) for arg in args) +
+                        bytes((3 - len(args)) * width))
+
+    validator = get_validator(binary)
+    try:
+        answers = validator.query(requests, ANSWER_SIZE)
+    except TimeoutError as exc:
+        # The validator is wedged; kill it and forget about it so that
+        # the next query starts a fresh one.
+        del validator_pool[binary]
+        validator.kill()
+        raise validation.Unsupported("validator timed out",
+                                     transient=True) from exc
+    except (OSError, EOFError) as exc:
+        # The validator died on us; same as above.
+        del validator_pool[binary]
+        validator.close()
+        raise validation.Unsupported("calling validator failed",
+                                     transient=True) from exc
+
+    results = []
+    for (args, rm), answer in zip(queries, answers):
+        if answer[0]:
+            results.append(from_bytes(template,
+                                      answer[1:1 + result_width]))
+        else:
+            results.append(validation.Unsupported(
+                "%s not supported by validator" % fp_op))
+    return results
+
+
+def call_validator(fp_op, args, rm=None, template=None):
+    rv = call_validator_batch(fp_op, [(args, rm)], template)[0]
+    if isinstance(rv, validation.Unsupported):
+        raise rv
     return rv
 
 
@@ -193,6 +476,12 @@ def host_roundToIntegral(rm, a):
     return call_validator("fp.roundToIntegral", [a], rm)
 
 
+def host_to_fp(eb, sb, rm, a):
+    target = MPF(eb, sb)
+    return call_validator("to_fp.float%u" % get_precision(target),
+                          [a], rm, target)
+
+
 def sanity_test():
     x = MPF(15, 64)
     x.from_rational(RM_RNE, Rational(12345, 100))
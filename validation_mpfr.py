@@ -23,10 +23,7 @@
 ##                                                                          ##
 ##############################################################################
 
-from math import log2
-
 from mpf.floats import MPF, RM_RNE, RM_RNA, RM_RTP, RM_RTN, RM_RTZ
-from mpf.rationals import Rational
 
 import gmpy2
 
@@ -36,17 +33,42 @@ from validation import Unsupported
 NAME = "%s (via gmpy2 %s)" % (gmpy2.mpfr_version(),
                               gmpy2.version())
 
+ADAPTER_VERSION = 2
+# Version of the code in this module; increase this when it changes
+# the results, so that we don't use old results from the cache.
+#
+# 2: RNA is emulated
+
+ORACLE_ID = "%s adapter %u" % (NAME, ADAPTER_VERSION)
+# Identifies this oracle for the result cache
+
 MPF_TO_MPFR_RM = {RM_RNE : gmpy2.RoundToNearest,
                   RM_RTP : gmpy2.RoundUp,
                   RM_RTN : gmpy2.RoundDown,
                   RM_RTZ : gmpy2.RoundToZero}
-# MPFR in general does not support RM_RNA.
+# MPFR in general does not support RM_RNA, so we emulate it (see
+# round_ties_away).
 #
 # You might be tempted to assume RM_RNA is RoundAwayZero, but this is
 # not correct. That rounding mode is really the inverse of
 # RoundToZero, i.e. it always does this and not just at half-points.
 
 
+exact_contexts = {}
+# Contexts with the full exponent range MPFR supports, indexed by
+# precision. Used to build values from their bit pattern without the
+# intermediate results overflowing.
+
+
+def get_exact_context(precision):
+    if precision not in exact_contexts:
+        exact_contexts[precision] = gmpy2.context(
+            precision=precision,
+            emin=gmpy2.get_emin_min(),
+            emax=gmpy2.get_emax_max())
+    return exact_contexts[precision]
+
+
 def mpf_to_mpfr(f):
     assert isinstance(f, MPF)
 
@@ -62,29 +84,29 @@ def mpf_to_mpfr(f):
             return gmpy2.zero(1)
         else:
             return gmpy2.zero(-1)
+
+    # We build the value directly from the bit pattern: it is
+    # significand * 2 ** exponent, where the significand has at most
+    # p bits. This is exact with precision p and an unbounded
+    # exponent range (the significand on its own may well be out of
+    # range for tiny formats).
+    S = f.bv >> (f.k - 1)
+    E = (f.bv >> f.t) & (2 ** f.w - 1)
+    T = f.bv & (2 ** f.t - 1)
+    if E == 0:
+        significand = T
+        exponent = f.emin - f.t
     else:
-        return gmpy2.mpfr(f.to_python_string())
-
-
-def mpfr_to_mpf(f):
-    ctx = gmpy2.get_context()
-    p = ctx.precision
-    # emax = ctx.emax - 1
-    # emax = (2 ** (w - 1)) - 1
-    # emax + 1 = 2 ** (w - 1)
-    # ln2(emax + 1) = w - 1
-    # w = ln(emax + 1) + 1
-    # w = ln(ctx.emax) + 1
-    w = log2(ctx.emax) + 1
-    assert w.is_integer()
-    w = int(w)
-    # w = k - p
-    # k = w + p
-    k = w + p
-
-    eb = k - p
-    sb = p
+        significand = T | (2 ** f.t)
+        exponent = E - f.bias - f.t
+    if S:
+        significand = -significand
 
+    return get_exact_context(f.p).mul_2exp(gmpy2.mpz(significand),
+                                           exponent)
+
+
+def mpfr_to_mpf(f, eb, sb):
     rv = MPF(eb, sb)
     if gmpy2.is_nan(f):
         rv.set_nan()
@@ -94,23 +116,54 @@ def mpfr_to_mpf(f):
         else:
             rv.set_infinite(1)
     elif gmpy2.is_zero(f):
-        if str(f) == "-0.0":
+        if gmpy2.is_signed(f):
             rv.set_zero(1)
-        elif str(f) == "0.0":
-            rv.set_zero(0)
         else:
-            assert False
+            rv.set_zero(0)
     else:
-        a, b = f.as_integer_ratio()
-        rv.from_rational(RM_RNE, Rational(int(a), int(b)))
-        assert mpf_to_mpfr(rv) == f
+        # The inverse of the above: f is mantissa * 2 ** exponent,
+        # which we scale so that the mantissa has exactly p bits for
+        # normals, or so that the exponent is emin for subnormals.
+        # Since f was computed in the context for (eb, sb) this is
+        # always exact.
+        mantissa, exponent = f.as_mantissa_exp()
+        S = 1 if mantissa < 0 else 0
+        mantissa = int(abs(mantissa))
+        exponent = int(exponent)
+
+        unbiased = exponent + mantissa.bit_length() - 1
+        if unbiased >= rv.emin:
+            E = unbiased + rv.bias
+            shift = rv.p - mantissa.bit_length()
+        else:
+            E = 0
+            shift = exponent - (rv.emin - rv.t)
+        if shift >= 0:
+            significand = mantissa << shift
+        else:
+            significand = mantissa >> -shift
+            assert significand << -shift == mantissa
+        assert 0 < E < 2 ** rv.w - 1 or (E == 0 and
+                                          significand < 2 ** rv.t)
+
+        rv.pack(S, E, significand & (2 ** rv.t - 1))
 
     return rv
 
 
+contexts = {}
+# Contexts for each (eb, sb, rm) we've seen so far. We only ever enter
+# these through local_context, which makes a copy, so they are never
+# modified.
+
+
 def mpfr_context(a, rm=None):
     assert isinstance(a, MPF)
 
+    key = (a.w, a.p, rm)
+    if key in contexts:
+        return contexts[key]
+
     # mpfr_precision = a.p
     # mpfr_emax = a.emax + 1
     mpfr_emin = a.emin - a.p + 2
@@ -129,128 +182,212 @@ def mpfr_context(a, rm=None):
     if rm is not None:
         ctx.round = MPF_TO_MPFR_RM[rm]
 
+    contexts[key] = ctx
     return ctx
 
 
 def check_rm(rm):
     if rm is not None:
-        if rm not in MPF_TO_MPFR_RM:
+        if rm not in MPF_TO_MPFR_RM and rm != RM_RNA:
             raise Unsupported("rounding mode %s not supported" % rm)
 
 
+rna_contexts = {}
+# Contexts for computing the intermediate result for RM_RNA, indexed by
+# the precision of the final result
+
+
+def get_rna_context(precision):
+    # We truncate to two more bits than we need, with the full
+    # exponent range, so that the intermediate result tells us on
+    # which side of the half-way point between two floats the real
+    # result is (truncation never moves it across).
+    if precision not in rna_contexts:
+        rna_contexts[precision] = gmpy2.context(
+            precision=precision + 2,
+            emin=gmpy2.get_emin_min(),
+            emax=gmpy2.get_emax_max(),
+            round=gmpy2.RoundToZero)
+    return rna_contexts[precision]
+
+
+def round_ties_away(f, eb, sb):
+    # Rounds an intermediate result computed in get_rna_context(sb)
+    # into (eb, sb) with RM_RNA, including subnormals and overflow.
+    if gmpy2.is_nan(f) or gmpy2.is_infinite(f) or gmpy2.is_zero(f):
+        return mpfr_to_mpf(f, eb, sb)
+
+    rv = MPF(eb, sb)
+    mantissa, exponent = f.as_mantissa_exp()
+    negative = mantissa < 0
+    mantissa = int(abs(mantissa))
+    exponent = int(exponent)
+
+    # The exponent of the last bit we can keep: for normals we keep p
+    # bits, and subnormals all have the same exponent
+    ulp = max(exponent + mantissa.bit_length() - 1 - rv.t,
+              rv.emin - rv.t)
+    if ulp > exponent:
+        shift = ulp - exponent
+        remainder = mantissa & (2 ** shift - 1)
+        mantissa >>= shift
+        if remainder >= 2 ** (shift - 1):
+            mantissa += 1
+        exponent = ulp
+
+    if mantissa == 0:
+        return mpfr_to_mpf(gmpy2.zero(-1 if negative else 1), eb, sb)
+    elif exponent + mantissa.bit_length() - 1 > rv.emax:
+        return mpfr_to_mpf(gmpy2.inf(-1 if negative else 1), eb, sb)
+    else:
+        if negative:
+            mantissa = -mantissa
+        return mpfr_to_mpf(get_exact_context(sb).mul_2exp(
+            gmpy2.mpz(mantissa), exponent), eb, sb)
+
+
+def mpfr_min_max(function, a, b):
+    # The result for +0 and -0 is unspecified, but MPFR would just
+    # pick one. Only PyMPF can tell us about this.
+    if gmpy2.is_zero(a) and gmpy2.is_zero(b) and \
+       gmpy2.is_signed(a) != gmpy2.is_signed(b):
+        raise Unsupported("result for +0 and -0 is unspecified")
+    return function(a, b)
+
+
+if hasattr(gmpy2, "minnum"):
+    gmpy2_min = gmpy2.minnum
+    gmpy2_max = gmpy2.maxnum
+else:
+    # Older versions of gmpy2
+    gmpy2_min = gmpy2.min2
+    gmpy2_max = gmpy2.max2
+
+
+mpfr_op = {
+    "fp.abs"             : lambda a: abs(a),
+    "fp.neg"             : lambda a: -a,
+    "fp.sqrt"            : lambda a: gmpy2.sqrt(a),
+    "fp.roundToIntegral" : lambda a: gmpy2.rint(a),
+    "fp.add"             : lambda a, b: a + b,
+    "fp.sub"             : lambda a, b: a - b,
+    "fp.mul"             : lambda a, b: a * b,
+    "fp.div"             : lambda a, b: a / b,
+    "fp.rem"             : lambda a, b: gmpy2.remainder(a, b),
+    "fp.min"             : lambda a, b: mpfr_min_max(gmpy2_min, a, b),
+    "fp.max"             : lambda a, b: mpfr_min_max(gmpy2_max, a, b),
+    "fp.fma"             : lambda a, b, c: gmpy2.fma(a, b, c),
+}
+# The operation on MPFR values, evaluated in the context for the
+# precision and rounding mode of the arguments
+
+
+def mpfr_batch(fp_op, rm, queries):
+    """Apply fp_op to many argument lists
+
+    All arguments must have the same precision, and rm is the rounding
+    mode for all of them (None for operations that do not round).
+    Returns a list of MPF results (or Unsupported instances for
+    queries MPFR can't answer), or raises Unsupported for the whole
+    batch.
+    """
+    assert fp_op in mpfr_op
+    assert len(queries) >= 1
+    template = queries[0][0]
+    assert isinstance(template, MPF)
+
+    function = mpfr_op[fp_op]
+    finish = mpfr_to_mpf
+    if fp_op == "fp.roundToIntegral" and rm == RM_RNA:
+        # MPFR supports RNA only for this operation, with its own
+        # function.
+        function = gmpy2.rint_round
+        ctx = mpfr_context(template)
+    elif rm == RM_RNA:
+        ctx = get_rna_context(template.p)
+        finish = round_ties_away
+    else:
+        check_rm(rm)
+        ctx = mpfr_context(template, rm)
+
+    results = []
+    with gmpy2.local_context(ctx):
+        for args in queries:
+            try:
+                mpfr_r = function(*(mpf_to_mpfr(arg) for arg in args))
+            except Unsupported as ex:
+                results.append(ex)
+                continue
+            results.append(finish(mpfr_r, template.w, template.p))
+    return results
+
+
+def mpfr_single(fp_op, rm, args):
+    rv = mpfr_batch(fp_op, rm, [args])[0]
+    if isinstance(rv, Unsupported):
+        raise rv
+    return rv
+
+
 def mpfr_abs(a):
-    assert isinstance(a, MPF)
-    with gmpy2.local_context(mpfr_context(a)):
-        mpfr_a = mpf_to_mpfr(a)
-        mpfr_r = abs(mpfr_a)
-        return mpfr_to_mpf(mpfr_r)
+    return mpfr_single("fp.abs", None, (a,))
 
 
 def mpfr_neg(a):
-    assert isinstance(a, MPF)
-    with gmpy2.local_context(mpfr_context(a)):
-        mpfr_a = mpf_to_mpfr(a)
-        mpfr_r = -mpfr_a
-        return mpfr_to_mpf(mpfr_r)
+    return mpfr_single("fp.neg", None, (a,))
 
 
 def mpfr_sqrt(rm, a):
-    assert isinstance(a, MPF)
-    check_rm(rm)
-    with gmpy2.local_context(mpfr_context(a, rm)):
-        mpfr_a = mpf_to_mpfr(a)
-        mpfr_r = gmpy2.sqrt(mpfr_a)
-        return mpfr_to_mpf(mpfr_r)
+    return mpfr_single("fp.sqrt", rm, (a,))
 
 
 def mpfr_roundToIntegral(rm, a):
-    assert isinstance(a, MPF)
-    if rm == RM_RNA:
-        with gmpy2.local_context(mpfr_context(a)):
-            mpfr_a = mpf_to_mpfr(a)
-            mpfr_r = gmpy2.rint_round(mpfr_a)
-            return mpfr_to_mpf(mpfr_r)
-    else:
-        check_rm(rm)
-        with gmpy2.local_context(mpfr_context(a, rm)):
-            mpfr_a = mpf_to_mpfr(a)
-            mpfr_r = gmpy2.rint(mpfr_a)
-            return mpfr_to_mpf(mpfr_r)
+    return mpfr_single("fp.roundToIntegral", rm, (a,))
 
 
 def mpfr_add(rm, a, b):
-    assert isinstance(a, MPF)
-    check_rm(rm)
-    with gmpy2.local_context(mpfr_context(a, rm)):
-        mpfr_a = mpf_to_mpfr(a)
-        mpfr_b = mpf_to_mpfr(b)
-        mpfr_r = mpfr_a + mpfr_b
-        return mpfr_to_mpf(mpfr_r)
+    return mpfr_single("fp.add", rm, (a, b))
 
 
 def mpfr_sub(rm, a, b):
-    assert isinstance(a, MPF)
-    check_rm(rm)
-    with gmpy2.local_context(mpfr_context(a, rm)):
-        mpfr_a = mpf_to_mpfr(a)
-        mpfr_b = mpf_to_mpfr(b)
-        mpfr_r = mpfr_a - mpfr_b
-        return mpfr_to_mpf(mpfr_r)
+    return mpfr_single("fp.sub", rm, (a, b))
 
 
 def mpfr_mul(rm, a, b):
-    assert isinstance(a, MPF)
-    check_rm(rm)
-    with gmpy2.local_context(mpfr_context(a, rm)):
-        mpfr_a = mpf_to_mpfr(a)
-        mpfr_b = mpf_to_mpfr(b)
-        mpfr_r = mpfr_a * mpfr_b
-        return mpfr_to_mpf(mpfr_r)
+    return mpfr_single("fp.mul", rm, (a, b))
 
 
 def mpfr_div(rm, a, b):
-    assert isinstance(a, MPF)
-    check_rm(rm)
-    with gmpy2.local_context(mpfr_context(a, rm)):
-        mpfr_a = mpf_to_mpfr(a)
-        mpfr_b = mpf_to_mpfr(b)
-        mpfr_r = mpfr_a / mpfr_b
-        return mpfr_to_mpf(mpfr_r)
+    return mpfr_single("fp.div", rm, (a, b))
 
 
 def mpfr_rem(a, b):
-    assert isinstance(a, MPF)
-    with gmpy2.local_context(mpfr_context(a)):
-        mpfr_a = mpf_to_mpfr(a)
-        mpfr_b = mpf_to_mpfr(b)
-        mpfr_r = gmpy2.remainder(mpfr_a, mpfr_b)
-        return mpfr_to_mpf(mpfr_r)
+    return mpfr_single("fp.rem", None, (a, b))
 
 
 def mpfr_min(a, b):
-    assert isinstance(a, MPF)
-    with gmpy2.local_context(mpfr_context(a)):
-        mpfr_a = mpf_to_mpfr(a)
-        mpfr_b = mpf_to_mpfr(b)
-        mpfr_r = gmpy2.min2(mpfr_a, mpfr_b)
-        return mpfr_to_mpf(mpfr_r)
+    return mpfr_single("fp.min", None, (a, b))
 
 
 def mpfr_max(a, b):
-    assert isinstance(a, MPF)
-    with gmpy2.local_context(mpfr_context(a)):
-        mpfr_a = mpf_to_mpfr(a)
-        mpfr_b = mpf_to_mpfr(b)
-        mpfr_r = gmpy2.max2(mpfr_a, mpfr_b)
-        return mpfr_to_mpf(mpfr_r)
+    return mpfr_single("fp.max", None, (a, b))
 
 
 def mpfr_fma(rm, a, b, c):
+    return mpfr_single("fp.fma", rm, (a, b, c))
+
+
+def mpfr_to_fp(eb, sb, rm, a):
     assert isinstance(a, MPF)
     check_rm(rm)
-    with gmpy2.local_context(mpfr_context(a, rm)):
+    # We need to read the input in its own precision (so that it is
+    # exact), and then round it into the target.
+    with gmpy2.local_context(mpfr_context(a)):
         mpfr_a = mpf_to_mpfr(a)
-        mpfr_b = mpf_to_mpfr(b)
-        mpfr_c = mpf_to_mpfr(c)
-        mpfr_r = gmpy2.fma(mpfr_a, mpfr_b, mpfr_c)
-        return mpfr_to_mpf(mpfr_r)
+    if rm == RM_RNA:
+        with gmpy2.local_context(get_rna_context(sb)):
+            mpfr_r = +mpfr_a
+            return round_ties_away(mpfr_r, eb, sb)
+    with gmpy2.local_context(mpfr_context(MPF(eb, sb), rm)):
+        mpfr_r = +mpfr_a
+        return mpfr_to_mpf(mpfr_r, eb, sb)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+##############################################################################
+##                                                                          ##
+##                          FP_TEST_GENERATOR                               ##
+##                                                                          ##
+##              Copyright (C) 2020, Florian Schanda                         ##
+##                                                                          ##
+##  This file is part of FP_Test_Generator.                                 ##
+##                                                                          ##
+##  FP_Test_Generator is free software: you can redistribute it and/or      ##
+##  modify it under the terms of the GNU General Public License as          ##
+##  published by the Free Software Foundation, either version 3 of the      ##
+##  License, or (at your option) any later version.                         ##
+##                                                                          ##
+##  FP_Test_Generator is distributed in the hope that it will be useful,    ##
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of          ##
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the           ##
+##  GNU General Public License for more details.                            ##
+##                                                                          ##
+##  You should have received a copy of the GNU General Public License       ##
+##  along with FP_Test_Generator. If not, see                               ##
+##  <http://www.gnu.org/licenses/>.                                         ##
+##                                                                          ##
+##############################################################################
+
+
+"""Vectorised oracle for comparisons and classification
+
+The predicates (fp.leq, fp.isNormal, ...) are cheap enough that
+calling out to MPFR or the host for each test would cost more than
+PyMPF itself. Instead we check a whole group of tests in one go with
+NumPy, on arrays of the raw bit patterns. This is optional: if NumPy
+is not installed everything here is simply Unsupported.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from validation import Unsupported
+
+
+NAME = ("NumPy %s" % numpy.__version__
+        if numpy is not None
+        else "NumPy")
+
+DTYPES = {(5, 11)  : ("uint16", "float16"),
+          (8, 24)  : ("uint32", "float32"),
+          (11, 53) : ("uint64", "float64")}
+# Integer and floating point dtypes for each (eb, sb) that NumPy
+# supports natively
+
+
+def get_arrays(queries):
+    # Turns a list of argument lists (all of the same precision) into
+    # one array of bit patterns per argument position
+    if numpy is None:
+        raise Unsupported("numpy is not installed")
+    assert len(queries) >= 1
+
+    template = queries[0][0]
+    key = (template.w, template.p)
+    if key not in DTYPES:
+        raise Unsupported("only float16, float32 and float64 work")
+    int_type, _ = DTYPES[key]
+
+    arrays = []
+    for i in range(len(queries[0])):
+        assert all(args[i].w == template.w and args[i].p == template.p
+                   for args in queries)
+        arrays.append(numpy.array([args[i].bv for args in queries],
+                                  dtype=int_type))
+    return key, arrays
+
+
+def as_float(key, bits):
+    return bits.view(DTYPES[key][1])
+
+
+def fields(key, bits):
+    # Returns the biased exponent and the fraction of each value
+    eb, sb = key
+    exponent = (bits >> (sb - 1)) & ((1 << eb) - 1)
+    fraction = bits & ((1 << (sb - 1)) - 1)
+    return exponent, fraction, (1 << eb) - 1
+
+
+def results(rv):
+    return [bool(x) for x in rv]
+
+
+def comparison(predicate):
+    def batch(queries):
+        key, (a, b) = get_arrays(queries)
+        return results(predicate(as_float(key, a), as_float(key, b)))
+    return batch
+
+
+def classification(predicate):
+    def batch(queries):
+        key, (a,) = get_arrays(queries)
+        return results(predicate(*fields(key, a)))
+    return batch
+
+
+# Each of these takes a list of argument lists, and returns a list of
+# results (bool). They raise Unsupported for the whole batch if the
+# precision is not supported.
+
+numpy_leq = comparison(lambda a, b: a <= b)
+numpy_lt = comparison(lambda a, b: a < b)
+numpy_geq = comparison(lambda a, b: a >= b)
+numpy_gt = comparison(lambda a, b: a > b)
+numpy_eq = comparison(lambda a, b: a == b)
+
+
+def numpy_smtlib_eq(queries):
+    # Identical bit patterns, except that all NaNs are the same
+    key, (a, b) = get_arrays(queries)
+    return results((a == b) |
+                   (numpy.isnan(as_float(key, a)) &
+                    numpy.isnan(as_float(key, b))))
+
+
+numpy_isNormal = classification(
+    lambda e, f, e_max: (e != 0) & (e != e_max))
+numpy_isSubnormal = classification(
+    lambda e, f, e_max: (e == 0) & (f != 0))
+numpy_isZero = classification(
+    lambda e, f, e_max: (e == 0) & (f == 0))
+numpy_isInfinite = classification(
+    lambda e, f, e_max: (e == e_max) & (f == 0))
+numpy_isNaN = classification(
+    lambda e, f, e_max: (e == e_max) & (f != 0))